@@ -0,0 +1,130 @@
+"""
+Admission control in front of the solver
+Each problem type has its own concurrency limit and all of them share the
+pool's capacity, part of it kept for cheap types, so a flood of one expensive
+type cannot occupy every worker; requests beyond the limits wait in a bounded
+queue and are turned away immediately (with a Retry-After hint) once it is full
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Overloaded(Exception):
+    """The request was not admitted; status is 429 (queue full) or 503 (waited too long)"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def payload(self):
+        return {'error': str(self), 'overloaded': True, 'retry_after': self.retry_after}
+
+
+class _Lane:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_seconds = 1.0
+
+
+class AdmissionController:
+    """
+    capacity caps the requests admitted across all types (the pool size, so an
+    admitted request always has a worker); reserved of those slots are kept for
+    the cheap types, so a backlog of expensive ones never takes every worker
+    """
+
+    def __init__(self, limit_for, max_queue, queue_timeout, capacity, reserved=0, cheap=()):
+        self.limit_for = limit_for
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.capacity = capacity
+        self.reserved = max(0, min(reserved, capacity - 1))
+        self.cheap = frozenset(cheap)
+        self._lanes = {}
+        self._waiting = 0
+        self._in_flight = 0
+        self._expensive_in_flight = 0
+        self._changed = threading.Condition()
+
+    def _lane(self, problem_type):
+        lane = self._lanes.get(problem_type)
+        if lane is None:
+            lane = self._lanes.setdefault(problem_type, _Lane(self.limit_for(problem_type)))
+        return lane
+
+    def _retry_after(self, lane):
+        # Time for the work already queued on this lane to drain
+        return max(1, math.ceil(lane.avg_seconds * (lane.waiting + lane.in_flight) / lane.limit))
+
+    def _has_room(self, problem_type, lane):
+        if lane.in_flight >= lane.limit or self._in_flight >= self.capacity:
+            return False
+        return problem_type in self.cheap or self._expensive_in_flight < self.capacity - self.reserved
+
+    @contextmanager
+    def admit(self, problem_type):
+        """Hold one of problem_type's slots for the duration of the block"""
+        expensive = problem_type not in self.cheap
+        with self._changed:
+            lane = self._lane(problem_type)
+            if not self._has_room(problem_type, lane):
+                if self._waiting >= self.max_queue:
+                    lane.rejected += 1
+                    raise Overloaded('Server is busy, queue is full', 429, self._retry_after(lane))
+                self._waiting += 1
+                lane.waiting += 1
+                admitted = self._changed.wait_for(lambda: self._has_room(problem_type, lane), self.queue_timeout)
+                self._waiting -= 1
+                lane.waiting -= 1
+                if not admitted:
+                    lane.rejected += 1
+                    raise Overloaded(f'Server is busy, no {problem_type} slot freed up in time', 503,
+                                     self._retry_after(lane))
+            lane.in_flight += 1
+            lane.admitted += 1
+            self._in_flight += 1
+            self._expensive_in_flight += expensive
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._changed:
+                lane.in_flight -= 1
+                self._in_flight -= 1
+                self._expensive_in_flight -= expensive
+                lane.avg_seconds = 0.8 * lane.avg_seconds + 0.2 * elapsed
+                self._changed.notify_all()
+
+    def queue_depth(self):
+        return self._waiting
+
+    def stats(self):
+        with self._changed:
+            return {
+                'queue_depth': self._waiting,
+                'max_queue': self.max_queue,
+                'capacity': self.capacity,
+                'reserved': self.reserved,
+                'in_flight': self._in_flight,
+                'types': {
+                    name: {
+                        'limit': lane.limit,
+                        'in_flight': lane.in_flight,
+                        'waiting': lane.waiting,
+                        'admitted': lane.admitted,
+                        'rejected': lane.rejected,
+                        'avg_seconds': round(lane.avg_seconds, 4),
+                    }
+                    for name, lane in self._lanes.items()
+                },
+            }
@@ -4,20 +4,140 @@ A web-based mathematical problem solver using Python Flask
 Supports: Algebra, Calculus, Trigonometry, Statistics, and more
 """
 
-from flask import Flask, render_template_string, request, jsonify
-import sympy as sp
-from sympy import *
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
-import base64
-import re
+import time
+
+_import_started = time.perf_counter()
+
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Flask, Response, abort, render_template_string, request, jsonify, send_file, stream_with_context
+
+import config
+import datasets
+import evaluation
+import graphs
+import memory
+import metrics
+import parsing
+import profiling
+import steps
+import warmup
+from admission import AdmissionController, Overloaded
+from budget import BudgetExceeded
+from cache import ResultCache
+from complexity import TooComplex
+from singleflight import SingleFlight
+from solver import (PROBLEM_TYPES, parse_problem, cache_key, cacheable, request_options, solve_with_stages,
+                    statistics_file, stream_solution)
+from worker_pool import WorkerPool, WorkerError
 
 app = Flask(__name__)
 
+
+def prune_graphs():
+    """With L2 expiry, off the request thread: plots older than any cached result that could link to them"""
+    threading.Thread(target=graphs.prune, daemon=True,
+                     args=(max(config.CACHE_L1_TTL, config.CACHE_L2_TTL), config.GRAPH_STORE_MAX_MB * 2**20)).start()
+
+
+result_cache = ResultCache(config.CACHE_L1_SIZE, config.CACHE_L1_TTL,
+                           config.CACHE_L2_PATH, config.CACHE_L2_MAX_ROWS, config.CACHE_L2_TTL, prune_graphs)
+
+flights = SingleFlight(config.COALESCE_LOCK_DIR if result_cache.l2 is not None else None,
+                       config.COALESCE_WAIT, config.COALESCE_OUTCOME_TTL)
+
+admission = AdmissionController(config.concurrency_for, config.QUEUE_SIZE, config.QUEUE_TIMEOUT,
+                                config.TOTAL_CONCURRENCY, config.RESERVED_SLOTS, config.CHEAP_TYPES)
+
+_pool = None
+_pool_lock = threading.Lock()
+_ready = threading.Event()
+
+STARTUP = {'import_seconds': round(time.perf_counter() - _import_started, 4)}
+
+
+def start_workers():
+    """
+    Start and warm the worker pool (or warm this process when there is no pool),
+    then mark the app ready. Must run after any fork, never at import.
+    """
+    global _pool
+    with _pool_lock:
+        if _ready.is_set():
+            return _pool
+        started = time.perf_counter()
+        if config.WORKERS > 0:
+            _pool = WorkerPool(config.WORKERS, config.WORKER_START_METHOD,
+                               initializer=warmup.run, ready_timeout=config.WORKER_READY_TIMEOUT,
+                               maintenance=memory.maintenance,
+                               max_tasks=config.WORKER_MAX_TASKS,
+                               max_tasks_jitter=config.WORKER_MAX_TASKS_JITTER,
+                               recycle_rss=config.WORKER_RECYCLE_RSS_MB * 1024 * 1024,
+                               wait_timeout=config.QUEUE_TIMEOUT)
+            atexit.register(_pool.close)
+            STARTUP['workers'] = _pool.startup
+        else:
+            STARTUP['warmup'] = warmup.run()
+        STARTUP['workers_seconds'] = round(time.perf_counter() - started, 4)
+        _ready.set()
+        app.logger.info('Solver ready: %s', json.dumps(STARTUP))
+    return _pool
+
+
+def get_pool():
+    """The worker pool, started on first use unless start_workers() already ran"""
+    if not _ready.is_set():
+        start_workers()
+    return _pool
+
+
+def run_task(problem_type, func, *args):
+    """Run func(*args) in a worker process when the pool is enabled, else on this thread"""
+    pool = get_pool()
+    if pool is None:
+        try:
+            return func(*args)
+        finally:
+            memory.maintenance()
+    return pool.run(func, args,
+                    timeout=config.timeout_for(problem_type),
+                    rss_limit=config.rss_limit_for(problem_type))
+
+
+def run_solver(problem_type, parsed, expression, options=None, profile=None):
+    """profile is None or what triggered profiling ('requested' profiles are returned, 'sampled' only stored)"""
+    if profile is None:
+        result_data, stages = run_task(problem_type, solve_with_stages, problem_type, parsed, expression, options)
+    else:
+        (result_data, stages), profile_data = run_task(problem_type, profiling.profiled, problem_type,
+                                                       solve_with_stages, problem_type, parsed, expression, options)
+        meta = profiling.store(profile_data, problem_type, expression, profile, stages)
+        if profile == 'requested':
+            result_data = dict(result_data, profile=meta)
+    for name, seconds in stages.items():
+        metrics.STAGE_SECONDS.observe(seconds, problem_type=problem_type, stage=name)
+    return result_data
+
+
+def stream_task(problem_type, func, *args):
+    """run_task for a generator function: its items are yielded as the worker produces them"""
+    pool = get_pool()
+    if pool is None:
+        try:
+            yield from func(*args)
+        finally:
+            memory.maintenance()
+        return
+    yield from pool.stream(func, args,
+                           timeout=config.timeout_for(problem_type),
+                           rss_limit=config.rss_limit_for(problem_type))
+
 # HTML Template
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -360,12 +480,15 @@ HTML_TEMPLATE = """
                     <select id="problem-type" onchange="updateExamples()">
                         <option value="simplify">Simplify Expression</option>
                         <option value="solve">Solve Equation</option>
+                        <option value="system">Solve System</option>
+                        <option value="matrix">Matrix Operations</option>
                         <option value="derivative">Find Derivative</option>
                         <option value="integrate">Find Integral</option>
                         <option value="factor">Factor Expression</option>
                         <option value="expand">Expand Expression</option>
                         <option value="limit">Find Limit</option>
                         <option value="plot">Plot Graph</option>
+                        <option value="statistics">Describe Data</option>
                     </select>
                 </div>
 
@@ -421,12 +544,15 @@ HTML_TEMPLATE = """
         const examples = {
             'simplify': ['(x**2 + 2*x + 1)/(x + 1)', 'sqrt(50) + sqrt(18)', '(x**2 - 4)/(x - 2)'],
             'solve': ['x**2 + 5*x + 6 = 0', '2*x + 3 = 7', 'x**2 - 4 = 0'],
+            'system': ['x + y = 3; x - y = 1', '2*x + y - z = 1; x - y + 2*z = 5; x + y + z = 6', 'x**2 + y**2 = 25; x - y = 1'],
+            'matrix': ['det([[1, 2], [3, 4]])', 'inverse [[2, 1], [1, 1]]', 'eigenvalues [[2, 1], [1, 2]]', 'rref [1 2 3; 4 5 6]'],
             'derivative': ['x**3 + 2*x**2 + x', 'sin(x)*cos(x)', 'exp(x**2)'],
-            'integrate': ['x**2', 'sin(x)', '1/(x**2 + 1)'],
+            'integrate': ['x**2', 'sin(x)', 'exp(-x**2), -oo, oo'],
             'factor': ['x**2 + 5*x + 6', 'x**3 - 8', 'x**2 - 9'],
             'expand': ['(x + 2)**3', '(x + 1)*(x - 1)', '(x + y)**2'],
             'limit': ['sin(x)/x, x, 0', '(x**2 - 1)/(x - 1), x, 1', '1/x, x, oo'],
-            'plot': ['x**2', 'sin(x)', 'exp(-x**2)']
+            'plot': ['x**2', 'sin(x); cos(x), -5, 5', '(cos(3*t), sin(2*t)), 0, 2*pi', 'x**2 + y**2 = 16', 'sin(x)*cos(y), -3, 3'],
+            'statistics': ['2, 4, 4, 4, 5, 5, 7, 9', '1.5 2.3 3.1 4.8 5.0 6.2', 'x,y\\n1,2.1\\n2,3.9\\n3,6.2\\n4,7.8']
         };
 
         function updateExamples() {
@@ -456,7 +582,7 @@ HTML_TEMPLATE = """
             if (tab === 'calculus') select.value = 'derivative';
             if (tab === 'equations') select.value = 'solve';
             if (tab === 'trigonometry') select.value = 'simplify';
-            if (tab === 'statistics') select.value = 'simplify';
+            if (tab === 'statistics') select.value = 'statistics';
             
             updateExamples();
         }
@@ -475,7 +601,8 @@ HTML_TEMPLATE = """
             document.getElementById('result-section').classList.remove('show');
 
             try {
-                const response = await fetch('/solve', {
+                // Steps are shown as the server derives them, the result once it is ready
+                const response = await fetch('/solve/stream', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -486,13 +613,31 @@ HTML_TEMPLATE = """
                     })
                 });
 
-                const data = await response.json();
-                
-                // Hide loader
-                document.getElementById('loader').classList.remove('show');
-                
-                // Show result
-                displayResult(data);
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                const steps = [];
+                let buffer = '';
+                while (true) {
+                    const {done, value} = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, {stream: true});
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) >= 0) {
+                        const message = buffer.slice(0, end);
+                        buffer = buffer.slice(end + 2);
+                        const event = message.match(/^event: (.*)$/m)[1];
+                        const data = JSON.parse(message.match(/^data: (.*)$/m)[1]);
+                        if (event === 'step') {
+                            steps.push(data.step);
+                            displaySteps(steps);
+                        } else {
+                            // Hide loader
+                            document.getElementById('loader').classList.remove('show');
+                            if (event === 'result' && steps.length > 0) data.steps = steps;
+                            displayResult(data);
+                        }
+                    }
+                }
             } catch (error) {
                 document.getElementById('loader').classList.remove('show');
                 displayError('An error occurred. Please check your input and try again.');
@@ -514,6 +659,18 @@ HTML_TEMPLATE = """
                 if (data.result) {
                     html += `<div class="result-item"><strong>Result:</strong><div class="math-expression">${data.result}</div></div>`;
                 }
+
+                if (data.subexpressions) {
+                    html += '<div class="result-item"><strong>Where:</strong>';
+                    data.subexpressions.forEach(sub => {
+                        html += `<div class="math-expression">${sub.name} = ${sub.value}</div>`;
+                    });
+                    html += '</div>';
+                }
+
+                if (data.truncated) {
+                    html += `<div class="result-item"><em>Shortened to fit the page: ${Object.keys(data.truncated).join(', ')}</em></div>`;
+                }
                 
                 if (data.steps && data.steps.length > 0) {
                     html += '<div class="result-item"><strong>Steps:</strong><ol style="margin-left: 20px; margin-top: 10px;">';
@@ -523,8 +680,11 @@ HTML_TEMPLATE = """
                     html += '</ol></div>';
                 }
                 
-                if (data.graph) {
-                    html += `<div class="graph-container"><img src="data:image/png;base64,${data.graph}" alt="Graph"></div>`;
+                if (data.graph_url) {
+                    html += `<div class="graph-container"><img src="${data.graph_url}" alt="Graph"></div>`;
+                }
+                if (data.graph_error) {
+                    html += `<div class="result-item"><em>The graph could not be drawn: ${data.graph_error}</em></div>`;
                 }
                 
                 html += '</div>';
@@ -534,6 +694,16 @@ HTML_TEMPLATE = """
             document.getElementById('result-section').classList.add('show');
         }
 
+        function displaySteps(steps) {
+            let html = '<div class="result-content"><div class="result-item"><strong>Steps so far:</strong><ol style="margin-left: 20px; margin-top: 10px;">';
+            steps.forEach(step => {
+                html += `<li style="margin: 8px 0;">${step}</li>`;
+            });
+            html += '</ol></div></div>';
+            document.getElementById('result-content').innerHTML = html;
+            document.getElementById('result-section').classList.add('show');
+        }
+
         function displayError(message) {
             const resultContent = document.getElementById('result-content');
             resultContent.innerHTML = `<div class="error-message">${message}</div>`;
@@ -547,164 +717,442 @@ HTML_TEMPLATE = """
 </html>
 """
 
-def create_graph(expr_str, var='x'):
-    """Create a graph for the given expression"""
-    try:
-        x = sp.Symbol('x')
-        expr = parse_expr(expr_str, transformations='all')
-        
-        # Convert to numerical function
-        f = sp.lambdify(x, expr, 'numpy')
-        
-        # Generate x values
-        x_vals = np.linspace(-10, 10, 1000)
-        y_vals = f(x_vals)
-        
-        # Create plot
-        plt.figure(figsize=(10, 6))
-        plt.plot(x_vals, y_vals, 'b-', linewidth=2)
-        plt.grid(True, alpha=0.3)
-        plt.axhline(y=0, color='k', linewidth=0.5)
-        plt.axvline(x=0, color='k', linewidth=0.5)
-        plt.xlabel('x', fontsize=12)
-        plt.ylabel('f(x)', fontsize=12)
-        plt.title(f'Graph of f(x) = {expr_str}', fontsize=14, fontweight='bold')
-        
-        # Save to base64
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
-        
-        return img_base64
-    except Exception as e:
-        return None
-
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
+def handle_solve(problem_type, expression, options=None, profile=False):
+    """Solve one problem through the cache and worker pool, returning (body, status)"""
+    if problem_type not in PROBLEM_TYPES:
+        return {'original': expression, 'result': '', 'steps': [], 'graph': None}, 200
+
+    started = time.perf_counter()
+    metrics.IN_FLIGHT.inc(problem_type=problem_type)
+    try:
+        # Parse first so equivalent inputs share one cache entry
+        parsed = parse_problem(problem_type, expression)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, problem_type=problem_type, stage='parse')
+        if profile:
+            # A requested profile bypasses the cache so there is always a solve to profile
+            with admission.admit(problem_type):
+                result_data = run_solver(problem_type, parsed, expression, options, profile='requested')
+            return dict(result_data, original=expression), 200
+
+        key = cache_key(problem_type, parsed, options)
+        result_data = result_cache.get(key)
+        if result_data is None:
+            def compute():
+                # Only real work is admission-controlled; cache hits are always served
+                with admission.admit(problem_type):
+                    computed = run_solver(problem_type, parsed, expression, options,
+                                          profile='sampled' if profiling.sampled() else None)
+                if computed.get('downgraded'):
+                    metrics.DOWNGRADES.inc(problem_type=problem_type)
+                if cacheable(computed):
+                    result_cache.set(key, computed)
+                return computed
+
+            if config.COALESCE:
+                # Identical concurrent requests share one computation
+                result_data = flights.do(key, compute, lambda: result_cache.get(key))
+            else:
+                result_data = compute()
+        result_data = dict(result_data, original=expression)
+
+        return result_data, 200
+
+    except Exception as e:
+        return solve_error(problem_type, e)
+
+    finally:
+        metrics.IN_FLIGHT.dec(problem_type=problem_type)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, problem_type=problem_type)
+
+def solve_error(problem_type, e):
+    """(body, status) for an exception raised while solving, counted by kind"""
+    if isinstance(e, Overloaded):
+        metrics.ERRORS.inc(problem_type=problem_type, kind='overloaded')
+        return dict(e.payload(), problem_type=problem_type), e.status
+
+    if isinstance(e, TooComplex):
+        metrics.ERRORS.inc(problem_type=problem_type, kind='too_complex')
+        return dict(e.payload(), problem_type=problem_type), e.status
+
+    if isinstance(e, WorkerError):
+        metrics.ERRORS.inc(problem_type=problem_type, kind=e.kind)
+        status = 504 if e.kind == 'timed_out' else 503
+        return dict(e.payload(), problem_type=problem_type), status
+
+    if isinstance(e, BudgetExceeded):
+        metrics.ERRORS.inc(problem_type=problem_type, kind='timed_out')
+        return {'error': f'Ran out of time: {e}', 'timed_out': True, 'problem_type': problem_type}, 504
+
+    metrics.ERRORS.inc(problem_type=problem_type, kind='error')
+    return {'error': f'Error solving problem: {str(e)}'}, 200
+
 @app.route('/solve', methods=['POST'])
 def solve():
     try:
         data = request.json
         problem_type = data.get('problem_type')
         expression = data.get('expression')
-        
-        x, y, z = sp.symbols('x y z')
-        result_data = {
-            'original': expression,
-            'result': '',
-            'steps': [],
-            'graph': None
-        }
-        
-        # Parse the expression
-        transformations = standard_transformations + (implicit_multiplication_application,)
-        
-        if problem_type == 'simplify':
-            expr = parse_expr(expression, transformations=transformations)
-            simplified = sp.simplify(expr)
-            result_data['result'] = str(simplified)
-            result_data['steps'] = [
-                f'Original expression: {expr}',
-                f'Apply simplification rules',
-                f'Simplified form: {simplified}'
-            ]
-            
-        elif problem_type == 'solve':
-            # Handle equation
-            if '=' in expression:
-                lhs, rhs = expression.split('=')
-                lhs_expr = parse_expr(lhs.strip(), transformations=transformations)
-                rhs_expr = parse_expr(rhs.strip(), transformations=transformations)
-                equation = sp.Eq(lhs_expr, rhs_expr)
-            else:
-                expr = parse_expr(expression, transformations=transformations)
-                equation = sp.Eq(expr, 0)
-            
-            solutions = sp.solve(equation, x)
-            result_data['result'] = f'x = {solutions}'
-            result_data['steps'] = [
-                f'Equation: {equation}',
-                f'Apply solving techniques',
-                f'Solutions: x = {solutions}'
-            ]
-            
-        elif problem_type == 'derivative':
-            expr = parse_expr(expression, transformations=transformations)
-            derivative = sp.diff(expr, x)
-            result_data['result'] = str(derivative)
-            result_data['steps'] = [
-                f'Function: f(x) = {expr}',
-                f'Apply differentiation rules',
-                f"Derivative: f'(x) = {derivative}"
-            ]
-            
-        elif problem_type == 'integrate':
-            expr = parse_expr(expression, transformations=transformations)
-            integral = sp.integrate(expr, x)
-            result_data['result'] = str(integral) + ' + C'
-            result_data['steps'] = [
-                f'Function: f(x) = {expr}',
-                f'Apply integration rules',
-                f'Integral: ∫f(x)dx = {integral} + C'
-            ]
-            
-        elif problem_type == 'factor':
-            expr = parse_expr(expression, transformations=transformations)
-            factored = sp.factor(expr)
-            result_data['result'] = str(factored)
-            result_data['steps'] = [
-                f'Expression: {expr}',
-                f'Find common factors',
-                f'Factored form: {factored}'
-            ]
-            
-        elif problem_type == 'expand':
-            expr = parse_expr(expression, transformations=transformations)
-            expanded = sp.expand(expr)
-            result_data['result'] = str(expanded)
-            result_data['steps'] = [
-                f'Expression: {expr}',
-                f'Apply expansion rules',
-                f'Expanded form: {expanded}'
-            ]
-            
-        elif problem_type == 'limit':
-            parts = expression.split(',')
-            expr = parse_expr(parts[0].strip(), transformations=transformations)
-            var = sp.Symbol(parts[1].strip())
-            point = parts[2].strip()
-            
-            if point == 'oo':
-                point = sp.oo
-            else:
-                point = parse_expr(point)
-            
-            limit_result = sp.limit(expr, var, point)
-            result_data['result'] = str(limit_result)
-            result_data['steps'] = [
-                f'Function: {expr}',
-                f'Variable: {var} → {point}',
-                f'Limit: {limit_result}'
-            ]
-            
-        elif problem_type == 'plot':
-            expr = parse_expr(expression, transformations=transformations)
-            result_data['result'] = f'Graph of f(x) = {expr}'
-            result_data['graph'] = create_graph(expression)
-            result_data['steps'] = [
-                f'Function: f(x) = {expr}',
-                'Plot the function over range [-10, 10]',
-                'Graph displayed below'
-            ]
-        
-        return jsonify(result_data)
-        
+        options = request_options(data)
+        profile = profiling.requested(data.get('profile')) or profiling.requested(request.args.get('profile'))
     except Exception as e:
         return jsonify({'error': f'Error solving problem: {str(e)}'})
 
+    if profile and not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Profiling needs a valid X-Profile-Token header'}), 403
+    result_data, status = handle_solve(problem_type, expression, options, profile)
+    response = jsonify(result_data)
+    if 'retry_after' in result_data:
+        response.headers['Retry-After'] = str(result_data['retry_after'])
+    return response, status
+
+def stream_solve(problem_type, expression, options=None):
+    """(event, data) pairs for /solve/stream: each step as soon as it is derived, then the result or an error"""
+    if problem_type not in PROBLEM_TYPES:
+        yield 'result', {'original': expression, 'result': '', 'steps': [], 'graph': None}
+        return
+
+    started = time.perf_counter()
+    sent = 0
+
+    def step(text):
+        nonlocal sent
+        seconds = time.perf_counter() - started
+        if not sent:
+            metrics.FIRST_STEP_SECONDS.observe(seconds, problem_type=problem_type)
+        sent += 1
+        return 'step', {'index': sent - 1, 'step': text, 'seconds': round(seconds, 6)}
+
+    metrics.IN_FLIGHT.inc(problem_type=problem_type)
+    try:
+        parsed = parse_problem(problem_type, expression)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, problem_type=problem_type, stage='parse')
+        key = cache_key(problem_type, parsed, options)
+        result_data = result_cache.get(key)
+        # A cached result still needs its steps derived when the type has a step generator
+        if result_data is None or problem_type in steps.GENERATORS:
+            with admission.admit(problem_type):
+                for kind, value in stream_task(problem_type, stream_solution, problem_type, parsed,
+                                               expression, options, result_data is None):
+                    if kind == 'step':
+                        yield step(value)
+                        continue
+                    result_data, stages = value
+                    for name, seconds in stages.items():
+                        metrics.STAGE_SECONDS.observe(seconds, problem_type=problem_type, stage=name)
+                    if result_data.get('downgraded'):
+                        metrics.DOWNGRADES.inc(problem_type=problem_type)
+                    if cacheable(result_data):
+                        result_cache.set(key, result_data)
+        if not sent:
+            # No step generator: the steps come with the result
+            for text in result_data.get('steps', []):
+                yield step(text)
+        yield 'result', dict(result_data, original=expression)
+
+    except Exception as e:
+        body, status = solve_error(problem_type, e)
+        yield 'error', dict(body, status=status)
+
+    finally:
+        metrics.IN_FLIGHT.dec(problem_type=problem_type)
+
+@app.route('/solve/stream', methods=['GET', 'POST'])
+def solve_stream():
+    """Server-Sent Events: a "step" event per step as it is derived, then "result" (or "error")"""
+    # GET (query string) is what EventSource sends; POST takes the same JSON body as /solve
+    data = request.args if request.method == 'GET' else request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object with problem_type and expression'}), 400
+    problem_type = data.get('problem_type')
+    expression = data.get('expression')
+    options = request_options(data)
+
+    def generate():
+        for event, payload in stream_solve(problem_type, expression, options):
+            yield f'event: {event}\ndata: {json.dumps(payload)}\n\n'
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the events
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def read_batch_items():
+    """Batch input: a JSON list, {"items": [...]}, or an uploaded JSONL file"""
+    upload = request.files.get('file')
+    if upload is not None:
+        items = []
+        for line in upload.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                items.append({'error': f'Invalid JSON line: {e}'})
+        return items
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of {problem_type, expression} items or a JSONL file')
+    return data
+
+def solve_item(item, may_profile=False):
+    if not isinstance(item, dict):
+        return {'error': 'Each item must be an object with problem_type and expression'}, 400
+    if 'error' in item:
+        return {'error': item['error']}, 400
+    profile = profiling.requested(item.get('profile'))
+    if profile and not may_profile:
+        return {'error': 'Profiling needs a valid X-Profile-Token header'}, 403
+    return handle_solve(item.get('problem_type'), item.get('expression'), request_options(item), profile)
+
+@app.route('/solve/batch', methods=['POST'])
+def solve_batch():
+    try:
+        items = read_batch_items()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(items) > config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Batch is limited to {config.BATCH_MAX_ITEMS} items'}), 413
+    # Read before streaming starts; the items are solved outside the request context
+    may_profile = profiling.authorized(request.headers.get('X-Profile-Token'))
+
+    def generate():
+        # Each thread blocks on a pool worker, so results arrive in completion order
+        executor = ThreadPoolExecutor(max_workers=config.BATCH_CONCURRENCY)
+        try:
+            futures = {executor.submit(solve_item, item, may_profile): index for index, item in enumerate(items)}
+            for future in as_completed(futures):
+                result_data, status = future.result()
+                yield json.dumps(dict(result_data, index=futures[future], status=status)) + '\n'
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def read_evaluate_request():
+    """Expression, {name: array} and output format from a JSON body or a .npy/.npz upload"""
+    if request.mimetype in evaluation.NPY_MIMETYPES:
+        expression = request.args.get('expression')
+        arrays = evaluation.load_arrays(request.get_data(), request.args.get('variable'))
+        output = request.args.get('format')
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError('Expected JSON {"expression": ..., "variables": {...}} or a .npy body')
+        expression = data.get('expression')
+        arrays = data.get('variables') or {}
+        if not isinstance(arrays, dict):
+            raise ValueError('variables must map each variable name to an array')
+        output = data.get('format') or request.args.get('format')
+    if not expression:
+        raise ValueError('Missing expression')
+    if output is None and request.accept_mimetypes.best == 'application/x-npy':
+        output = 'npy'
+    return expression, arrays, output or 'json'
+
+@app.route('/evaluate', methods=['POST'])
+def evaluate_points():
+    started = time.perf_counter()
+    metrics.IN_FLIGHT.inc(problem_type='evaluate')
+    try:
+        expression, arrays, output = read_evaluate_request()
+        expr = parsing.parse(expression)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, problem_type='evaluate', stage='parse')
+        with admission.admit('evaluate'), metrics.collect_stages() as stages:
+            values = evaluation.evaluate(expr, arrays)
+        for name, seconds in stages.items():
+            metrics.STAGE_SECONDS.observe(seconds, problem_type='evaluate', stage=name)
+    except Overloaded as e:
+        metrics.ERRORS.inc(problem_type='evaluate', kind='overloaded')
+        return jsonify(e.payload()), e.status, {'Retry-After': str(e.retry_after)}
+    except TooComplex as e:
+        metrics.ERRORS.inc(problem_type='evaluate', kind='too_complex')
+        return jsonify(e.payload()), e.status
+    except Exception as e:
+        metrics.ERRORS.inc(problem_type='evaluate', kind='error')
+        return jsonify({'error': f'Error evaluating expression: {str(e)}'}), 400
+    finally:
+        metrics.IN_FLIGHT.dec(problem_type='evaluate')
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, problem_type='evaluate')
+
+    if output == 'npy':
+        return Response(evaluation.to_npy(values), mimetype='application/x-npy')
+    return jsonify({'expression': str(expr), 'shape': list(values.shape), 'result': evaluation.to_json(values)})
+
+@app.route('/statistics', methods=['POST'])
+def statistics_upload():
+    """
+    Statistics over an uploaded CSV (multipart "file" field or a text/csv body),
+    spooled to disk and read as a stream by a worker under the statistics
+    timeout and memory cap; bins, quantiles, columns and plot come from the query or form
+    """
+    started = time.perf_counter()
+    metrics.IN_FLIGHT.inc(problem_type='statistics')
+    path = None
+    try:
+        fields = request.values
+        bins, quantiles, plot = datasets.options(fields)
+        columns = fields.get('columns')
+        columns = columns.split(',') if columns else None
+        upload = request.files.get('file')
+        stream = upload.stream if upload is not None else request.stream
+        # Spooled before admission, so a slow upload never holds a solver slot
+        with tempfile.NamedTemporaryFile(prefix='upload-', suffix='.csv', delete=False) as f:
+            path = f.name
+            shutil.copyfileobj(stream, f, 2**20)
+        with admission.admit('statistics'):
+            result_data, stages = run_task('statistics', statistics_file, path, columns, quantiles, bins, plot)
+        for name, seconds in stages.items():
+            metrics.STAGE_SECONDS.observe(seconds, problem_type='statistics', stage=name)
+    except Overloaded as e:
+        metrics.ERRORS.inc(problem_type='statistics', kind='overloaded')
+        return jsonify(e.payload()), e.status, {'Retry-After': str(e.retry_after)}
+    except WorkerError as e:
+        metrics.ERRORS.inc(problem_type='statistics', kind=e.kind)
+        return jsonify(e.payload()), 504 if e.kind == 'timed_out' else 503
+    except Exception as e:
+        metrics.ERRORS.inc(problem_type='statistics', kind='error')
+        return jsonify({'error': f'Error reading data: {str(e)}'}), 400
+    finally:
+        if path is not None:
+            os.remove(path)
+        metrics.IN_FLIGHT.dec(problem_type='statistics')
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, problem_type='statistics')
+
+    original = upload.filename if upload is not None else 'uploaded data'
+    return jsonify(dict(result_data, original=original, graph=None))
+
+@app.route('/graph/<digest>.<fmt>')
+def graph(digest, fmt):
+    if fmt not in graphs.FORMATS or not graphs.DIGEST_RE.match(digest):
+        abort(404)
+
+    # The URL names the content, so a matching ETag never needs a disk lookup
+    etag = f'{digest}.{fmt}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+    else:
+        path = graphs.graph_path(digest, fmt)
+        if not os.path.exists(path):
+            # Unknown or pruned: nothing a worker could render
+            if not graphs.graph_exists(digest):
+                abort(404)
+            try:
+                with admission.admit('plot'):
+                    path = run_task('plot', graphs.render_stored, digest, fmt)
+            except Overloaded as e:
+                return jsonify(e.payload()), e.status, {'Retry-After': str(e.retry_after)}
+            except WorkerError as e:
+                return jsonify(e.payload()), 504 if e.kind == 'timed_out' else 503
+            if path is None:
+                abort(404)
+        response = send_file(path, mimetype=graphs.FORMATS[fmt], etag=etag,
+                             conditional=True, max_age=config.GRAPH_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.max_age = config.GRAPH_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/ready')
+def ready():
+    if not _ready.is_set():
+        return jsonify({'ready': False, 'startup': STARTUP}), 503
+    return jsonify({'ready': True, 'startup': STARTUP})
+
+def total_queue_depth():
+    """Requests waiting for admission plus admitted ones waiting for an idle worker"""
+    return admission.queue_depth() + (_pool.waiting() if _pool is not None else 0)
+
+@app.route('/queue')
+def queue_depth():
+    """Cheap endpoint for autoscalers"""
+    return jsonify({'queue_depth': total_queue_depth(), 'ready': _ready.is_set()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    lines = metrics.render()
+
+    cache_stats = result_cache.stats()
+    lines += metrics.format_header('math_solver_cache_lookups_total', 'counter', 'Result cache lookups by outcome')
+    for outcome, name in (('l1_hit', 'l1_hits'), ('l2_hit', 'l2_hits'), ('miss', 'misses')):
+        lines.append(metrics.format_sample('math_solver_cache_lookups_total', [('outcome', outcome)], cache_stats[name]))
+    lines += metrics.format_header('math_solver_cache_evictions_total', 'counter', 'Entries evicted per cache tier')
+    lines.append(metrics.format_sample('math_solver_cache_evictions_total', [('tier', 'l1')], cache_stats['l1_evictions']))
+    if cache_stats['l2_enabled']:
+        lines.append(metrics.format_sample('math_solver_cache_evictions_total', [('tier', 'l2')], cache_stats['l2_evictions']))
+
+    flight_stats = flights.stats()
+    lines += metrics.format_header('math_solver_coalesced_total', 'counter', 'Requests served by an identical in-flight solve, by where it ran')
+    lines.append(metrics.format_sample('math_solver_coalesced_total', [('scope', 'thread')], flight_stats['thread_waits']))
+    lines.append(metrics.format_sample('math_solver_coalesced_total', [('scope', 'process')], flight_stats['process_waits']))
+    lines += metrics.format_header('math_solver_coalesce_computed_total', 'counter', 'Cache misses that ran the solver themselves')
+    lines.append(metrics.format_sample('math_solver_coalesce_computed_total', [], flight_stats['computed']))
+    lines += metrics.format_header('math_solver_coalesce_waiters', 'gauge', 'Requests waiting on an identical in-flight solve')
+    lines.append(metrics.format_sample('math_solver_coalesce_waiters', [], flight_stats['waiting']))
+
+    admission_stats = admission.stats()
+    lines += metrics.format_header('math_solver_queue_depth', 'gauge', 'Requests waiting for a solver slot')
+    lines.append(metrics.format_sample('math_solver_queue_depth', [], total_queue_depth()))
+    lines += metrics.format_header('math_solver_rejected_total', 'counter', 'Requests turned away by admission control')
+    for name, lane in admission_stats['types'].items():
+        lines.append(metrics.format_sample('math_solver_rejected_total', [('problem_type', name)], lane['rejected']))
+
+    # Read the pool without starting it, so scraping never spawns workers
+    if _pool is not None:
+        pool_stats = _pool.stats()
+        lines += metrics.format_header('math_solver_worker_rss_bytes', 'gauge', 'Resident memory per solver worker')
+        for pid, rss in pool_stats['rss'].items():
+            if rss is not None:
+                lines.append(metrics.format_sample('math_solver_worker_rss_bytes', [('pid', pid)], rss))
+        lines += metrics.format_header('math_solver_worker_rss_growth_bytes', 'gauge', 'Resident memory gained per solver worker since it became ready')
+        for pid, growth in pool_stats['rss_growth'].items():
+            lines.append(metrics.format_sample('math_solver_worker_rss_growth_bytes', [('pid', pid)], growth))
+        lines += metrics.format_header('math_solver_worker_events_total', 'counter', 'Worker timeouts, memory kills, crashes, replacements and recycles')
+        for event in ('timeouts', 'memory_kills', 'crashes', 'replaced', 'recycled'):
+            lines.append(metrics.format_sample('math_solver_worker_events_total', [('event', event)], pool_stats[event]))
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles')
+def list_profiles():
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        abort(403)
+    return jsonify({'profiles': profiling.recent(request.args.get('limit', 50, type=int))})
+
+@app.route('/profiles/<profile_id>')
+def get_profile(profile_id):
+    """A stored profile as ?format=json (default), collapsed (flamegraph input) or pstats"""
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        abort(403)
+    fmt = request.args.get('format', 'json')
+    path = profiling.path_for(profile_id, fmt)
+    if path is None:
+        abort(404)
+    if fmt == 'pstats':
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=profile_id + '.pstats')
+    return send_file(path, mimetype='text/plain' if fmt == 'collapsed' else 'application/json')
+
+@app.route('/stats')
+def stats():
+    # Reads the pool without starting it, like /metrics
+    pool = _pool
+    return jsonify({
+        'cache': result_cache.stats(),
+        'parse_cache': parsing.stats(),
+        'admission': admission.stats(),
+        'coalescing': flights.stats(),
+        'workers': pool.stats() if pool is not None else None
+    })
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
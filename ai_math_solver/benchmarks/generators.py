@@ -0,0 +1,53 @@
+"""
+Inputs for the corpus cases that sweep a size
+A case naming one of these in "generate" gets its expression from
+GENERATORS[name](size, rng, **args) for each entry of its "sizes", with rng
+seeded from the case key so every run sees the same input. Unknowns are
+written x_0, x_1, ... because the parser reads x0 as x*0.
+"""
+
+
+def sparse_linear(n, rng, per_row=4, band=None):
+    """
+    n equations in x_0..x_{n-1} with solution x = 1..n: a dominant diagonal plus per_row - 1
+    off-diagonal terms, within band of the diagonal or anywhere when band is None
+    """
+    equations = []
+    for i in range(n):
+        if band is None:
+            others = rng.sample(range(n), min(per_row - 1, n - 1))
+        else:
+            others = [min(n - 1, max(0, i + rng.randint(-band, band))) for _ in range(per_row - 1)]
+        columns = sorted({i} | set(others))
+        coeffs = {j: rng.randint(1, 9) * (per_row if j == i else rng.choice((-1, 1))) for j in columns}
+        lhs = ' + '.join(f'{c}*x_{j}' for j, c in coeffs.items()).replace('+ -', '- ')
+        equations.append(f'{lhs} = {sum(c * (j + 1) for j, c in coeffs.items())}')
+    return '; '.join(equations)
+
+
+def quadratic_cycle(n, rng):
+    """x_i**2 + x_{i+1} = c_i around a cycle, with a known integer solution"""
+    point = [rng.randint(-3, 3) for _ in range(n)]
+    return '; '.join(f'x_{i}**2 + x_{(i + 1) % n} = {point[i]**2 + point[(i + 1) % n]}' for i in range(n))
+
+
+def rational_matrix(n, rng, operation='det'):
+    """An n x n matrix of small fractions"""
+    rows = (', '.join(f'{rng.randint(-9, 9)}/{rng.randint(1, 5)}' for _ in range(n)) for _ in range(n))
+    return f"{operation} [{'; '.join(rows)}]"
+
+
+def csv_columns(n, rng, columns=3):
+    """n rows of normally distributed values under a header"""
+    names = [f'c{j}' for j in range(columns)]
+    lines = [','.join(names)]
+    lines += [','.join(f'{rng.gauss(10 * j, j + 1):.4f}' for j in range(columns)) for _ in range(n)]
+    return '\n'.join(lines)
+
+
+GENERATORS = {
+    'sparse_linear': sparse_linear,
+    'quadratic_cycle': quadratic_cycle,
+    'rational_matrix': rational_matrix,
+    'csv_columns': csv_columns,
+}
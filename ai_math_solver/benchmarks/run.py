@@ -0,0 +1,438 @@
+"""
+Benchmark suite for every problem type in solve() and for /evaluate
+Runs the versioned corpus in corpus.json in-process (solver.solve_problem),
+through the Flask test client (/solve, caches disabled) or through
+/solve/stream (also timing the first step), records per-case timings and peak
+Python memory, and optionally compares against a baseline. A case with
+"sizes" runs once per size: its input comes from a generator in
+generators.py ("generate") or the size is passed as an option ("size_option").
+--soak instead sends a long stream of corpus problems through the worker pool
+and tracks the workers' memory.
+
+    python benchmarks/run.py                               # both modes, print a table
+    python benchmarks/run.py --types matrix --max-size 50  # one type, sweeps up to size 50
+    python benchmarks/run.py --mode stream --types derivative integrate
+    python benchmarks/run.py --output results.json         # also write machine-readable results
+    python benchmarks/run.py --baseline benchmarks/baseline.json   # exit 1 on regressions
+    python benchmarks/run.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --soak 5000 --workers 2       # exit 1 if a request is dropped
+    python benchmarks/run.py --soak 5000 --no-governance   # unbounded SymPy cache, no recycling
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from generators import GENERATORS
+
+MODES = ('inprocess', 'client', 'stream')
+
+# Left out of the soak so it measures sustained traffic rather than a few slow solves
+SLOW_TAGS = {'high-degree', 'special', 'tricky'}
+
+
+def configure(args):
+    """Settings must be in the environment before config (and SymPy) is imported"""
+    if args.soak:
+        os.environ['MATH_SOLVER_WORKERS'] = str(2 if args.workers is None else args.workers)
+        os.environ['MATH_SOLVER_CACHE_L1_SIZE'] = '0'
+        os.environ['MATH_SOLVER_CACHE_L2_PATH'] = ''
+        os.environ['MATH_SOLVER_WARMUP'] = '0'
+        if args.no_governance:
+            os.environ['SYMPY_CACHE_SIZE'] = 'None'
+            os.environ['MATH_SOLVER_CLEAR_CACHE_EVERY'] = '0'
+            os.environ['MATH_SOLVER_WORKER_MAX_TASKS'] = '0'
+            os.environ['MATH_SOLVER_WORKER_RECYCLE_RSS_MB'] = '0'
+        elif args.max_tasks is not None:
+            os.environ['MATH_SOLVER_WORKER_MAX_TASKS'] = str(args.max_tasks)
+    else:
+        # The client modes must measure solving, not the result cache or warm-up
+        os.environ.setdefault('MATH_SOLVER_CACHE_L1_SIZE', '0')
+        os.environ.setdefault('MATH_SOLVER_CACHE_L2_PATH', '')
+        os.environ.setdefault('MATH_SOLVER_WARMUP', '0')
+        if args.workers is None:
+            os.environ.setdefault('MATH_SOLVER_WORKERS', '0')
+        else:
+            os.environ['MATH_SOLVER_WORKERS'] = str(args.workers)
+    os.environ.setdefault('MATH_SOLVER_GRAPH_DIR', os.path.join(tempfile.gettempdir(), 'math-solver-bench-graphs'))
+
+
+def _sized(entry, problem_type, size):
+    """The case for one size of a sweep"""
+    case = dict(entry, problem_type=problem_type, size=size, key=f"{problem_type}/{entry['id']}@{size}")
+    if 'generate' in entry:
+        rng = random.Random(case['key'])
+        case['expression'] = GENERATORS[entry['generate']](size, rng, **entry.get('args', {}))
+    else:
+        case['options'] = dict(entry.get('options', {}), **{entry['size_option']: size})
+    return case
+
+
+def load_corpus(path, types=None, tags=None, max_size=None):
+    with open(path) as f:
+        corpus = json.load(f)
+    cases = []
+    for problem_type, entries in corpus['cases'].items():
+        if types and problem_type not in types:
+            continue
+        for entry in entries:
+            if tags and not set(tags) & set(entry.get('tags', [])):
+                continue
+            if 'sizes' not in entry:
+                cases.append(dict(entry, problem_type=problem_type, key=f"{problem_type}/{entry['id']}"))
+                continue
+            cases += [_sized(entry, problem_type, size) for size in entry['sizes']
+                      if max_size is None or size <= max_size]
+    return corpus['version'], cases
+
+
+def reset_caches():
+    """Every timed run starts with cold SymPy and parse caches"""
+    import parsing
+    from sympy.core.cache import clear_cache
+    clear_cache()
+    parsing._parse_normalized.cache_clear()
+
+
+def stream(client, body):
+    """Reads /solve/stream as it is produced; returns (ok, error, {'first_step': seconds})"""
+    started = time.perf_counter()
+    response = client.post('/solve/stream', json=body, buffered=False)
+    ok, error, first = False, None, None
+    for chunk in response.response:
+        event, _, data = (chunk.decode() if isinstance(chunk, bytes) else chunk).partition('\n')
+        if event == 'event: step' and first is None:
+            first = time.perf_counter() - started
+        elif event in ('event: result', 'event: error'):
+            error = json.loads(data[len('data: '):]).get('error')
+            ok = event == 'event: result' and error is None
+    response.close()
+    return ok, error, {} if first is None else {'first_step': first}
+
+
+def evaluate_call(mode, case, client=None):
+    """/evaluate at options['points'] random points of x, sent as JSON or (format npy) as a .npy body"""
+    import numpy as np
+
+    import evaluation
+    import parsing
+
+    expression, options = case['expression'], case['options']
+    x_vals = np.random.default_rng(0).uniform(-5, 5, options['points'])
+    if mode == 'inprocess':
+        def call():
+            evaluation.evaluate(parsing.parse(expression), {'x': x_vals})
+            return True, None, {}
+        return call
+
+    if options.get('format') == 'npy':
+        body = io.BytesIO()
+        np.save(body, x_vals)
+        request = {'query_string': {'expression': expression, 'variable': 'x', 'format': 'npy'},
+                   'data': body.getvalue(), 'content_type': 'application/x-npy'}
+    else:
+        request = {'json': {'expression': expression, 'variables': {'x': x_vals.tolist()}}}
+
+    def call():
+        response = client.post('/evaluate', **request)
+        if response.status_code == 200:
+            return True, None, {}
+        return False, response.get_json().get('error'), {}
+    return call
+
+
+def make_call(mode, case, client=None):
+    """A call() timing one solve, returning (ok, error, {extra timing: seconds})"""
+    import solver
+
+    if case['problem_type'] == 'evaluate':
+        return evaluate_call(mode, case, client)
+    problem_type, expression, options = case['problem_type'], case['expression'], case.get('options', {})
+    body = dict(options, problem_type=problem_type, expression=expression)
+    if mode == 'inprocess':
+        def call():
+            result = solver.solve_problem(problem_type, expression, options)
+            return 'error' not in result, result.get('error'), {}
+    elif mode == 'client':
+        def call():
+            response = client.post('/solve', json=body)
+            body_out = response.get_json()
+            return response.status_code == 200 and 'error' not in body_out, body_out.get('error'), {}
+    else:
+        def call():
+            return stream(client, body)
+    return call
+
+
+def applies(mode, case):
+    # /evaluate has no streaming counterpart
+    return not (mode == 'stream' and case['problem_type'] == 'evaluate')
+
+
+def run_case(mode, case, repeat, client=None, keep_caches=False, memory=True):
+    call = make_call(mode, case, client)
+    times, extras = [], {}
+    ok, error = True, None
+    for _ in range(repeat):
+        if not keep_caches:
+            reset_caches()
+        started = time.perf_counter()
+        try:
+            ok, error, extra = call()
+        except Exception as e:
+            ok, error, extra = False, str(e), {}
+        times.append(time.perf_counter() - started)
+        for name, seconds in extra.items():
+            extras.setdefault(name, []).append(seconds)
+
+    result = {
+        'key': case['key'],
+        'problem_type': case['problem_type'],
+        'mode': mode,
+        'ok': ok,
+        'repeat': repeat,
+        'median_ms': round(1000 * statistics.median(times), 3),
+        'min_ms': round(1000 * min(times), 3),
+        'mean_ms': round(1000 * statistics.fmean(times), 3),
+    }
+    if 'size' in case:
+        result['size'] = case['size']
+    for name, seconds in extras.items():
+        result[f'{name}_ms'] = round(1000 * statistics.median(seconds), 3)
+    if error:
+        result['error'] = error
+
+    # Separate pass: tracemalloc slows execution down too much to time under it
+    if memory:
+        if not keep_caches:
+            reset_caches()
+        tracemalloc.start()
+        try:
+            call()
+        except Exception:
+            pass
+        result['peak_kib'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Flag cases whose median grew by more than threshold (and min_delta_ms) over the baseline"""
+    previous = {(r['mode'], r['key']): r for r in baseline['results']}
+    rows = []
+    for result in results:
+        base = previous.get((result['mode'], result['key']))
+        if base is None:
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        delta = result['median_ms'] - base['median_ms']
+        rows.append({
+            'key': result['key'],
+            'mode': result['mode'],
+            'baseline_ms': base['median_ms'],
+            'median_ms': result['median_ms'],
+            'ratio': round(ratio, 3),
+            'regression': ratio > 1 + threshold and delta > min_delta_ms,
+            'improvement': ratio < 1 - threshold and -delta > min_delta_ms,
+        })
+    return rows
+
+
+def environment():
+    import numpy
+    import sympy
+    return {
+        'python': platform.python_version(),
+        'sympy': sympy.__version__,
+        'numpy': numpy.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'workers': int(os.environ['MATH_SOLVER_WORKERS']),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def print_table(results, comparison):
+    marks = {(r['mode'], r['key']): r for r in comparison}
+    print(f"{'case':<42}{'mode':<11}{'median ms':>11}{'min ms':>10}{'peak KiB':>10}  note")
+    for r in results:
+        row = marks.get((r['mode'], r['key']))
+        note = '' if r['ok'] else 'FAILED'
+        if 'first_step_ms' in r:
+            note += f" first step {r['first_step_ms']:.2f} ms"
+        if row:
+            note += f" x{row['ratio']:.2f} vs baseline"
+            note += ' REGRESSION' if row['regression'] else (' faster' if row['improvement'] else '')
+        peak = r.get('peak_kib', '')
+        print(f"{r['key']:<42}{r['mode']:<11}{r['median_ms']:>11.2f}{r['min_ms']:>10.2f}{peak:>10}  {note.strip()}")
+
+
+def vary(expression, rng):
+    """Swap small integer literals for random ones so SymPy's caches keep seeing new input"""
+    return re.sub(r'(?<![\w.*])([1-9])(?![\w.])', lambda m: str(rng.randint(1, 9)), expression)
+
+
+def sample_workers(pool, done, started):
+    stats = pool.stats()
+    rss = [v for v in stats['rss'].values() if v is not None]
+    growth = list(stats['rss_growth'].values())
+    return {
+        'requests': done,
+        'seconds': round(time.perf_counter() - started, 2),
+        'max_rss_mb': round(max(rss) / 2**20, 1) if rss else None,
+        'total_rss_mb': round(sum(rss) / 2**20, 1),
+        'max_growth_mb': round(max(growth) / 2**20, 1) if growth else None,
+        'recycled': stats['recycled'],
+        'replaced': stats['replaced'],
+    }
+
+
+def soak(args, cases):
+    """
+    Sends args.soak varied corpus problems through /solve (result cache off) and samples
+    every worker's RSS as it goes. Fails if any request is dropped (timeout, crash, 5xx)
+    or, with --max-rss-mb, if a worker ends above it.
+    """
+    import app as app_module
+
+    client = app_module.app.test_client()
+    pool = app_module.get_pool()
+    rng = random.Random(args.seed)
+    # Single problems only: no plots, sweeps, /evaluate or known slow cases
+    cases = [(c['problem_type'], c['expression']) for c in cases
+             if c['problem_type'] not in ('plot', 'evaluate') and 'size' not in c
+             and not SLOW_TAGS & set(c.get('tags', []))]
+    jobs = []
+    for _ in range(args.soak):
+        problem_type, expression = rng.choice(cases)
+        jobs.append((problem_type, vary(expression, rng)))
+
+    def call(job):
+        problem_type, expression = job
+        response = client.post('/solve', json={'problem_type': problem_type, 'expression': expression})
+        body = response.get_json() or {}
+        return response.status_code, body
+
+    started = time.perf_counter()
+    samples = [sample_workers(pool, 0, started)]
+    dropped, solver_errors = [], 0
+    with ThreadPoolExecutor(max_workers=args.threads or pool.size) as executor:
+        for done, (job, (status, body)) in enumerate(zip(jobs, executor.map(call, jobs)), 1):
+            if status != 200 or body.get('timed_out') or body.get('worker_crashed') or body.get('memory_exceeded'):
+                dropped.append({'job': job, 'status': status, 'error': body.get('error')})
+            elif 'error' in body:
+                solver_errors += 1
+            if done % args.sample_every == 0 or done == len(jobs):
+                samples.append(sample_workers(pool, done, started))
+                if not args.json:
+                    print(json.dumps(samples[-1]), flush=True)
+
+    report = {
+        'governance': not args.no_governance,
+        'requests': len(jobs),
+        'dropped': len(dropped),
+        'dropped_examples': dropped[:5],
+        'solver_errors': solver_errors,
+        'samples': samples,
+        'final': samples[-1],
+        'peak_rss_mb': max(s['max_rss_mb'] or 0 for s in samples),
+    }
+    pool.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"requests {report['requests']}  dropped {report['dropped']}  solver errors {solver_errors}  "
+              f"peak worker RSS {report['peak_rss_mb']} MB  final {report['final']['max_rss_mb']} MB  "
+              f"recycled {report['final']['recycled']}")
+    return bool(dropped) or (args.max_rss_mb is not None and (report['final']['max_rss_mb'] or 0) > args.max_rss_mb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'corpus.json'))
+    parser.add_argument('--mode', choices=MODES + ('both',), default='both', help='both is inprocess and client')
+    parser.add_argument('--types', nargs='+', help='only these problem types')
+    parser.add_argument('--tags', nargs='+', help='only cases carrying one of these tags')
+    parser.add_argument('--max-size', type=int, help='skip sweep sizes above this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, help='worker processes for the client modes (default 0, 2 with --soak)')
+    parser.add_argument('--keep-caches', action='store_true', help='do not clear SymPy/parse caches between runs')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    parser.add_argument('--baseline', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative slowdown (default 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write these results as the new baseline')
+    soaking = parser.add_argument_group('soak')
+    soaking.add_argument('--soak', type=int, metavar='REQUESTS', help='run a soak test of this many requests instead')
+    soaking.add_argument('--threads', type=int, help='concurrent clients (default: one per worker)')
+    soaking.add_argument('--sample-every', type=int, default=250)
+    soaking.add_argument('--max-tasks', type=int, help='override MATH_SOLVER_WORKER_MAX_TASKS')
+    soaking.add_argument('--no-governance', action='store_true', help='unbounded SymPy cache, no clearing or recycling')
+    soaking.add_argument('--max-rss-mb', type=float, help='fail if a worker ends above this')
+    soaking.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    configure(args)
+
+    version, cases = load_corpus(args.corpus, args.types, args.tags, args.max_size)
+    if args.soak:
+        sys.exit(1 if soak(args, cases) else 0)
+    modes = ('inprocess', 'client') if args.mode == 'both' else (args.mode,)
+
+    client = None
+    if set(modes) & {'client', 'stream'}:
+        import app as app_module
+        client = app_module.app.test_client()
+
+    results = []
+    for mode in modes:
+        for case in cases:
+            if not applies(mode, case):
+                continue
+            # One untimed call so lazy imports are not charged to the first case
+            make_call(mode, case, client)()
+            results.append(run_case(mode, case, args.repeat, client, args.keep_caches, not args.no_memory))
+
+    report = {'corpus_version': version, 'environment': environment(), 'results': results}
+    comparison = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('corpus_version') != version:
+            print(f"warning: baseline is for corpus v{baseline.get('corpus_version')}, this is v{version}",
+                  file=sys.stderr)
+        comparison = compare(results, baseline, args.threshold, args.min_delta_ms)
+        report['comparison'] = comparison
+        report['regressions'] = [r['key'] for r in comparison if r['regression']]
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results, comparison)
+    if any(r['regression'] for r in comparison):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Time budgets for individual SymPy calls
+SymPy cannot be cancelled cooperatively, so a budget is enforced with a
+SIGALRM timer. Signals are only delivered to the main thread, which is where
+worker processes run their tasks; elsewhere (workers disabled) the block runs
+unbounded and the request timeout is the only limit.
+"""
+
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+
+class BudgetExceeded(Exception):
+    """The block ran past its time budget"""
+
+
+def can_interrupt():
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise BudgetExceeded inside the block once seconds have passed"""
+    if seconds <= 0:
+        raise BudgetExceeded('No time left')
+    if not can_interrupt():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise BudgetExceeded(f'Ran past {seconds:.3g} seconds')
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class Deadline:
+    """A budget shared by several steps"""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
@@ -0,0 +1,204 @@
+"""
+Two-tier result cache for solved problems
+L1 is a bounded LRU with a TTL kept in each process, L2 is a SQLite file
+shared by every worker process on the machine
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry time to live"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value for ttl seconds, or the cache's own ttl if not given"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Result store on disk, safe to share between processes"""
+
+    def __init__(self, path, max_rows, ttl, on_prune=None):
+        self.path = path
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.on_prune = on_prune
+        self.evictions = 0
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _connect(self):
+        # sqlite3 connections must not be shared across threads or forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        return self.get_entry(key)[0]
+
+    def get_entry(self, key):
+        """(value, seconds it has left to live), or (None, 0) if absent or expired"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('SELECT value, expires FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None, 0
+        if row[1] < now:
+            conn.execute('DELETE FROM results WHERE key = ?', (key,))
+            return None, 0
+        conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]), row[1] - now
+
+    def set(self, key, value):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO results (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), now + self.ttl, now)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune(conn)
+
+    def _prune(self, conn):
+        """Drop expired rows, then the least recently used ones above max_rows, then run on_prune"""
+        cur = conn.execute('DELETE FROM results WHERE expires < ?', (time.time(),))
+        self.evictions += cur.rowcount
+        total = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if total > self.max_rows:
+            cur = conn.execute(
+                'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)',
+                (total - self.max_rows,)
+            )
+            self.evictions += cur.rowcount
+        if self.on_prune is not None:
+            self.on_prune()
+
+    def clear(self):
+        self._connect().execute('DELETE FROM results')
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+
+class ResultCache:
+    """L1 in front of an optional L2, with hit/miss/eviction counters"""
+
+    def __init__(self, l1_size, l1_ttl, l2_path=None, l2_max_rows=0, l2_ttl=0, on_prune=None):
+        self.l1 = LRUCache(l1_size, l1_ttl)
+        self.l2 = None
+        if l2_path:
+            try:
+                self.l2 = SQLiteCache(l2_path, l2_max_rows, l2_ttl, on_prune)
+            except sqlite3.Error:
+                self.l2 = None
+        self._lock = threading.Lock()
+        self.counters = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'l2_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, key):
+        value = self.l1.get(key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+        if self.l2 is not None:
+            try:
+                value, remaining = self.l2.get_entry(key)
+            except sqlite3.Error:
+                self._count('l2_errors')
+                value = None
+            if value is not None:
+                self._count('l2_hits')
+                # An L1 copy must not outlive the L2 row it came from
+                self.l1.set(key, value, min(self.l1.ttl, remaining))
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.l1.set(key, value)
+        if self.l2 is not None:
+            try:
+                self.l2.set(key, value)
+            except sqlite3.Error:
+                self._count('l2_errors')
+
+    def clear(self):
+        self.l1.clear()
+        if self.l2 is not None:
+            self.l2.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['l1_hits'] + stats['l2_hits']) / lookups if lookups else 0.0
+        stats['l1_size'] = len(self.l1)
+        stats['l1_maxsize'] = self.l1.maxsize
+        stats['l1_evictions'] = self.l1.evictions
+        stats['l1_expirations'] = self.l1.expirations
+        stats['l2_enabled'] = self.l2 is not None
+        if self.l2 is not None:
+            stats['l2_evictions'] = self.l2.evictions
+            try:
+                stats['l2_size'] = len(self.l2)
+            except sqlite3.Error:
+                stats['l2_size'] = None
+        return stats
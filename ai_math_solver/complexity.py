@@ -0,0 +1,270 @@
+"""
+Complexity guard
+Cheap checks that turn away pathological input before SymPy spends a worker's
+time on it: raw length, token count and nesting before parsing; the sizes of
+exact constants (10**10**10, factorial(10**6)), the arguments of functions
+that evaluate eagerly and the syntax of the code between tokenizing and
+evaluating, since parse_expr evaluates it; and an estimate of the expanded
+size of the parsed expression, which rejects expand-style problems, shrinks
+the time budget for the others and rejects any problem far past it.
+"""
+
+import ast
+import math
+import re
+
+from sympy import Basic
+
+import config
+
+_TOKEN = re.compile(r'\d+\.?\d*|\w+|\*\*|\S')
+_BRACKET = re.compile(r'[()\[\]{}]')
+
+# Evaluated eagerly by SymPy for integer arguments, in time growing with the argument
+COMBINATORIAL = {'factorial', 'factorial2', 'subfactorial', 'gamma', 'binomial', 'fibonacci', 'lucas',
+                 'primorial', 'bell', 'catalan', 'bernoulli', 'genocchi', 'harmonic', 'partition',
+                 'tribonacci', 'motzkin', 'zeta', 'polygamma'}
+# Far slower for the same argument: written out as a polynomial of that degree
+# (legendre(n, x), rf(x, n)) or summed term by term (euler, andre)
+SLOW = {'legendre', 'assoc_legendre', 'chebyshevt', 'chebyshevu', 'hermite', 'hermite_prob', 'laguerre',
+        'assoc_laguerre', 'jacobi', 'gegenbauer', 'RisingFactorial', 'FallingFactorial', 'rf', 'ff',
+        'euler', 'andre'}
+# Evaluated for integer arguments by factoring them, or counting primes up to them
+NUMBER_THEORETIC = {'totient', 'reduced_totient', 'carmichael', 'divisor_sigma', 'udivisor_sigma', 'mobius',
+                    'primenu', 'primeomega', 'primepi', 'legendre_symbol', 'jacobi_symbol', 'kronecker_symbol'}
+# Called like the operators they stand for
+OPERATORS = {'Pow', 'Mul', 'Add'}
+
+# (functions, config setting, limit name); the argument checked is the first unless listed below
+_LIMITS = ((COMBINATORIAL, 'MAX_FACTORIAL', 'factorial'), (SLOW, 'MAX_DEGREE', 'degree'),
+           (NUMBER_THEORETIC, 'MAX_NUMBER_THEORY', 'number_theory'))
+_CHECKED_ARGUMENTS = {'binomial': (0, 1), 'polygamma': (0, 1), 'RisingFactorial': (1,), 'FallingFactorial': (1,),
+                      'rf': (1,), 'ff': (1,)}
+
+# Code that can build a large exact number when evaluated
+_RISKY = re.compile(r'\*\*|\b(?:' + '|'.join(sorted(COMBINATORIAL | SLOW | NUMBER_THEORETIC | OPERATORS))
+                    + r')\b')
+
+# A name called in the raw input, before implicit multiplication can split it
+_CALL = re.compile(r'([A-Za-z_]\w*)\s*\(')
+
+# The syntax generated code needs: attribute access, subscripts, comprehensions,
+# lambdas and keyword arguments never come out of stringify_expr
+_ALLOWED_NODES = (ast.Expression, ast.Call, ast.Name, ast.Load, ast.Constant, ast.BinOp, ast.UnaryOp,
+                  ast.Compare, ast.Tuple, ast.operator, ast.unaryop, ast.cmpop)
+_SYNTAX_MESSAGE = 'Only numbers, symbols, operators, function calls and tuples are allowed in an expression'
+
+# Problem types whose solvers expand the whole expression; the others are held to
+# MAX_EXPRESSION_SIZE instead
+EXPANDING = ('expand', 'factor', 'solve', 'system')
+
+
+class TooComplex(ValueError):
+    """The input exceeds a complexity limit; limit names which one"""
+
+    status = 422
+
+    def __init__(self, message, limit):
+        super().__init__(message)
+        self.limit = limit
+
+    def payload(self):
+        return {'error': str(self), 'too_complex': True, 'limit': self.limit}
+
+    def __reduce__(self):
+        # Raised in workers and re-raised in the parent
+        return type(self), (str(self), self.limit)
+
+
+def check_text(text):
+    """Before parsing: length, token count and bracket nesting of the raw input"""
+    if len(text) > config.MAX_INPUT_CHARS:
+        raise TooComplex(f'Input is longer than {config.MAX_INPUT_CHARS} characters', 'length')
+    if len(text) > config.MAX_TOKENS and len(_TOKEN.findall(text)) > config.MAX_TOKENS:
+        raise TooComplex(f'Input has more than {config.MAX_TOKENS} tokens', 'tokens')
+    depth = 0
+    for match in _BRACKET.finditer(text):
+        depth += 1 if match.group() in '([{' else -1
+        if depth > config.MAX_DEPTH:
+            raise TooComplex(f'Input is nested more than {config.MAX_DEPTH} levels deep', 'depth')
+
+
+def check_calls(text, withheld):
+    """Before parsing: reject calls to SymPy functions the parser does not offer, such as expand or factorint"""
+    for name in _CALL.findall(text):
+        if name in withheld:
+            raise TooComplex(f'{name}() cannot be used in an expression; choose the problem type instead',
+                             'function')
+
+
+def _digits(value):
+    return math.log10(abs(value)) if value else 0.0
+
+
+def _checked(size):
+    if size is not None and size > config.MAX_NUMBER_DIGITS:
+        raise TooComplex(f'A number in the input would have more than {config.MAX_NUMBER_DIGITS} digits',
+                         'number_size')
+    return size
+
+
+def _power(base, exponent):
+    if exponent >= 300:
+        return _checked(math.inf if base else 0.0)
+    return _checked(base * 10**exponent)
+
+
+def _capped(name, args):
+    """
+    For a function evaluated eagerly for integers, the largest of its checked
+    arguments (None if none is a number), after rejecting it if too large
+    """
+    for names, setting, limit in _LIMITS:
+        if name in names:
+            cap = getattr(config, setting)
+            size = max((args[i] for i in _CHECKED_ARGUMENTS.get(name, (0,)) if i < len(args) and args[i] is not None),
+                       default=None)
+            if size is not None and size > math.log10(cap):
+                raise TooComplex(f'{name}() of a number above {cap}', limit)
+            return size
+    return None
+
+
+def _fold(node):
+    """log10 of the size of an exact numeric subtree once evaluated, None if it is not one"""
+    kind = type(node)
+    if kind is ast.Name:
+        return None
+    if kind is ast.Constant:
+        return _digits(node.value) if type(node.value) is int else None
+    if kind is ast.UnaryOp:
+        return _fold(node.operand)
+    if kind is ast.BinOp:
+        left, right = _fold(node.left), _fold(node.right)
+        if left is None or right is None:
+            return None
+        if type(node.op) is ast.Pow:
+            return _power(left, right)
+        if type(node.op) is ast.Mult:
+            return _checked(left + right)
+        return _checked(max(left, right) + 1)
+    if kind is ast.Call:
+        args = [_fold(a) for a in node.args]
+        if type(node.func) is not ast.Name:
+            return None
+        name = node.func.id
+        size = _capped(name, args)
+        if size is not None and name in COMBINATORIAL:
+            n = 10**size
+            return _checked(n * math.log10(max(n, 2)))
+        if not args or any(a is None for a in args):
+            return None
+        if name in ('Integer', 'Rational'):
+            return max(args)
+        # Pow(a, b), Mul(a, b, ...) and Add(a, b, ...) evaluate like a**b, a*b*... and a+b+...
+        if name == 'Pow' and len(args) == 2:
+            return _power(*args)
+        if name == 'Mul':
+            return _checked(sum(args))
+        if name == 'Add':
+            return _checked(max(args) + math.log10(len(args)))
+        return None
+    for child in ast.iter_child_nodes(node):
+        _fold(child)
+    return None
+
+
+def _check_syntax(tree):
+    """Only calls, names, numbers, strings (as in Symbol('x')), operators and tuples may appear"""
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES) or (isinstance(node, ast.Name) and node.id.startswith('_')):
+            raise TooComplex(_SYNTAX_MESSAGE, 'syntax')
+        # (x,)*10**9 or a repeated string would build a huge Python object
+        if isinstance(node, ast.BinOp) and any(
+                isinstance(side, ast.Tuple) or (isinstance(side, ast.Constant) and not isinstance(side.value, int))
+                for side in (node.left, node.right)):
+            raise TooComplex(_SYNTAX_MESSAGE, 'syntax')
+
+
+def check_code(code):
+    """
+    Between tokenizing and evaluating: the syntax of the code stringify_expr
+    produced, and the magnitude of every exact constant in it. Returns the
+    tree, ready to compile.
+    """
+    try:
+        tree = ast.parse(code, mode='eval')
+        _check_syntax(tree)
+        if _RISKY.search(code):
+            _fold(tree.body)
+    except RecursionError:
+        raise TooComplex('Input is nested too deeply', 'depth')
+    return tree
+
+
+def _combinations(n, k):
+    """Number of terms in a k-term sum raised to the n-th power"""
+    if math.isinf(k):
+        return math.inf
+    try:
+        return math.exp(math.lgamma(n + k) - math.lgamma(k) - math.lgamma(n + 1))
+    except OverflowError:
+        return math.inf
+
+
+def _expanded(expr):
+    """(terms, coefficient digits) of expr once fully expanded, roughly"""
+    if expr.is_Integer:
+        return 1.0, _digits(int(expr))
+    if expr.is_Rational:
+        return 1.0, max(_digits(expr.p), _digits(expr.q))
+    if expr.is_Add:
+        parts = [_expanded(a) for a in expr.args]
+        return sum(t for t, _ in parts), max(d for _, d in parts)
+    if expr.is_Mul:
+        parts = [_expanded(a) for a in expr.args]
+        return math.prod(t for t, _ in parts), sum(d for _, d in parts)
+    if expr.is_Pow and expr.exp.is_Integer:
+        terms, digits = _expanded(expr.base)
+        n = abs(int(expr.exp))
+        if terms > 1:
+            return _combinations(n, terms), n * (digits + math.log10(terms))
+        return 1.0, n * digits
+    if not expr.args:
+        return 1.0, 0.0
+    parts = [_expanded(a) for a in expr.args]
+    return sum(t for t, _ in parts), max(d for _, d in parts)
+
+
+def expansion_size(expr):
+    """Estimated size of expr expanded: terms times coefficient digits"""
+    terms, digits = _expanded(expr)
+    return terms * max(digits, 1.0)
+
+
+def too_large(expr):
+    return expansion_size(expr) > config.MAX_EXPANSION_SIZE
+
+
+def _expressions(parsed):
+    """The compound SymPy expressions anywhere in a parsed problem (tuples of expressions, rows, ...)"""
+    if isinstance(parsed, Basic):
+        if not parsed.is_Atom:
+            yield parsed
+    elif isinstance(parsed, (tuple, list)):
+        for item in parsed:
+            yield from _expressions(item)
+
+
+def check(problem_type, parsed):
+    """
+    After parsing: reject problems whose solver would expand an oversized
+    expression, and any problem with an expression far too large to work on
+    """
+    limit = config.MAX_EXPANSION_SIZE if problem_type in EXPANDING else config.MAX_EXPRESSION_SIZE
+    if any(expansion_size(expr) > limit for expr in _expressions(parsed)):
+        if problem_type in EXPANDING:
+            raise TooComplex(f'Expanding this expression would produce more than about '
+                             f'{config.MAX_EXPANSION_SIZE:.0f} digits of output', 'expansion')
+        raise TooComplex(f'This expression would have more than about {config.MAX_EXPRESSION_SIZE:.0f} digits '
+                         f'written out', 'expansion')
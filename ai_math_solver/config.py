@@ -0,0 +1,180 @@
+"""
+Runtime settings for the AI Math Solver
+Every value can be overridden with an environment variable of the same name
+"""
+
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def _str(name, default):
+    return os.environ.get(name, default)
+
+
+# Result cache (L1 = per-process LRU, L2 = SQLite file shared by all workers)
+CACHE_L1_SIZE = _int('MATH_SOLVER_CACHE_L1_SIZE', 1024)
+CACHE_L1_TTL = _float('MATH_SOLVER_CACHE_L1_TTL', 3600)
+CACHE_L2_PATH = _str('MATH_SOLVER_CACHE_L2_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'results.sqlite3'))
+CACHE_L2_MAX_ROWS = _int('MATH_SOLVER_CACHE_L2_MAX_ROWS', 100000)
+CACHE_L2_TTL = _float('MATH_SOLVER_CACHE_L2_TTL', 7 * 24 * 3600)
+
+# Coalescing of identical concurrent solves; across processes it needs the L2 cache
+COALESCE = _int('MATH_SOLVER_COALESCE', 1)
+COALESCE_LOCK_DIR = _str('MATH_SOLVER_COALESCE_LOCK_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'locks'))
+COALESCE_WAIT = _float('MATH_SOLVER_COALESCE_WAIT', 60)
+# How long an uncached outcome (error, timeout, unfinished result) is shared with waiting processes
+COALESCE_OUTCOME_TTL = _float('MATH_SOLVER_COALESCE_OUTCOME_TTL', 5)
+
+# Memory governance: SymPy's cacheit LRU size (read when SymPy is first imported, so it is
+# exported here, before any solver module imports SymPy) and how often it is emptied
+SYMPY_CACHE_SIZE = _int('MATH_SOLVER_SYMPY_CACHE_SIZE', 1000)
+os.environ.setdefault('SYMPY_CACHE_SIZE', str(SYMPY_CACHE_SIZE))
+CLEAR_CACHE_EVERY = _int('MATH_SOLVER_CLEAR_CACHE_EVERY', 500)
+
+# Worker processes for symbolic work (0 runs everything on the request thread)
+WORKERS = _int('MATH_SOLVER_WORKERS', os.cpu_count() or 1)
+WORKER_START_METHOD = _str('MATH_SOLVER_WORKER_START_METHOD', '')
+TIMEOUT = _float('MATH_SOLVER_TIMEOUT', 20)
+RSS_LIMIT_MB = _float('MATH_SOLVER_RSS_LIMIT_MB', 1024)
+# Workers are retired once idle after this many tasks (plus up to JITTER, so they don't all
+# restart at once) or when they have grown past RECYCLE_RSS_MB; 0 disables either rule
+WORKER_MAX_TASKS = _int('MATH_SOLVER_WORKER_MAX_TASKS', 2000)
+WORKER_MAX_TASKS_JITTER = _int('MATH_SOLVER_WORKER_MAX_TASKS_JITTER', 200)
+WORKER_RECYCLE_RSS_MB = _float('MATH_SOLVER_WORKER_RECYCLE_RSS_MB', 768)
+
+
+def timeout_for(problem_type):
+    """Wall-clock budget in seconds, e.g. MATH_SOLVER_TIMEOUT_INTEGRATE=60"""
+    return _float(f'MATH_SOLVER_TIMEOUT_{problem_type.upper()}', TIMEOUT)
+
+
+def rss_limit_for(problem_type):
+    """Worker RSS cap in bytes, e.g. MATH_SOLVER_RSS_LIMIT_MB_PLOT=512"""
+    return _float(f'MATH_SOLVER_RSS_LIMIT_MB_{problem_type.upper()}', RSS_LIMIT_MB) * 1024 * 1024
+
+# /solve/batch
+BATCH_MAX_ITEMS = _int('MATH_SOLVER_BATCH_MAX_ITEMS', 10000)
+BATCH_CONCURRENCY = _int('MATH_SOLVER_BATCH_CONCURRENCY', max(WORKERS, 1))
+
+# Rendered plots, shared by all workers and served from /graph/<hash>.<ext>
+GRAPH_DIR = _str('MATH_SOLVER_GRAPH_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'graphs'))
+GRAPH_MAX_AGE = _int('MATH_SOLVER_GRAPH_MAX_AGE', 365 * 24 * 3600)
+# Pruned whenever the L2 cache drops expired rows: plots not written for the longer cache
+# TTL go entirely, then the oldest images while they take more than GRAPH_STORE_MAX_MB
+GRAPH_STORE_MAX_MB = _float('MATH_SOLVER_GRAPH_STORE_MAX_MB', 1024)
+PLOT_MAX_POINTS = _int('MATH_SOLVER_PLOT_MAX_POINTS', 1000)
+
+# Plots: curves per plot, points drawn per curve, samples along a parametric curve, grid
+# points per axis for implicit curves and surfaces (default and largest 'resolution'), and
+# the blocks per axis a surface is averaged down to before it is drawn
+PLOT_MAX_FUNCTIONS = _int('MATH_SOLVER_PLOT_MAX_FUNCTIONS', 8)
+PLOT_RENDER_POINTS = _int('MATH_SOLVER_PLOT_RENDER_POINTS', 5000)
+PLOT_PARAMETRIC_POINTS = _int('MATH_SOLVER_PLOT_PARAMETRIC_POINTS', 2000)
+PLOT_GRID_SIZE = _int('MATH_SOLVER_PLOT_GRID_SIZE', 300)
+PLOT_MAX_GRID_SIZE = _int('MATH_SOLVER_PLOT_MAX_GRID_SIZE', 3000)
+PLOT_SURFACE_SIZE = _int('MATH_SOLVER_PLOT_SURFACE_SIZE', 60)
+
+# Memoized parse results per process
+PARSE_CACHE_SIZE = _int('MATH_SOLVER_PARSE_CACHE_SIZE', 4096)
+
+# Start-up: warm-up corpus run in every worker before it is marked ready
+WARMUP = _int('MATH_SOLVER_WARMUP', 1)
+WARMUP_FILE = _str('MATH_SOLVER_WARMUP_FILE', '')
+WORKER_READY_TIMEOUT = _float('MATH_SOLVER_WORKER_READY_TIMEOUT', 120)
+
+# Admission control: per-type concurrency in front of the pool plus a bounded wait queue.
+# TOTAL_CONCURRENCY caps all types together (one request per worker); RESERVED_SLOTS of it
+# only CHEAP_TYPES may use (none with a single worker). QUEUE_TIMEOUT also bounds the wait
+# for an idle worker inside the pool
+CONCURRENCY = _int('MATH_SOLVER_CONCURRENCY', max(WORKERS - 1, 1) if WORKERS else 4)
+TOTAL_CONCURRENCY = _int('MATH_SOLVER_TOTAL_CONCURRENCY', WORKERS or CONCURRENCY)
+RESERVED_SLOTS = _int('MATH_SOLVER_RESERVED_SLOTS', 1)
+CHEAP_TYPES = tuple(_str('MATH_SOLVER_CHEAP_TYPES', 'simplify,solve,derivative,factor,expand,limit,evaluate').split(','))
+QUEUE_SIZE = _int('MATH_SOLVER_QUEUE_SIZE', max(WORKERS, 1) * 8)
+QUEUE_TIMEOUT = _float('MATH_SOLVER_QUEUE_TIMEOUT', 10)
+
+
+def concurrency_for(problem_type):
+    """Concurrent solves allowed per type, e.g. MATH_SOLVER_CONCURRENCY_INTEGRATE=2"""
+    return _int(f'MATH_SOLVER_CONCURRENCY_{problem_type.upper()}', CONCURRENCY)
+
+# Polynomial fast path: above NUMERIC_DEGREE, roots without a closed form are approximated
+# with companion-matrix eigenvalues; above EXACT_MAX_DEGREE exact roots are not attempted
+POLY_NUMERIC_DEGREE = _int('MATH_SOLVER_POLY_NUMERIC_DEGREE', 10)
+POLY_EXACT_MAX_DEGREE = _int('MATH_SOLVER_POLY_EXACT_MAX_DEGREE', 100)
+
+# Systems of equations: size limit, and time budget for nonlinear systems (Groebner basis or sp.solve)
+SYSTEM_MAX_EQUATIONS = _int('MATH_SOLVER_SYSTEM_MAX_EQUATIONS', 1000)
+SYSTEM_GROEBNER_BUDGET = _float('MATH_SOLVER_SYSTEM_GROEBNER_BUDGET', 5.0)
+
+# Matrices: size limit, and the largest dimension auto mode keeps exact (determinants
+# have a modular algorithm and stay exact longer); past it auto mode uses floating point
+MATRIX_MAX_ENTRIES = _int('MATH_SOLVER_MATRIX_MAX_ENTRIES', 250000)
+MATRIX_EXACT_MAX_DIM = _int('MATH_SOLVER_MATRIX_EXACT_MAX_DIM', 100)
+MATRIX_EXACT_DET_MAX_DIM = _int('MATH_SOLVER_MATRIX_EXACT_DET_MAX_DIM', 300)
+
+# Tiered simplify: seconds of targeted passes before falling back is no longer attempted
+SIMPLIFY_BUDGET = _float('MATH_SOLVER_SIMPLIFY_BUDGET', 2.0)
+
+# Integration: overall symbolic budget (kept QUADRATURE_MARGIN seconds inside the integrate
+# timeout, so a definite integral still has time for quadrature), and the share of it
+# manualintegrate may take before escalating (textbook integrals by parts or substitution
+# take it 0.1-0.7 s)
+INTEGRATE_BUDGET = _float('MATH_SOLVER_INTEGRATE_BUDGET', 10)
+INTEGRATE_QUADRATURE_MARGIN = _float('MATH_SOLVER_INTEGRATE_QUADRATURE_MARGIN', 1.0)
+INTEGRATE_MANUAL_SHARE = _float('MATH_SOLVER_INTEGRATE_MANUAL_SHARE', 0.25)
+
+# Output: results of more than OUTPUT_CSE_NODES expression nodes are reported as shared
+# subexpressions (sp.cse) plus a final expression, up to OUTPUT_CSE_MAX_NODES, past which cse
+# costs seconds; longer texts are cut at OUTPUT_MAX_CHARS
+OUTPUT_CSE_NODES = _int('MATH_SOLVER_OUTPUT_CSE_NODES', 300)
+OUTPUT_CSE_MAX_NODES = _int('MATH_SOLVER_OUTPUT_CSE_MAX_NODES', 20000)
+OUTPUT_MAX_CHARS = _int('MATH_SOLVER_OUTPUT_MAX_CHARS', 20000)
+
+# Streamed steps (/solve/stream): most steps sent per request, and seconds spent looking
+# for the integration rules to show (the result itself has the integrate budget)
+STEPS_MAX = _int('MATH_SOLVER_STEPS_MAX', 200)
+STEPS_BUDGET = _float('MATH_SOLVER_STEPS_BUDGET', 2.0)
+
+# /evaluate: lambdified callables kept per process, points per NumPy call, points per request
+LAMBDIFY_CACHE_SIZE = _int('MATH_SOLVER_LAMBDIFY_CACHE_SIZE', 256)
+EVALUATE_CHUNK_SIZE = _int('MATH_SOLVER_EVALUATE_CHUNK_SIZE', 65536)
+EVALUATE_MAX_POINTS = _int('MATH_SOLVER_EVALUATE_MAX_POINTS', 10000000)
+
+# Statistics: rows parsed per NumPy call, values (rows × columns, 8 bytes each) kept for exact
+# quantiles before switching to a histogram sketch, and rows read to decide which columns are numeric
+STATS_BATCH_ROWS = _int('MATH_SOLVER_STATS_BATCH_ROWS', 50000)
+STATS_EXACT_VALUES = _int('MATH_SOLVER_STATS_EXACT_VALUES', 2000000)
+STATS_SAMPLE_ROWS = _int('MATH_SOLVER_STATS_SAMPLE_ROWS', 1000)
+
+# Complexity guard: limits checked on the raw input, on its constants, and on the
+# estimated expanded size (terms x coefficient digits) of the parsed expression
+MAX_INPUT_CHARS = _int('MATH_SOLVER_MAX_INPUT_CHARS', 5000)
+MAX_TOKENS = _int('MATH_SOLVER_MAX_TOKENS', 1000)
+MAX_DEPTH = _int('MATH_SOLVER_MAX_DEPTH', 50)
+MAX_NUMBER_DIGITS = _int('MATH_SOLVER_MAX_NUMBER_DIGITS', 10000)
+MAX_FACTORIAL = _int('MATH_SOLVER_MAX_FACTORIAL', 10000)
+# Largest integer degree of legendre, chebyshevt, rf, ... (and argument of euler, andre), and
+# integer argument of totient, primepi, divisor_sigma, ... evaluated while parsing
+MAX_DEGREE = _int('MATH_SOLVER_MAX_DEGREE', 300)
+MAX_NUMBER_THEORY = _int('MATH_SOLVER_MAX_NUMBER_THEORY', 10**9)
+MAX_EXPANSION_SIZE = _float('MATH_SOLVER_MAX_EXPANSION_SIZE', 1e6)
+# Estimated expanded size past which problems that do not expand are rejected too
+MAX_EXPRESSION_SIZE = _float('MATH_SOLVER_MAX_EXPRESSION_SIZE', 1e9)
+# Time budget for simplify/integrate on expressions over MAX_EXPANSION_SIZE (simplify then skips full sp.simplify)
+DOWNGRADED_BUDGET = _float('MATH_SOLVER_DOWNGRADED_BUDGET', 0.5)
+
+# Profiling: requests carrying X-Profile-Token equal to PROFILE_TOKEN (unset = off) may ask for a
+# profile; PROFILE_SAMPLE_RATE of ordinary cache misses are profiled and stored without asking
+PROFILE_TOKEN = _str('MATH_SOLVER_PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = _float('MATH_SOLVER_PROFILE_SAMPLE_RATE', 0.0)
+PROFILE_INTERVAL = _float('MATH_SOLVER_PROFILE_INTERVAL', 0.001)
+PROFILE_DIR = _str('MATH_SOLVER_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'profiles'))
+PROFILE_KEEP = _int('MATH_SOLVER_PROFILE_KEEP', 200)
@@ -0,0 +1,368 @@
+"""
+Single-pass statistics over numeric datasets
+Rows are fed in chunks to an Accumulator that merges per-chunk means and
+co-moments (the parallel form of Welford's update), so a CSV of any size is
+read once and never held in memory. Quantiles and histograms are exact while
+the data fits under STATS_EXACT_VALUES (rows × columns) and come from a fine
+streaming histogram beyond that.
+"""
+
+import math
+import re
+
+import numpy as np
+
+import config
+
+QUANTILES = (0.25, 0.5, 0.75)
+MAX_BINS = 1000
+
+
+class StreamingHistogram:
+    """Fixed number of equal-width bins whose range doubles whenever a value falls outside it"""
+
+    def __init__(self, bins=4096):
+        self.bins = bins
+        self.counts = None
+        self.low = 0.0
+        self.width = 1.0
+
+    def _grow(self, low, high):
+        half = self.bins // 2
+        while low < self.low or high >= self.low + self.width * self.bins:
+            merged = self.counts.reshape(-1, 2).sum(axis=1)
+            self.counts = np.zeros(self.bins)
+            if low < self.low:
+                # Extend downwards: the old range becomes the upper half
+                self.counts[half:] = merged
+                self.low -= self.width * self.bins
+            else:
+                self.counts[:half] = merged
+            self.width *= 2
+
+    def add(self, values):
+        if not len(values):
+            return
+        low, high = float(values.min()), float(values.max())
+        if self.counts is None:
+            self.counts = np.zeros(self.bins)
+            self.low = low
+            self.width = (high - low) / (self.bins - 1) or max(abs(low), 1.0) * 1e-9
+        self._grow(low, high)
+        index = np.minimum(((values - self.low) / self.width).astype(np.int64), self.bins - 1)
+        self.counts += np.bincount(index, minlength=self.bins)
+
+    def quantile(self, q, minimum, maximum):
+        """Linear interpolation inside the bin holding the q-th fraction of the values"""
+        cumulative = np.cumsum(self.counts)
+        target = q * cumulative[-1]
+        index = int(np.searchsorted(cumulative, target))
+        index = min(index, self.bins - 1)
+        before = cumulative[index - 1] if index else 0.0
+        fraction = (target - before) / self.counts[index] if self.counts[index] else 0.0
+        return float(np.clip(self.low + (index + fraction) * self.width, minimum, maximum))
+
+    def histogram(self, bins, minimum, maximum):
+        centers = self.low + (np.arange(self.bins) + 0.5) * self.width
+        return np.histogram(np.clip(centers, minimum, maximum), bins=bins, range=(minimum, maximum),
+                            weights=self.counts)
+
+
+class Accumulator:
+    """Count, mean, co-moments, extremes and quantile data of a table, fed chunk by chunk"""
+
+    def __init__(self, names, exact_values=None):
+        k = len(names)
+        self.names = list(names)
+        self.count = 0
+        self.skipped = 0
+        self.mean = np.zeros(k)
+        # comoment[i, j] = sum over rows of (x_i - mean_i) * (x_j - mean_j)
+        self.comoment = np.zeros((k, k))
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+        exact_values = config.STATS_EXACT_VALUES if exact_values is None else exact_values
+        self.exact_rows = exact_values // max(k, 1)
+        self._retained = []
+        self._retained_rows = 0
+        self._histograms = None
+
+    def add(self, chunk):
+        """Add a 2-D chunk, one row per observation; rows with a missing value are skipped"""
+        chunk = np.asarray(chunk, dtype=float).reshape(-1, len(self.names))
+        complete = np.isfinite(chunk).all(axis=1)
+        self.skipped += int(len(chunk) - complete.sum())
+        chunk = chunk[complete]
+        n = len(chunk)
+        if not n:
+            return
+
+        mean = chunk.mean(axis=0)
+        centered = chunk - mean
+        total = self.count + n
+        delta = mean - self.mean
+        self.comoment += centered.T @ centered + np.outer(delta, delta) * (self.count * n / total)
+        self.mean += delta * (n / total)
+        self.count = total
+        self.minimum = np.minimum(self.minimum, chunk.min(axis=0))
+        self.maximum = np.maximum(self.maximum, chunk.max(axis=0))
+
+        if self._histograms is None:
+            self._retained.append(chunk)
+            self._retained_rows += n
+            if self._retained_rows > self.exact_rows:
+                # Too much to keep: switch every column to a streaming histogram, chunk by chunk
+                self._histograms = [StreamingHistogram() for _ in self.names]
+                for retained in self._retained:
+                    for i, histogram in enumerate(self._histograms):
+                        histogram.add(retained[:, i])
+                self._retained = []
+        else:
+            for i, histogram in enumerate(self._histograms):
+                histogram.add(chunk[:, i])
+
+    def regression(self, x, y):
+        """Least-squares line y = intercept + slope * x between two columns"""
+        sxx, syy, sxy = self.comoment[x, x], self.comoment[y, y], self.comoment[x, y]
+        if self.count < 2 or sxx == 0:
+            return None
+        slope = sxy / sxx
+        residual = max(syy - slope * sxy, 0.0)
+        r = sxy / math.sqrt(sxx * syy) if syy else math.nan
+        return {
+            'x': self.names[x],
+            'y': self.names[y],
+            'slope': _number(slope),
+            'intercept': _number(self.mean[y] - slope * self.mean[x]),
+            'r': _number(r),
+            'r_squared': _number(r * r),
+            'standard_error': _number(math.sqrt(residual / (self.count - 2))) if self.count > 2 else None,
+        }
+
+    def summary(self, quantiles=QUANTILES, bins=10):
+        exact = self._histograms is None
+        columns = {}
+        for i, name in enumerate(self.names):
+            if not self.count:
+                columns[name] = {'count': 0}
+                continue
+            low, high = float(self.minimum[i]), float(self.maximum[i])
+            variance = self.comoment[i, i] / (self.count - 1) if self.count > 1 else math.nan
+            if exact:
+                # One column at a time, so at most one extra column is ever copied
+                data = np.concatenate([retained[:, i] for retained in self._retained])
+                values = np.quantile(data, (0.5,) + tuple(quantiles))
+                counts, edges = np.histogram(data, bins=bins)
+            else:
+                histogram = self._histograms[i]
+                values = [histogram.quantile(q, low, high) for q in (0.5,) + tuple(quantiles)]
+                counts, edges = histogram.histogram(bins, low, high)
+            columns[name] = {
+                'count': self.count,
+                'mean': _number(self.mean[i]),
+                'variance': _number(variance),
+                'std': _number(math.sqrt(max(variance, 0.0))),
+                'min': low,
+                'max': high,
+                'sum': _number(self.mean[i] * self.count),
+                'median': _number(values[0]),
+                'quantiles': {f'{q:g}': _number(v) for q, v in zip(quantiles, values[1:])},
+                'histogram': {'edges': edges.tolist(), 'counts': [int(c) for c in counts]},
+            }
+
+        summary = {'count': self.count, 'skipped_rows': self.skipped, 'exact_quantiles': exact, 'columns': columns}
+        if len(self.names) >= 2 and self.count > 1:
+            scale = np.sqrt(np.diag(self.comoment))
+            with np.errstate(all='ignore'):
+                correlation = self.comoment / np.outer(scale, scale)
+            summary['correlation'] = [[_number(v) for v in row] for row in correlation]
+            summary['regression'] = self.regression(0, 1)
+        return summary
+
+
+def _number(value):
+    """JSON-safe float: NaN and infinities become None"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def _is_number(field):
+    try:
+        float(field)
+        return True
+    except ValueError:
+        return False
+
+
+def _delimiter(line):
+    for delimiter in (',', ';', '\t'):
+        if delimiter in line:
+            return delimiter
+    return None
+
+
+def _split(line, delimiter):
+    return [f.strip().strip('"') for f in (line.split(delimiter) if delimiter else line.split())]
+
+
+def default_names(k):
+    return ['x', 'y'][:k] if k <= 2 else [f'column{i + 1}' for i in range(k)]
+
+
+def _parse_batch(lines, delimiter, usecols):
+    try:
+        return np.loadtxt(lines, delimiter=delimiter, usecols=usecols, ndmin=2, quotechar='"')
+    except ValueError:
+        # Missing or malformed fields: slower parser that turns them into NaN
+        return np.genfromtxt(lines, delimiter=delimiter, usecols=usecols, ndmin=2, invalid_raise=False)
+
+
+def _numeric_columns(sample, delimiter, width):
+    """Columns whose fields in the sample rows are numbers or blank, at least one a number"""
+    numeric, seen = [True] * width, [False] * width
+    for line in sample:
+        for i, field in enumerate(_split(line, delimiter)[:width]):
+            if not field:
+                continue
+            if _is_number(field):
+                seen[i] = True
+            else:
+                numeric[i] = False
+    return [i for i in range(width) if numeric[i] and seen[i]]
+
+
+def read_csv(lines, columns=None, batch_rows=None):
+    """
+    Stream CSV lines (bytes or str) into an Accumulator. A first line that is not
+    all numbers is taken as the header; columns that are not numeric in the
+    first STATS_SAMPLE_ROWS rows are ignored, and columns (names or 1-based
+    positions) picks a subset.
+    """
+    batch_rows = batch_rows or config.STATS_BATCH_ROWS
+    accumulator = None
+    header = None
+    delimiter = usecols = None
+    batch = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if delimiter is None:
+            delimiter = _delimiter(line)
+        if accumulator is None:
+            if header is None and not batch and not all(_is_number(f) for f in _split(line, delimiter) if f):
+                header = _split(line, delimiter)
+                continue
+            # The first rows decide the columns; they are kept and parsed with the next batch
+            batch.append(line)
+            if len(batch) < config.STATS_SAMPLE_ROWS:
+                continue
+            accumulator, usecols = _start(header, batch, delimiter, columns)
+        else:
+            batch.append(line)
+        if len(batch) >= batch_rows:
+            accumulator.add(_parse_batch(batch, delimiter, usecols))
+            batch = []
+    if accumulator is None:
+        if not batch:
+            raise ValueError('No numeric data found')
+        accumulator, usecols = _start(header, batch, delimiter, columns)
+    if batch:
+        accumulator.add(_parse_batch(batch, delimiter, usecols))
+    return accumulator
+
+
+def _start(header, sample, delimiter, columns):
+    """(Accumulator, usecols) for the columns picked from the header and the sample rows"""
+    width = len(header) if header else max(len(_split(line, delimiter)) for line in sample)
+    names = header or default_names(width)
+    usecols = _select(columns, _numeric_columns(sample, delimiter, width), names)
+    return Accumulator([names[i] for i in usecols]), usecols
+
+
+def _select(columns, usecols, names):
+    if not columns:
+        if not usecols:
+            raise ValueError('No numeric columns found')
+        return usecols
+    selected = []
+    for column in columns:
+        column = str(column).strip()
+        if column in names:
+            index = names.index(column)
+        elif column.isdigit() and 1 <= int(column) <= len(names):
+            index = int(column) - 1
+        else:
+            raise ValueError(f'Unknown column {column!r}')
+        if index not in usecols:
+            raise ValueError(f'Column {column!r} is not numeric')
+        selected.append(index)
+    return selected
+
+
+def parse_inline(text):
+    """
+    Typed-in data as (names, rows): a single line is one column of numbers
+    separated by commas, semicolons or spaces; several lines are read as CSV
+    """
+    lines = [line for line in text.strip().splitlines() if line.strip()]
+    if len(lines) == 1:
+        values = [float(v) for v in re.split(r'[,;\s]+', lines[0].strip().strip('[]')) if v]
+        return ('x',), tuple((v,) for v in values)
+    names, rows = None, []
+    delimiter = _delimiter(lines[0])
+    first = _split(lines[0], delimiter)
+    if not all(_is_number(f) for f in first):
+        names, lines = tuple(first), lines[1:]
+    for line in lines:
+        rows.append(tuple(float(f) if f else math.nan for f in _split(line, delimiter)))
+    width = len(rows[0]) if rows else 0
+    if any(len(row) != width for row in rows):
+        raise ValueError('Every row must have the same number of values')
+    if names is not None and len(names) != width:
+        raise ValueError('The header and the rows have different numbers of columns')
+    return names or tuple(default_names(width)), tuple(rows)
+
+
+def options(source):
+    """bins, quantiles and plot from request fields (JSON values or query strings)"""
+    bins = int(source.get('bins') or 10)
+    if not 1 <= bins <= MAX_BINS:
+        raise ValueError(f'bins must be between 1 and {MAX_BINS}')
+    quantiles = source.get('quantiles') or QUANTILES
+    if isinstance(quantiles, str):
+        quantiles = quantiles.split(',')
+    quantiles = tuple(float(q) for q in quantiles)
+    if not all(0 <= q <= 1 for q in quantiles):
+        raise ValueError('quantiles must lie between 0 and 1')
+    plot = source.get('plot')
+    if isinstance(plot, str):
+        plot = plot.lower() in ('1', 'true', 'yes', 'on')
+    return bins, quantiles, bool(plot)
+
+
+def describe(summary):
+    """Result line and steps for a summary"""
+    parts, steps = [], [f"Data: {summary['count']} observations of {', '.join(summary['columns'])}"]
+    if summary['skipped_rows']:
+        steps.append(f"Skipped {summary['skipped_rows']} rows with missing values")
+    for name, column in summary['columns'].items():
+        if not column['count']:
+            continue
+        parts.append(f"{name}: mean = {_g(column['mean'])}, std = {_g(column['std'])}, median = {_g(column['median'])}")
+        quantiles = ', '.join(f'Q{q} = {_g(v)}' for q, v in column['quantiles'].items())
+        steps.append(f"{name}: mean {_g(column['mean'])}, variance {_g(column['variance'])}, "
+                     f"range [{_g(column['min'])}, {_g(column['max'])}], {quantiles}")
+    regression = summary.get('regression')
+    if regression:
+        line = (f"{regression['y']} = {_g(regression['intercept'])} + {_g(regression['slope'])}*{regression['x']}"
+                f" (r² = {_g(regression['r_squared'])})")
+        parts.append(line)
+        steps.append(f'Least-squares line: {line}')
+    return '; '.join(parts), steps
+
+
+def _g(value):
+    return 'n/a' if value is None else f'{value:.6g}'
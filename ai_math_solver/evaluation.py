@@ -0,0 +1,102 @@
+"""
+Vectorized evaluation of an expression over arrays of points
+Lambdified callables are cached per canonical expression and variable list,
+and points are evaluated in fixed-size chunks so the temporaries NumPy makes
+for every sub-expression stay small however many points are requested
+"""
+
+import io
+
+import numpy as np
+import sympy as sp
+
+import config
+from cache import LRUCache
+from metrics import stage
+
+NPY_MIMETYPES = ('application/x-npy', 'application/octet-stream')
+
+_callables = LRUCache(config.LAMBDIFY_CACHE_SIZE, float('inf'))
+
+
+def compile_expression(expr, names):
+    """The lambdified expr taking one argument per name, from the LRU when possible"""
+    key = (sp.srepr(expr), tuple(names))
+    f = _callables.get(key)
+    if f is None:
+        f = sp.lambdify([sp.Symbol(n) for n in names], expr, 'numpy')
+        _callables.set(key, f)
+    return f
+
+
+def _chunk(column, start, stop):
+    # Contiguous inputs are sliced as views; .flat copies just this chunk out of a broadcast view
+    if column.flags.c_contiguous:
+        return column.reshape(-1)[start:stop]
+    return column.flat[start:stop]
+
+
+def evaluate(expr, arrays, chunk_size=None):
+    """Evaluate expr at every point of the broadcast {name: array} inputs; returns an array of that shape"""
+    missing = {str(s) for s in expr.free_symbols} - set(arrays)
+    if missing:
+        raise ValueError(f'No values given for {", ".join(sorted(missing))}')
+    names = sorted(arrays)
+    chunk_size = chunk_size or config.EVALUATE_CHUNK_SIZE
+    with stage('compile'):
+        f = compile_expression(expr, names)
+
+    with stage('compute'):
+        columns = np.broadcast_arrays(*(np.asarray(arrays[n], dtype=float) for n in names))
+        shape = columns[0].shape if columns else ()
+        size = int(np.prod(shape))
+        if size > config.EVALUATE_MAX_POINTS:
+            raise ValueError(f'At most {config.EVALUATE_MAX_POINTS} points can be evaluated at once')
+        out = np.empty(size, dtype=float)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            with np.errstate(all='ignore'):
+                values = f(*(_chunk(c, start, stop) for c in columns))
+            values = np.broadcast_to(values, (stop - start,))
+            if np.iscomplexobj(values) and not np.iscomplexobj(out):
+                out = out.astype(complex)
+            out[start:stop] = values
+    return out.reshape(shape)
+
+
+def load_arrays(data, variable=None):
+    """
+    Arrays from a .npy/.npz body: an .npz archive or structured array names its
+    variables itself, a plain array is bound to variable
+    """
+    loaded = np.load(io.BytesIO(data), allow_pickle=False)
+    if isinstance(loaded, np.lib.npyio.NpzFile):
+        with loaded:
+            return {name: loaded[name] for name in loaded.files}
+    if loaded.dtype.names:
+        return {name: loaded[name] for name in loaded.dtype.names}
+    if not variable:
+        raise ValueError('Name the variable of a plain .npy array with ?variable=')
+    return {variable: loaded}
+
+
+def to_npy(values):
+    buffer = io.BytesIO()
+    np.save(buffer, values, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _json_list(values):
+    finite = np.isfinite(values)
+    if finite.all():
+        return values.tolist()
+    # NaN and infinities are not valid JSON
+    values = values.astype(object)
+    values[~finite] = None
+    return values.tolist()
+
+
+def to_json(values):
+    if np.iscomplexobj(values):
+        return {'real': _json_list(values.real), 'imag': _json_list(values.imag)}
+    return _json_list(values)
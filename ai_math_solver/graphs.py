@@ -0,0 +1,193 @@
+"""
+Content-addressed plot storage
+A plot is identified by the hash of its canonical definition (kind,
+expressions, ranges and grid resolution), so the same plot always has the
+same URL and can be cached forever.
+Files live in a directory shared by all worker processes. prune() drops
+plots no cached result can still point to, and trims the images (never the
+specs, so a trimmed image is simply rendered again) to a size limit.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+import numpy as np
+import sympy as sp
+
+import config
+import plots
+from metrics import stage
+from plotting import histogram_outline, render_curve, render_curves, render_surface
+from sampling import downsample, thin
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# What sampling and rendering a plot can fail with: lambdify cannot print some objects
+# (NotImplementedError) and leaves functions NumPy lacks as NameError, odd values give
+# TypeError, ValueError or arithmetic errors, and the store OSError
+PLOT_ERRORS = (ArithmeticError, NameError, NotImplementedError, TypeError, ValueError, OSError)
+
+
+def plot_digest(plot, resolution=None):
+    canonical = json.dumps([sp.srepr(plot), resolution])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def graph_path(digest, fmt):
+    return os.path.join(config.GRAPH_DIR, f'{digest}.{fmt}')
+
+
+def graph_url(digest, fmt='png'):
+    return f'/graph/{digest}.{fmt}'
+
+
+def graph_exists(digest):
+    """Whether the store has the spec for digest, so it can be served in some format"""
+    return os.path.exists(graph_path(digest, 'json'))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        # Another process pruned it first
+        return 0
+
+
+def prune(max_age, max_bytes):
+    """
+    Delete every file not written for max_age seconds, then the oldest images
+    while the others take more than max_bytes; returns the number deleted
+    """
+    try:
+        entries = []
+        for entry in os.scandir(config.GRAPH_DIR):
+            info = entry.stat()
+            entries.append((info.st_mtime, info.st_size, entry.path))
+    except OSError:
+        return 0
+    cutoff = time.time() - max_age
+    deleted = 0
+    images = []
+    for mtime, size, path in entries:
+        if mtime < cutoff:
+            deleted += _remove(path)
+        elif not path.endswith('.json'):
+            images.append((mtime, size, path))
+    total = sum(size for _, size, _ in images)
+    for mtime, size, path in sorted(images):
+        if total <= max_bytes:
+            break
+        deleted += _remove(path)
+        total -= size
+    return deleted
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _spec(plot, resolution):
+    kind, exprs, ranges = plot
+    return {'kind': kind, 'exprs': [sp.srepr(e) for e in exprs],
+            'ranges': [[sp.srepr(v) for v in r] for r in ranges], 'resolution': resolution}
+
+
+def _from_spec(spec):
+    """(plot, resolution) back from a stored spec"""
+    if 'expr' in spec:
+        # Stored when a plot was a single f(x)
+        expr, x_min, x_max = (sp.sympify(spec[k]) for k in ('expr', 'x_min', 'x_max'))
+        return ('functions', (expr,), ((plots.X, x_min, x_max),)), None
+    exprs = tuple(sp.sympify(e) for e in spec['exprs'])
+    ranges = tuple(tuple(sp.sympify(v) for v in r) for r in spec['ranges'])
+    return (spec['kind'], exprs, ranges), spec['resolution']
+
+
+def sample_plot(plot, resolution=None):
+    """What to draw for a parsed plot (see plots.sample)"""
+    with stage('compute'):
+        return plots.sample(plot, resolution)
+
+
+def render_plot(plot, drawing, fmt):
+    """Encoded image of a sampled plot"""
+    title = plots.describe(plot)[0]
+    if drawing['kind'] == 'surface':
+        return render_surface(drawing['x'], drawing['y'], drawing['z'], title, fmt)
+    return render_curves(drawing['curves'], title, fmt, drawing['limits'], drawing['labels'], drawing['names'],
+                         equal_aspect=drawing['kind'] != 'functions')
+
+
+def create_graph(plot, fmt='png', resolution=None):
+    """Render a plot into the store, returning (digest, evaluations)"""
+    digest = plot_digest(plot, resolution)
+    drawing = sample_plot(plot, resolution)
+    image = render_plot(plot, drawing, fmt)
+    # The spec lets any process re-render this plot in another format later
+    _write_atomic(graph_path(digest, 'json'), json.dumps(_spec(plot, resolution)).encode('utf-8'))
+    _write_atomic(graph_path(digest, fmt), image)
+    return digest, drawing['evaluations']
+
+
+def create_histogram(edges, counts, title, fmt='png'):
+    """Render a histogram into the store, returning its digest"""
+    spec = {'kind': 'histogram', 'edges': list(edges), 'counts': list(counts), 'title': title}
+    encoded = json.dumps(spec, sort_keys=True).encode('utf-8')
+    digest = hashlib.sha256(encoded).hexdigest()
+    x_vals, y_vals = histogram_outline(edges, counts)
+    image = render_curve(x_vals, y_vals, title, fmt, labels=('value', 'count'))
+    _write_atomic(graph_path(digest, 'json'), encoded)
+    _write_atomic(graph_path(digest, fmt), image)
+    return digest
+
+
+def render_stored(digest, fmt):
+    """Render a stored plot in another format; returns the file path or None if unknown"""
+    try:
+        with open(graph_path(digest, 'json')) as f:
+            spec = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if spec.get('kind') == 'histogram':
+        create_histogram(spec['edges'], spec['counts'], spec['title'], fmt)
+    else:
+        plot, resolution = _from_spec(spec)
+        create_graph(plot, fmt, resolution)
+    return graph_path(digest, fmt)
+
+
+def _listed(values):
+    return [None if np.isnan(v) else v for v in values.tolist()]
+
+
+def plot_points(plot, max_points=None, resolution=None):
+    """
+    Downsampled sample arrays for client-side rendering; NaN breaks become null.
+    A single f(x) keeps the x, y and y_limits fields it always had.
+    """
+    max_points = max_points or config.PLOT_MAX_POINTS
+    drawing = sample_plot(plot, resolution)
+    if drawing['kind'] == 'surface':
+        points = {'kind': 'surface', 'x': drawing['x'].tolist(), 'y': drawing['y'].tolist(),
+                  'z': [_listed(row) for row in drawing['z']]}
+        return points, drawing['evaluations']
+    reduce = downsample if drawing['kind'] == 'functions' else thin
+    curves = [reduce(x_vals, y_vals, max_points) for x_vals, y_vals in drawing['curves']]
+    points = {'kind': drawing['kind'], 'curves': [
+        {'name': name, 'x': _listed(x_vals), 'y': _listed(y_vals)}
+        for name, (x_vals, y_vals) in zip(drawing['names'] or [None], curves)]}
+    x_limits, y_limits = drawing['limits']
+    points.update(x_limits=x_limits, y_limits=y_limits)
+    if drawing['kind'] == 'functions' and len(curves) == 1:
+        points.update(x=points['curves'][0]['x'], y=points['curves'][0]['y'])
+    return points, drawing['evaluations']
@@ -0,0 +1,33 @@
+"""
+Gunicorn settings: load the app once in the master, fork web workers from it
+(sharing the imported SymPy/NumPy pages copy-on-write), and start each web
+worker's solver pool only after the fork
+Every web worker owns a pool, so the CPUs are split between them: the server runs
+1 master + workers web workers + workers * MATH_SOLVER_WORKERS solver processes
+(plus one forkserver per web worker), about 1 + 2 * workers + cpu_count in all
+"""
+
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:create_app(start_workers=False)'
+preload_app = True
+bind = os.environ.get('MATH_SOLVER_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('MATH_SOLVER_WEB_WORKERS', 2))
+# Read by config when the app is preloaded below, so it must be set here
+os.environ.setdefault('MATH_SOLVER_WORKERS', str(max(1, multiprocessing.cpu_count() // workers)))
+worker_class = 'gthread'
+threads = int(os.environ.get('MATH_SOLVER_WEB_THREADS', multiprocessing.cpu_count() * 2))
+# post_fork blocks until the pool is warm, and gunicorn counts that against the timeout,
+# so leave room for the slowest start the pool itself allows
+timeout = max(120, int(float(os.environ.get('MATH_SOLVER_WORKER_READY_TIMEOUT', 120))) + 30)
+# Graceful restarts of the web workers themselves (0 = never); each one finishes its
+# in-flight requests first and brings its own solver pool down with it
+max_requests = int(os.environ.get('MATH_SOLVER_WEB_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('MATH_SOLVER_WEB_MAX_REQUESTS_JITTER', 0))
+
+
+def post_fork(server, worker):
+    import app
+
+    app.start_workers()
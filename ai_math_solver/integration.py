@@ -0,0 +1,253 @@
+"""
+Budgeted integration
+Antiderivatives are tried from the cheapest method up: a table of standard
+integrals, the power rule for polynomials, partial fractions for rational
+functions, textbook parts and trig substitutions, manualintegrate under a
+share of the budget, and only then sp.integrate
+(Risch, heurisch, Meijer G) with whatever is left of the overall budget.
+Definite integrals fall back to vectorized Gauss-Legendre quadrature when the
+symbolic route fails or runs out of time.
+"""
+
+import numpy as np
+import sympy as sp
+from sympy.integrals import manualintegrate as manual_rules
+from sympy.integrals.manualintegrate import manualintegrate
+from sympy.integrals.rationaltools import ratint
+
+import config
+import polynomial
+from budget import BudgetExceeded, Deadline, time_limit
+from sampling import evaluate
+
+DESCRIPTIONS = {
+    'table': 'table of standard integrals',
+    'polynomial': 'power rule, term by term',
+    'rational': 'partial fractions',
+    'parts': 'integration by parts with the polynomial factor',
+    'substitution': 'substitution u = sin or cos (after halving even powers), turning the trig powers into a polynomial',
+    'manual': 'integration rules (substitution, parts, special functions)',
+    'full': 'Risch, heuristic and Meijer G algorithms',
+    'numeric': 'Gauss-Legendre quadrature',
+    'budget_exhausted': 'none succeeded within the time budget',
+}
+
+# Antiderivatives of f(u) in u; applied to f(a*x + b) and divided by a
+TABLE = {
+    sp.sin: lambda u: -sp.cos(u),
+    sp.cos: sp.sin,
+    sp.tan: lambda u: -sp.log(sp.cos(u)),
+    sp.exp: sp.exp,
+    sp.sinh: sp.cosh,
+    sp.cosh: sp.sinh,
+    sp.log: lambda u: u * sp.log(u) - u,
+    sp.atan: lambda u: u * sp.atan(u) - sp.log(u**2 + 1) / 2,
+}
+
+_NODES, _WEIGHTS = np.polynomial.legendre.leggauss(16)
+
+
+def table_lookup(expr, x):
+    """c*f(a*x + b) for f in TABLE, or c/(a*x + b)"""
+    coeff, term = expr.as_independent(x, as_Add=False)
+    if term.func in TABLE and len(term.args) == 1:
+        u, antiderivative = term.args[0], TABLE[term.func]
+    elif term.is_Pow and term.exp == -1:
+        u, antiderivative = term.base, sp.log
+    else:
+        return None
+    if not (u.is_polynomial(x) and sp.degree(u, x) == 1):
+        return None
+    return coeff * antiderivative(u) / u.diff(x)
+
+
+def _polynomial(expr, x):
+    if polynomial.classify(expr, (x,)) == polynomial.POLYNOMIAL:
+        return sp.Poly(expr, x).integrate().as_expr()
+    return None
+
+
+def _rational(expr, x):
+    if polynomial.classify(expr, (x,)) == polynomial.RATIONAL:
+        return ratint(expr, x)
+    return None
+
+
+# Integrated by parts against a polynomial p(x): differentiating p while integrating these
+# through TABLE, or integrating p while differentiating these into a rational function
+_REPEATED = (sp.exp, sp.sin, sp.cos, sp.sinh, sp.cosh)
+_REDUCED = (sp.log, sp.atan)
+
+
+def _parts(expr, x):
+    """p(x)*f(a*x + b) for f in _REPEATED, or p(x)*g(a*x + b) for g in _REDUCED"""
+    p, term = expr.as_independent(*[f for f in expr.atoms(sp.Function)], as_Add=False)
+    if term.func not in _REPEATED + _REDUCED or not p.has(x) or not p.is_polynomial(x):
+        return None
+    u = term.args[0]
+    if not (u.is_polynomial(x) and sp.degree(u, x) == 1):
+        return None
+    if term.func in _REDUCED:
+        # ∫p·g = P·g - ∫P·g', the last a rational function
+        P = sp.Poly(p, x).integrate().as_expr()
+        rest = sp.cancel(P * term.diff(x))
+        return P * term - (_polynomial(rest, x) if rest.is_polynomial(x) else ratint(rest, x))
+    # ∫p·f = p·F1 - p'·F2 + p''·F3 - ..., F(k+1) the antiderivative of Fk
+    result, derivative, antiderivative, sign = 0, p, term, 1
+    while derivative != 0:
+        antiderivative = table_lookup(antiderivative, x)
+        result += sign * derivative * antiderivative
+        derivative, sign = derivative.diff(x), -sign
+    return result
+
+
+def _substitution(expr, x):
+    """sin(u)**m*cos(u)**n, u = a*x + b: substitute the function with the even power, or halve even powers"""
+    coeff, term = expr.as_independent(x, as_Add=False)
+    powers = {}
+    for factor in sp.Mul.make_args(term):
+        base, exp = factor.as_base_exp()
+        if base.func not in (sp.sin, sp.cos) or not (exp.is_Integer and exp > 0) or base.func in powers:
+            return None
+        powers[base.func] = (base.args[0], int(exp))
+    u = {arg for arg, _ in powers.values()}
+    if len(u) != 1:
+        return None
+    u, = u
+    if not (u.is_polynomial(x) and sp.degree(u, x) == 1):
+        return None
+    m, n = powers.get(sp.sin, (u, 0))[1], powers.get(sp.cos, (u, 0))[1]
+    t = sp.Dummy('t')
+    if m % 2:
+        # sin^m·cos^n du = -(1 - t²)^((m-1)/2)·t^n dt with t = cos(u)
+        integrand, back, sign = (1 - t**2)**(m // 2) * t**n, sp.cos(u), -1
+    elif n % 2:
+        integrand, back, sign = t**m * (1 - t**2)**(n // 2), sp.sin(u), 1
+    else:
+        # Both even: halve the powers with sin² = (1 - cos 2u)/2 and cos² = (1 + cos 2u)/2
+        reduced = sp.expand(((1 - sp.cos(2 * u)) / 2)**(m // 2) * ((1 + sp.cos(2 * u)) / 2)**(n // 2))
+        parts = []
+        for term in sp.Add.make_args(reduced):
+            part = _substitution(term, x) if term.has(x) else term * x
+            if part is None:
+                return None
+            parts.append(part)
+        return coeff * sp.Add(*parts)
+    antiderivative = sp.Poly(sp.expand(integrand), t).integrate().as_expr()
+    return coeff * sign * antiderivative.subs(t, back) / u.diff(x)
+
+
+# (stage, method, share of the overall budget or None) in the order they are tried
+CHEAP_METHODS = (
+    ('table', table_lookup, None),
+    ('polynomial', _polynomial, None),
+    ('rational', _rational, None),
+    ('parts', _parts, None),
+    ('substitution', _substitution, None),
+    ('manual', manualintegrate, config.INTEGRATE_MANUAL_SHARE),
+)
+
+
+def symbolic_budget(budget=None):
+    """Seconds for the symbolic methods, leaving room for quadrature before the worker times out"""
+    budget = config.INTEGRATE_BUDGET if budget is None else budget
+    return max(0.0, min(budget, config.timeout_for('integrate') - config.INTEGRATE_QUADRATURE_MARGIN))
+
+
+def reset_manual_rules():
+    """
+    manualintegrate marks integrands in progress in module-level dicts; an
+    interrupted search leaves the marks behind, and later searches for the same
+    integrand give up at once
+    """
+    manual_rules._integral_cache.clear()
+    manual_rules._parts_u_cache.clear()
+
+
+def _found(result):
+    return result is not None and not result.has(sp.Integral)
+
+
+def antiderivative(expr, x, budget=None):
+    """Returns (F, stage); F is an unevaluated Integral if nothing succeeded in time"""
+    budget = symbolic_budget(budget)
+    deadline = Deadline(budget)
+    for name, method, share in CHEAP_METHODS:
+        seconds = deadline.remaining() if share is None else min(share * budget, deadline.remaining())
+        try:
+            with time_limit(seconds):
+                result = method(expr, x)
+        except Exception:
+            # A cheap method failing or running out of time just means escalating
+            if method is manualintegrate:
+                reset_manual_rules()
+            continue
+        if _found(result):
+            return result, name
+    try:
+        with time_limit(deadline.remaining()):
+            return sp.integrate(expr, x), 'full'
+    except BudgetExceeded:
+        return sp.Integral(expr, x), 'budget_exhausted'
+
+
+def _finite_interval(f, a, b):
+    """Map an infinite interval onto a finite one; returns (g, lo, hi) with the same integral"""
+    if np.isfinite(a) and np.isfinite(b):
+        return f, a, b
+    if np.isfinite(a):
+        return (lambda t: f(a + t / (1 - t)) / (1 - t)**2), 0.0, 1.0
+    if np.isfinite(b):
+        return (lambda t: f(b - (1 - t) / t) / t**2), 0.0, 1.0
+    return (lambda t: f(t / (1 - t**2)) * (1 + t**2) / (1 - t**2)**2), -1.0, 1.0
+
+
+def quadrature(f, a, b, tolerance=1e-10, max_panels=4096):
+    """
+    Composite Gauss-Legendre rule, doubling the number of panels until two
+    estimates agree; every round is a single vectorized call of f.
+    Returns (value, error_estimate).
+    """
+    sign = 1.0
+    if a > b:
+        a, b, sign = b, a, -1.0
+    g, lo, hi = _finite_interval(f, a, b)
+    previous = None
+    panels = 4
+    while True:
+        edges = np.linspace(lo, hi, panels + 1)
+        half = np.diff(edges) / 2
+        nodes = (edges[:-1] + half)[:, None] + half[:, None] * _NODES
+        values = evaluate(g, nodes.ravel()).reshape(nodes.shape)
+        if np.isnan(values).any():
+            raise ValueError('The integrand is not finite on the interval')
+        estimate = float(np.sum(half * (values @ _WEIGHTS)))
+        if previous is not None:
+            error = abs(estimate - previous)
+            if error <= tolerance * max(1.0, abs(estimate)) or panels >= max_panels:
+                return sign * estimate, error
+        previous = estimate
+        panels *= 2
+
+
+def definite(expr, x, a, b, budget=None):
+    """Returns (value, stage, error_estimate); the estimate is None for exact values"""
+    deadline = Deadline(symbolic_budget(budget))
+    if a.is_finite and b.is_finite:
+        F = _polynomial(expr, x)
+        if F is not None:
+            return F.subs(x, b) - F.subs(x, a), 'polynomial', None
+    try:
+        with time_limit(deadline.remaining()):
+            value = sp.integrate(expr, (x, a, b))
+        if not value.has(sp.Integral):
+            return value, 'full', None
+    except Exception:
+        # Out of time, or SymPy failed on the integrand: quadrature does not depend on either
+        reset_manual_rules()
+
+    if expr.free_symbols - {x}:
+        raise ValueError('Numeric integration needs an integrand in x alone')
+    f = sp.lambdify(x, expr, 'numpy')
+    value, error = quadrature(f, float(a), float(b))
+    return sp.Float(value, 15), 'numeric', error
@@ -0,0 +1,381 @@
+"""
+Matrix operations
+Determinant, inverse, rank, RREF and eigenvalues with two backends. Integer
+and rational matrices are exact: DomainMatrix over ZZ/QQ with fraction-free
+elimination, and determinants of larger integer matrices are taken modulo
+word-size primes in NumPy and recombined with the Chinese remainder theorem.
+Floating-point entries, and in auto mode matrices too large for exact
+arithmetic, go through NumPy/LAPACK. The mode option (auto, exact, numeric)
+overrides the choice.
+"""
+
+import math
+import re
+from fractions import Fraction
+
+import numpy as np
+import sympy as sp
+from sympy import default_sort_key
+from sympy.ntheory import prevprime
+from sympy.polys.domains import QQ, ZZ
+from sympy.polys.matrices import DomainMatrix
+from sympy.polys.matrices.exceptions import DMNonInvertibleMatrixError
+
+import config
+from parsing import parse
+from polynomial import to_number
+
+OPERATIONS = {
+    'det': 'det', 'determinant': 'det',
+    'inverse': 'inverse', 'inv': 'inverse',
+    'rank': 'rank',
+    'rref': 'rref',
+    'eigenvalues': 'eigenvalues', 'eigenvals': 'eigenvalues', 'eig': 'eigenvalues',
+}
+MODES = ('auto', 'exact', 'numeric')
+SQUARE_ONLY = ('det', 'inverse', 'eigenvalues')
+
+DESCRIPTIONS = {
+    ('det', 'exact'): 'Fraction-free (Bareiss) elimination over the integers',
+    ('det', 'modular'): 'Determinant modulo word-size primes, recombined with the Chinese remainder theorem',
+    ('det', 'numeric'): 'LU factorization in floating point',
+    ('inverse', 'exact'): 'Fraction-free Gauss-Jordan elimination, then divide by the common denominator',
+    ('inverse', 'numeric'): 'LU factorization in floating point',
+    ('rank', 'exact'): 'Count the pivots of the exact row echelon form',
+    ('rank', 'numeric'): 'Count the singular values above the rounding tolerance',
+    ('rref', 'exact'): 'Gauss-Jordan elimination over the rationals',
+    ('rref', 'numeric'): 'Gauss-Jordan elimination with partial pivoting in floating point',
+    ('eigenvalues', 'exact'): 'Roots of the characteristic polynomial',
+    ('eigenvalues', 'numeric'): 'QR algorithm in floating point',
+}
+
+# Below this size Bareiss on DomainMatrix beats the modular determinant
+MODULAR_MIN_DIM = 20
+
+_OPERATION = re.compile(r'\s*([A-Za-z]+)\s*(.*)$', re.S)
+_NESTED = re.compile(r'\[\s*\[')
+_ROW = re.compile(r'\[([^\[\]]*)\]')
+_INTEGER = re.compile(r'[+-]?\d+$')
+_FRACTION = re.compile(r'([+-]?\d+)/(\d+)$')
+_DECIMAL = re.compile(r'[+-]?(?:\d+\.\d*|\.\d+|\d+(?=[eE]))(?:[eE][+-]?\d+)?$')
+
+
+def _split_entries(row):
+    """Entries separated by commas outside parentheses, or by whitespace when there are no commas"""
+    if '(' not in row:
+        parts = row.split(',')
+    else:
+        parts, depth, start = [], 0, 0
+        for i, ch in enumerate(row):
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            elif ch == ',' and depth == 0:
+                parts.append(row[start:i])
+                start = i + 1
+        parts.append(row[start:])
+    return row.split() if len(parts) == 1 else parts
+
+
+def _entry(text):
+    """int, Fraction or float for plain numbers (the common case, no SymPy parsing), else a SymPy expression"""
+    text = text.strip()
+    if not text:
+        raise ValueError('Empty matrix entry')
+    if _INTEGER.match(text):
+        return int(text)
+    match = _FRACTION.match(text)
+    if match:
+        if match[2].strip('0') == '':
+            raise ValueError(f'Division by zero in matrix entry {text!r}')
+        value = Fraction(int(match[1]), int(match[2]))
+        return value.numerator if value.denominator == 1 else value
+    if _DECIMAL.match(text):
+        return float(text)
+    value = parse(text)
+    if value.is_Rational:
+        return int(value.p) if value.q == 1 else Fraction(int(value.p), int(value.q))
+    if value.is_Float:
+        return float(value)
+    return value
+
+
+def parse_matrix(text):
+    """
+    (operation or None, rows) from input like "det([[1, 2], [3, 4]])",
+    "rank [1 2; 3 4]" or one row per line
+    """
+    operation = None
+    match = _OPERATION.match(text)
+    if match and match[1].lower() in OPERATIONS:
+        operation = OPERATIONS[match[1].lower()]
+        text = match[2].strip()
+        if text.startswith('(') and text.endswith(')'):
+            text = text[1:-1]
+    text = text.strip()
+    if _NESTED.match(text):
+        if not text.endswith(']'):
+            raise ValueError('Unbalanced brackets in the matrix')
+        body = text[1:-1]
+        if _ROW.sub('', body).strip(' ,\t\r\n'):
+            raise ValueError('Write the matrix as [[a, b], [c, d]] or [a b; c d]')
+        lines = _ROW.findall(body)
+    else:
+        if text.startswith('[') and text.endswith(']'):
+            text = text[1:-1]
+        lines = [line for line in re.split(r'[;\n]', text) if line.strip()]
+    if not lines:
+        raise ValueError('Enter a matrix, e.g. [[1, 2], [3, 4]]')
+    split = [_split_entries(line) for line in lines]
+    width = len(split[0])
+    if any(len(row) != width for row in split):
+        raise ValueError('Every row of the matrix must have the same number of entries')
+    if len(split) * width > config.MATRIX_MAX_ENTRIES:
+        raise ValueError(f'Matrices are limited to {config.MATRIX_MAX_ENTRIES} entries')
+    return operation, tuple(tuple(_entry(e) for e in row) for row in split)
+
+
+def operation_for(operation, rows, option=None):
+    """The operation written in the input, else the requested one, else det (square) or rref"""
+    operation = operation or option
+    if operation is None:
+        return 'det' if len(rows) == len(rows[0]) else 'rref'
+    if operation not in OPERATIONS:
+        raise ValueError(f'Unknown matrix operation {operation!r}; use one of {", ".join(sorted(set(OPERATIONS.values())))}')
+    operation = OPERATIONS[operation]
+    if operation in SQUARE_ONLY and len(rows) != len(rows[0]):
+        raise ValueError(f'{operation} needs a square matrix, this one is {len(rows)}×{len(rows[0])}')
+    return operation
+
+
+def _symbolic(value):
+    return isinstance(value, sp.Basic)
+
+
+def backend_for(operation, rows, mode=None):
+    """'exact' or 'numeric'; auto picks numeric for float entries or matrices past the exact size limits"""
+    mode = mode or 'auto'
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {", ".join(MODES)}')
+    if mode == 'numeric' and any(_symbolic(v) and v.free_symbols for row in rows for v in row):
+        raise ValueError('Numeric mode needs numeric entries, this matrix has symbols')
+    if mode != 'auto':
+        return mode
+    if any(isinstance(v, float) for row in rows for v in row):
+        return 'numeric'
+    if any(_symbolic(v) for row in rows for v in row):
+        return 'exact'
+    limit = {'det': config.MATRIX_EXACT_DET_MAX_DIM,
+             'eigenvalues': config.POLY_NUMERIC_DEGREE}.get(operation, config.MATRIX_EXACT_MAX_DIM)
+    return 'exact' if max(len(rows), len(rows[0])) <= limit else 'numeric'
+
+
+def _domain_matrix(rows):
+    shape = (len(rows), len(rows[0]))
+    if all(type(v) is int for row in rows for v in row):
+        return DomainMatrix([[ZZ(v) for v in row] for row in rows], shape, ZZ)
+    if not any(_symbolic(v) for row in rows for v in row):
+        return DomainMatrix([[QQ(v.numerator, v.denominator) for v in row] for row in rows], shape, QQ)
+    return DomainMatrix.from_list_sympy(*shape, [[sp.sympify(v) for v in row] for row in rows])
+
+
+def _exact_rows(rows):
+    """Floats read as the decimals they were written as (0.1 is 1/10)"""
+    return [[Fraction(repr(v)) if isinstance(v, float) else v for v in row] for row in rows]
+
+
+def _primes(bits):
+    """Primes below 2**31 whose product has at least bits bits"""
+    primes, p, total = [], 2**31, 0
+    while total < bits:
+        p = prevprime(p)
+        primes.append(p)
+        total += math.log2(p)
+    return primes
+
+
+def det_modular(rows):
+    """
+    Determinant of an integer matrix from its residues modulo enough primes to
+    cover the Hadamard bound, eliminating modulo all the primes at once
+    """
+    n = len(rows)
+    bound = sum(math.log2(math.isqrt(sum(v * v for v in row)) + 1) for row in rows) + 2
+    primes = np.array(_primes(bound), dtype=np.int64)
+    p = primes[:, None]
+    if all(abs(v) < 2**62 for row in rows for v in row):
+        a = np.array(rows, dtype=np.int64)[None, :, :] % primes[:, None, None]
+    else:
+        big = np.array(rows, dtype=object)
+        a = np.stack([(big % int(q)).astype(np.int64) for q in primes])
+    each = np.arange(len(primes))
+    det = np.ones(len(primes), dtype=np.int64)
+    for i in range(n):
+        nonzero = a[:, i:, i] != 0
+        det[~nonzero.any(axis=1)] = 0
+        pivot = i + nonzero.argmax(axis=1)
+        swapped = pivot != i
+        if swapped.any():
+            top = a[each, i].copy()
+            a[each, i] = a[each, pivot]
+            a[each, pivot] = top
+            det[swapped] = (primes[swapped] - det[swapped]) % primes[swapped]
+        pivots = a[:, i, i]
+        det = det * pivots % primes
+        inverses = np.array([pow(int(x), -1, int(q)) if x else 0 for x, q in zip(pivots, primes)], dtype=np.int64)
+        factors = (p - a[:, i + 1:, i]) % p * inverses[:, None] % p
+        # Residues stay below 2**31, so row + factor * pivot row fits in int64 before the reduction
+        a[:, i + 1:, i:] = (a[:, i + 1:, i:] + factors[:, :, None] * a[:, i, None, i:]) % p[:, :, None]
+    result, modulus = 0, 1
+    for d, q in zip(det.tolist(), primes.tolist()):
+        result += modulus * ((d - result) * pow(modulus, -1, q) % q)
+        modulus *= q
+    return result - modulus if result > modulus // 2 else result
+
+
+def _det_exact(rows):
+    if any(_symbolic(v) for row in rows for v in row):
+        matrix = _domain_matrix(rows)
+        return matrix.domain.to_sympy(matrix.det()), 'exact'
+    # Scale each row to integers; the determinant scales by the same factors
+    integers, scale = [], 1
+    for row in rows:
+        denominator = math.lcm(*(v.denominator for v in row))
+        integers.append([int(v * denominator) for v in row])
+        scale *= denominator
+    if len(rows) < MODULAR_MIN_DIM:
+        det, method = _domain_matrix(integers).det(), 'exact'
+    else:
+        det, method = det_modular(integers), 'modular'
+    return sp.Rational(int(det), scale), method
+
+
+def _to_sympy_rows(matrix):
+    to_sympy = matrix.domain.to_sympy
+    return [[to_sympy(v) for v in row] for row in matrix.to_list()]
+
+
+def _eigenvalues_exact(rows):
+    matrix = _domain_matrix(rows)
+    lam = sp.Symbol('lambda')
+    poly = sp.Poly([matrix.domain.to_sympy(c) for c in matrix.charpoly()], lam)
+    if poly.degree() <= config.POLY_EXACT_MAX_DEGREE:
+        found = sp.roots(poly)
+        if sum(found.values()) == poly.degree():
+            return sorted((root for root, k in found.items() for _ in range(k)), key=default_sort_key), 'exact'
+    if any(_symbolic(v) and v.free_symbols for row in rows for v in row):
+        raise ValueError(f'The eigenvalues have no closed form; they are the roots of {poly.as_expr()}')
+    return _eigenvalues_numeric(_float_array(rows)), 'numeric'
+
+
+def _exact(operation, rows):
+    rows = _exact_rows(rows)
+    if operation == 'det':
+        return _det_exact(rows)
+    if operation == 'eigenvalues':
+        return _eigenvalues_exact(rows)
+    matrix = _domain_matrix(rows)
+    if operation == 'rank':
+        return sp.Integer(matrix.rank()), 'exact'
+    if operation == 'rref':
+        reduced, _ = matrix.to_field().rref()
+        return _to_sympy_rows(reduced), 'exact'
+    try:
+        inverse, denominator = matrix.inv_den()
+    except DMNonInvertibleMatrixError:
+        return None, 'exact'
+    denominator = matrix.domain.to_sympy(denominator)
+    return [[v / denominator for v in row] for row in _to_sympy_rows(inverse)], 'exact'
+
+
+def _float_array(rows):
+    try:
+        return np.array(rows, dtype=float)
+    except TypeError:
+        # Complex constants such as I
+        return np.array([[complex(v) for v in row] for row in rows])
+    except OverflowError:
+        raise ValueError('Matrix entries are too large for floating point, use mode "exact"')
+
+
+def _numbers(values):
+    return [to_number(complex(v)) for v in values]
+
+
+def _det_numeric(a):
+    sign, logdet = np.linalg.slogdet(a)
+    if sign == 0:
+        return sp.Integer(0)
+    if abs(logdet) < 700:
+        return to_number(complex(sign * np.exp(logdet)))
+    # Past the float range: sign * mantissa * 10**exponent
+    exponent = math.floor(logdet / math.log(10))
+    mantissa = complex(sign) * 10 ** (logdet / math.log(10) - exponent)
+    return to_number(mantissa) * sp.Pow(10, exponent, evaluate=False)
+
+
+def rref_numeric(a):
+    """Reduced row echelon form with partial pivoting; entries below the rounding tolerance count as zero"""
+    a = np.array(a, dtype=np.result_type(a, float))
+    m, n = a.shape
+    tol = max(m, n) * np.finfo(float).eps * (np.abs(a).max() if a.size else 0)
+    r = 0
+    for j in range(n):
+        if r == m:
+            break
+        p = r + np.argmax(np.abs(a[r:, j]))
+        if abs(a[p, j]) <= tol:
+            a[r:, j] = 0
+            continue
+        a[[r, p]] = a[[p, r]]
+        a[r] /= a[r, j]
+        others = np.arange(m) != r
+        a[others] -= np.outer(a[others, j], a[r])
+        r += 1
+    a[np.abs(a) <= tol] = 0
+    return a
+
+
+def _eigenvalues_numeric(a):
+    return sorted(_numbers(np.linalg.eigvals(a)), key=lambda z: (sp.re(z), sp.im(z)))
+
+
+def _numeric(operation, rows):
+    a = _float_array(rows)
+    if operation == 'det':
+        return _det_numeric(a)
+    if operation == 'rank':
+        return sp.Integer(int(np.linalg.matrix_rank(a)))
+    if operation == 'eigenvalues':
+        return _eigenvalues_numeric(a)
+    if operation == 'rref':
+        return [_numbers(row) for row in rref_numeric(a)]
+    if np.linalg.matrix_rank(a) < len(a):
+        return None
+    return [_numbers(row) for row in np.linalg.inv(a)]
+
+
+def solve(operation, rows, backend):
+    """
+    (value, method): a number for det and rank, a list of rows for inverse
+    (None when singular) and rref, a sorted list with multiplicities for
+    eigenvalues. method keys DESCRIPTIONS together with the operation.
+    """
+    if backend == 'numeric':
+        return _numeric(operation, rows), 'numeric'
+    return _exact(operation, rows)
+
+
+def format_matrix(rows):
+    return '[' + ', '.join('[' + ', '.join(map(str, row)) + ']' for row in rows) + ']'
+
+
+def format_value(operation, value):
+    if operation == 'inverse' and value is None:
+        return 'The matrix is singular (determinant 0), it has no inverse'
+    if operation in ('inverse', 'rref'):
+        return format_matrix(value)
+    if operation == 'eigenvalues':
+        return '[' + ', '.join(map(str, value)) + ']'
+    return str(value)
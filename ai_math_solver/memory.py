@@ -0,0 +1,36 @@
+"""
+Memory governance for solver processes
+SymPy memoizes heavily in its global cacheit caches; bounding them
+(SYMPY_CACHE_SIZE, see config) and emptying them every few hundred tasks keeps
+a long-lived worker from growing without limit. Workers that grow anyway are
+recycled by the pool.
+"""
+
+import gc
+import threading
+
+import config
+
+_lock = threading.Lock()
+_tasks = 0
+clears = 0
+
+
+def clear_caches():
+    """Empty SymPy's caches and collect the cycles they were keeping alive"""
+    global clears
+    from sympy.core.cache import clear_cache
+
+    clear_cache()
+    gc.collect()
+    clears += 1
+
+
+def maintenance():
+    """Run after every task; clears the caches every CLEAR_CACHE_EVERY tasks"""
+    global _tasks
+    with _lock:
+        _tasks += 1
+        due = config.CLEAR_CACHE_EVERY and _tasks % config.CLEAR_CACHE_EVERY == 0
+    if due:
+        clear_caches()
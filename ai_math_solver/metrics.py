@@ -0,0 +1,169 @@
+"""
+Minimal Prometheus instrumentation
+Counters and histograms are plain dicts behind one lock each, so recording a
+sample costs a dict lookup and a bisect. Stage timings measured inside a
+worker process are collected per task and shipped back with the result.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_local = threading.local()
+# Thread id -> the stage it is in, readable from other threads (the sampling profiler)
+_current_stage = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def format_header(name, kind, help_text):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+
+
+def format_sample(name, labels, value):
+    value = value if isinstance(value, int) else repr(float(value))
+    return f'{name}{format_labels(labels)} {value}'
+
+
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = format_header(self.name, self.kind, self.help)
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(format_sample(self.name, zip(self.labelnames, key), value))
+        return lines
+
+
+class Gauge(Counter):
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = format_header(self.name, self.kind, self.help)
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(format_sample(self.name + '_bucket', labels + [('le', le)], cumulative))
+            lines.append(format_sample(self.name + '_sum', labels, total))
+            lines.append(format_sample(self.name + '_count', labels, count))
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return lines
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current task (no-op outside collect_stages)"""
+    started = time.perf_counter()
+    thread_id = threading.get_ident()
+    outer = _current_stage.get(thread_id)
+    _current_stage[thread_id] = name
+    try:
+        yield
+    finally:
+        if outer is None:
+            _current_stage.pop(thread_id, None)
+        else:
+            _current_stage[thread_id] = outer
+        timings = getattr(_local, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def current_stage(thread_id):
+    return _current_stage.get(thread_id)
+
+
+@contextmanager
+def collect_stages():
+    """Collect the stage timings recorded by this thread within the block"""
+    previous = getattr(_local, 'timings', None)
+    _local.timings = timings = {}
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+REQUEST_SECONDS = Histogram('math_solver_request_seconds', 'End-to-end /solve latency', ('problem_type',))
+STAGE_SECONDS = Histogram('math_solver_stage_seconds',
+                          'Time per stage: parse, compute, format, render (plot drawing), encode (PNG)',
+                          ('problem_type', 'stage'))
+FIRST_STEP_SECONDS = Histogram('math_solver_first_step_seconds', 'Time from request to the first step sent by /solve/stream',
+                               ('problem_type',))
+ERRORS = Counter('math_solver_errors_total', 'Failed solves by kind', ('problem_type', 'kind'))
+DOWNGRADES = Counter('math_solver_downgrades_total', 'Solves given a reduced time budget because the input is large', ('problem_type',))
+PROFILES = Counter('math_solver_profiles_total', 'Stored request profiles by how they were triggered', ('problem_type', 'trigger'))
+IN_FLIGHT = Gauge('math_solver_in_flight_requests', 'Requests currently being handled', ('problem_type',))
@@ -0,0 +1,129 @@
+"""
+Output stage
+Results become text here, and large ones are kept from dominating the
+response. A result of more than OUTPUT_CSE_NODES expression nodes (counted
+without printing it) is reported as shared subexpressions from sp.cse plus a
+final expression in them, when that makes it notably smaller. Text is cut at
+OUTPUT_MAX_CHARS, with what was cut recorded under 'truncated'; a long sum
+is printed term by term only as far as it is shown. LaTeX, MathML and srepr
+are only produced when the request lists them in 'formats'.
+"""
+
+import sympy as sp
+
+import config
+
+# sp.cse is kept when it removes at least this share of the nodes
+CSE_MIN_SAVING = 0.25
+
+
+def _mathml(value):
+    return sp.mathml(sp.Tuple(*value) if isinstance(value, list) else value, printer='presentation')
+
+
+FORMATS = {
+    'latex': sp.latex,
+    'mathml': _mathml,
+    'srepr': sp.srepr,
+}
+
+
+def requested_formats(options):
+    """The extra formats asked for, as a list or a comma-separated string"""
+    formats = options.get('formats') or ()
+    if isinstance(formats, str):
+        formats = formats.split(',')
+    formats = sorted({f.strip() for f in formats if f.strip()})
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise ValueError(f'Unknown output format {unknown[0]!r}; use {", ".join(FORMATS)}')
+    return formats
+
+
+def _nodes(values, limit=None):
+    """Expression tree nodes in values, counting stopped once past limit"""
+    nodes = 0
+    for value in values:
+        if not isinstance(value, sp.Basic):
+            nodes += 1
+            continue
+        for _ in sp.preorder_traversal(value):
+            nodes += 1
+            if limit is not None and nodes > limit:
+                return nodes
+    return nodes
+
+
+def _truncated(result_data, field, shown, total):
+    result_data.setdefault('truncated', {})[field] = {'shown': shown, 'total': total}
+
+
+def cap(text, field, result_data):
+    """text cut to OUTPUT_MAX_CHARS, noting the cut in result_data['truncated'][field]"""
+    if len(text) <= config.OUTPUT_MAX_CHARS:
+        return text
+    _truncated(result_data, field, config.OUTPUT_MAX_CHARS, len(text))
+    return text[:config.OUTPUT_MAX_CHARS] + '…'
+
+
+def _text(value, field, result_data):
+    """str(value) through cap, except that a sum too long to show in full is only printed as far as it is shown"""
+    if not (isinstance(value, sp.Add) and len(value.args) * 4 > config.OUTPUT_MAX_CHARS):
+        return cap(str(value), field, result_data)
+    terms = value.as_ordered_terms()
+    parts, length = [], 0
+    for term in terms:
+        text = str(term)
+        if parts:
+            text = ' - ' + text[1:] if text.startswith('-') else ' + ' + text
+        parts.append(text)
+        length += len(text)
+        if length > config.OUTPUT_MAX_CHARS:
+            break
+    if len(parts) == len(terms):
+        return cap(''.join(parts), field, result_data)
+    result_data.setdefault('truncated', {})[field] = {'shown_terms': len(parts) - 1, 'terms': len(terms)}
+    return ''.join(parts[:-1]) + ' + …'
+
+
+def _formats(value, formats, field, result_data):
+    return {name: cap(FORMATS[name](value), f'{field}.{name}', result_data) for name in formats}
+
+
+def _shared(values, result_data, formats):
+    """values rewritten in shared subexpressions, listed in result_data; None if that saves too little"""
+    nodes = _nodes(values, config.OUTPUT_CSE_MAX_NODES)
+    if nodes <= config.OUTPUT_CSE_NODES or nodes > config.OUTPUT_CSE_MAX_NODES:
+        return None
+    replacements, reduced = sp.cse(values, symbols=sp.numbered_symbols('s'))
+    if _nodes(reduced + [expr for _, expr in replacements]) > nodes * (1 - CSE_MIN_SAVING):
+        return None
+    subexpressions, chars = [], 0
+    for i, (symbol, expr) in enumerate(replacements):
+        if chars > config.OUTPUT_MAX_CHARS:
+            # The rest would only be cut as well
+            _truncated(result_data, 'subexpressions', i, len(replacements))
+            break
+        entry = {'name': str(symbol), 'value': _text(expr, f'subexpressions.{i}', result_data)}
+        entry.update(_formats(expr, formats, f'subexpressions.{i}', result_data))
+        chars += len(entry['value'])
+        subexpressions.append(entry)
+    result_data['subexpressions'] = subexpressions
+    return reduced
+
+
+def render(value, result_data, formats=()):
+    """
+    Text for value (a SymPy object or a list of them), adding 'subexpressions',
+    'formats' and 'truncated' to result_data when they apply
+    """
+    many = isinstance(value, (list, tuple))
+    values = list(value) if many else [value]
+    reduced = _shared(values, result_data, formats)
+    if reduced is not None:
+        value = reduced if many else reduced[0]
+    if formats:
+        result_data['formats'] = _formats(value, formats, 'formats', result_data)
+    if many:
+        return cap(str(list(value)), 'result', result_data)
+    return _text(value, 'result', result_data)
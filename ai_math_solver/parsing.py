@@ -0,0 +1,77 @@
+"""
+Parser front-end
+The transformation chain and the SymPy namespace are built once at import
+instead of on every parse_expr call, and parsed expressions are memoized on
+the whitespace-normalized input (SymPy expressions are immutable, so sharing
+them between requests is safe). Parsing runs on the request thread, outside
+the worker pool's limits, so the generated code only sees classes that build
+expressions and the complexity guard checks the raw text and that code before
+it is evaluated.
+"""
+
+from functools import lru_cache
+
+import sympy
+from sympy import Basic, Max, Min
+from sympy.parsing.sympy_parser import (eval_expr, stringify_expr, standard_transformations,
+                                        implicit_multiplication_application, convert_xor)
+
+import complexity
+import config
+
+# convert_xor lets "x^2" mean the same thing as "x**2"
+TRANSFORMATIONS = standard_transformations + (convert_xor, implicit_multiplication_application)
+
+# Packages whose classes only build expressions: constructing one never integrates, expands or solves
+EXPRESSION_PACKAGES = ('core', 'functions', 'integrals', 'series', 'concrete')
+
+# Plain functions that build expressions; sqrt(x) is just Pow(x, 1/2)
+HELPERS = ('sqrt', 'root', 'cbrt', 'real_root')
+
+
+def _expression_namespace(everything):
+    """
+    What parsed code can see: SymPy's constants, its expression classes and a
+    few helpers, but none of the functions that do the work (expand, integrate,
+    solve, factorint, N, ...) and no Python builtins besides abs, max and min.
+    """
+    namespace = {'__builtins__': {}, 'abs': abs, 'max': Max, 'min': Min}
+    for name, obj in everything.items():
+        if isinstance(obj, Basic) or name in HELPERS:
+            namespace[name] = obj
+        elif (isinstance(obj, type) and issubclass(obj, Basic) and obj is not sympy.AlgebraicNumber
+              and obj.__module__.split('.')[1] in EXPRESSION_PACKAGES):
+            namespace[name] = obj
+    return namespace
+
+
+_SYMPY = {}
+exec('from sympy import *', _SYMPY)
+_GLOBAL_DICT = _expression_namespace(_SYMPY)
+# Calling one of these is rejected rather than parsed as a product of single-letter symbols
+_WITHHELD = frozenset(name for name, obj in _SYMPY.items() if callable(obj) and name not in _GLOBAL_DICT)
+
+
+def normalize(text):
+    """Collapse runs of whitespace so trivially different inputs share a cache entry"""
+    return ' '.join(text.split())
+
+
+@lru_cache(maxsize=config.PARSE_CACHE_SIZE)
+def _parse_normalized(text):
+    # parse_expr split in two so the generated code is checked before it runs
+    complexity.check_text(text)
+    complexity.check_calls(text, _WITHHELD)
+    code = stringify_expr(text, {}, _GLOBAL_DICT, TRANSFORMATIONS)
+    code = complexity.check_code(code)
+    return eval_expr(compile(code, '<string>', 'eval'), {}, _GLOBAL_DICT)
+
+
+def parse(text):
+    """Parse user input into a SymPy expression"""
+    return _parse_normalized(normalize(text))
+
+
+def stats():
+    info = _parse_normalized.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
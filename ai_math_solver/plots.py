@@ -0,0 +1,201 @@
+"""
+Plot problems
+A plot is one or more functions y = f(x) over a shared x range, parametric
+curves (x(t), y(t)), implicit curves F(x, y) = 0, or a surface z = f(x, y).
+Items are separated by ';' or new lines and the ranges follow after commas.
+Every expression is lambdified once (through the evaluation LRU); implicit
+curves and surfaces are evaluated on a resolution × resolution grid in
+chunks, and what gets drawn is thinned to PLOT_RENDER_POINTS per curve or
+PLOT_SURFACE_SIZE blocks per axis.
+"""
+
+import re
+
+import numpy as np
+import sympy as sp
+
+import config
+from evaluation import compile_expression
+from parsing import parse
+from sampling import adaptive_sample, downsample, sample_parametric, surface_grid, thin, zero_contour
+
+KINDS = ('functions', 'parametric', 'implicit', 'surface')
+
+X, Y, T = sp.symbols('x y t')
+NAMES = 'fghpqruv'
+
+_SEPARATOR = re.compile(r'[;\n]')
+
+
+def _split_top(text):
+    """text split at the commas outside brackets"""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(text):
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _item(text):
+    """(kind, expression) for one plotted item"""
+    sides = text.split('=')
+    if len(sides) > 2:
+        raise ValueError(f'Too many "=" in {text.strip()!r}')
+    if len(sides) == 2:
+        lhs, rhs = sides[0].strip(), parse(sides[1])
+        if lhs == 'z':
+            return 'surface', rhs
+        if lhs == 'y' and not rhs.has(Y):
+            return 'functions', rhs
+        return 'implicit', parse(lhs) - rhs
+    expr = parse(text)
+    if isinstance(expr, tuple):
+        if len(expr) != 2:
+            raise ValueError('A parametric curve is a pair (x(t), y(t))')
+        return 'parametric', sp.Tuple(*expr)
+    return ('surface' if expr.has(Y) else 'functions'), expr
+
+
+def _range(symbol, low, high):
+    low, high = parse(low), parse(high)
+    if not (low.is_real and high.is_real and low < high):
+        raise ValueError(f'A plot range must be two real numbers, the smaller first ({symbol})')
+    return (symbol, low, high)
+
+
+def parse_plot(text):
+    """(kind, expressions, ranges as (symbol, low, high)) from 'items[, low, high[, y_low, y_high]]'"""
+    parts = _split_top(text)
+    items = [_item(part) for part in _SEPARATOR.split(parts[0]) if part.strip()]
+    if not items:
+        raise ValueError('Enter something to plot')
+    kinds = {kind for kind, _ in items}
+    if len(kinds) > 1:
+        raise ValueError('Plot functions of x, parametric curves, implicit curves or a surface, not a mix')
+    kind = kinds.pop()
+    exprs = tuple(expr for _, expr in items)
+    if len(exprs) > (1 if kind == 'surface' else config.PLOT_MAX_FUNCTIONS):
+        raise ValueError(f'At most {config.PLOT_MAX_FUNCTIONS} curves or one surface fit in a plot')
+
+    symbols = set().union(*(expr.free_symbols for expr in exprs))
+    if kind == 'parametric':
+        if len(symbols) > 1:
+            raise ValueError('Parametric curves take a single parameter')
+        variables = [symbols.pop() if symbols else T]
+    else:
+        variables = [X] if kind == 'functions' else [X, Y]
+        extra = symbols - set(variables)
+        if extra:
+            raise ValueError(f'Cannot plot over {", ".join(sorted(map(str, extra)))}; '
+                             f'use {" and ".join(map(str, variables))}')
+
+    bounds = [p.strip() for p in parts[1:]]
+    if not bounds:
+        bounds = ['0', '2*pi'] if kind == 'parametric' else ['-10', '10']
+    if len(bounds) == 2 and len(variables) == 2:
+        bounds *= 2
+    if len(bounds) != 2 * len(variables):
+        raise ValueError('Give the range as low, high' + (' (then y_low, y_high if it differs)'
+                                                          if len(variables) == 2 else ''))
+    ranges = tuple(_range(v, *bounds[2 * i:2 * i + 2]) for i, v in enumerate(variables))
+    return kind, exprs, ranges
+
+
+def resolution_for(plot, options):
+    """Grid points per axis for implicit curves and surfaces (the 'resolution' option), None for the others"""
+    if plot[0] not in ('implicit', 'surface'):
+        return None
+    resolution = options.get('resolution') or config.PLOT_GRID_SIZE
+    if not (isinstance(resolution, int) and 2 <= resolution <= config.PLOT_MAX_GRID_SIZE):
+        raise ValueError(f'resolution must be a whole number from 2 to {config.PLOT_MAX_GRID_SIZE}')
+    return resolution
+
+
+def _label(kind, expr, i):
+    if kind == 'functions':
+        return f'{NAMES[i]}(x) = {expr}'
+    if kind == 'parametric':
+        return f'(x, y) = {tuple(expr)}'
+    if kind == 'implicit':
+        return f'{expr} = 0'
+    return f'z = {expr}'
+
+
+def describe(plot):
+    """(result text, steps) for a plot"""
+    kind, exprs, ranges = plot
+    labels = ', '.join(_label(kind, expr, i) for i, expr in enumerate(exprs))
+    over = ' × '.join(f'[{low}, {high}]' for _, low, high in ranges)
+    if kind == 'functions':
+        title = f'Graph of {labels}'
+        steps = [f'Function: {labels}' if len(exprs) == 1 else f'Functions: {labels}',
+                 f'Plot the function over range {over}' if len(exprs) == 1 else f'Plot the functions over range {over}']
+    elif kind == 'parametric':
+        symbol = ranges[0][0]
+        title = f'Parametric curve {labels}'
+        steps = [f'Curve: {labels}', f'Trace it for {symbol} in {over}']
+    elif kind == 'implicit':
+        title = f'Curve {labels}'
+        steps = [f'Curve: {labels}', f'Find where the left-hand side changes sign over {over}']
+    else:
+        title = f'Surface {labels}'
+        steps = [f'Surface: {labels}', f'Plot it over {over}']
+    return title, steps + ['Graph displayed below']
+
+
+def sample(plot, resolution=None):
+    """
+    What to draw: for curves a dict with 'curves' [(x_vals, y_vals)], 'names',
+    'labels' (axis titles) and 'limits' ((x, y) limits, either may be None);
+    for a surface 'x', 'y' and 'z'. Both carry 'kind' and 'evaluations'.
+    """
+    kind, exprs, ranges = plot
+    symbol, low, high = ranges[0]
+    low, high = float(low), float(high)
+    names = [_label(kind, expr, i) for i, expr in enumerate(exprs)] if len(exprs) > 1 else None
+    drawing = {'kind': kind, 'names': names, 'evaluations': 0}
+
+    if kind == 'functions':
+        curves, spans, clipped = [], [], False
+        for expr in exprs:
+            x_vals, y_vals, y_limits, evaluations = adaptive_sample(compile_expression(expr, ['x']), low, high)
+            curves.append(downsample(x_vals, y_vals, config.PLOT_RENDER_POINTS))
+            drawing['evaluations'] += evaluations
+            finite = y_vals[np.isfinite(y_vals)]
+            if y_limits is not None:
+                spans.append(y_limits)
+                clipped = True
+            elif finite.size:
+                spans.append((finite.min(), finite.max()))
+        # Only a curve with extreme values (e.g. near a pole) needs the view clipped
+        y_limits = (min(s[0] for s in spans), max(s[1] for s in spans)) if clipped else None
+        drawing.update(curves=curves, labels=('x', 'f(x)'), limits=(None, y_limits))
+
+    elif kind == 'parametric':
+        t_vals = np.linspace(low, high, config.PLOT_PARAMETRIC_POINTS)
+        curves = []
+        for expr in exprs:
+            fx, fy = (compile_expression(e, [str(symbol)]) for e in expr)
+            curves.append(thin(*sample_parametric(fx, fy, t_vals), config.PLOT_RENDER_POINTS))
+            drawing['evaluations'] += 2 * t_vals.size
+        drawing.update(curves=curves, labels=('x', 'y'), limits=(None, None))
+
+    else:
+        x_vals = np.linspace(low, high, resolution)
+        y_vals = np.linspace(float(ranges[1][1]), float(ranges[1][2]), resolution)
+        drawing['evaluations'] = len(exprs) * resolution ** 2
+        if kind == 'implicit':
+            curves = [thin(*zero_contour(compile_expression(expr, ['x', 'y']), x_vals, y_vals,
+                                         config.EVALUATE_CHUNK_SIZE), config.PLOT_RENDER_POINTS)
+                      for expr in exprs]
+            drawing.update(curves=curves, labels=('x', 'y'), limits=((low, high), (y_vals[0], y_vals[-1])))
+        else:
+            drawing['x'], drawing['y'], drawing['z'] = surface_grid(
+                compile_expression(exprs[0], ['x', 'y']), x_vals, y_vals, config.PLOT_SURFACE_SIZE)
+    return drawing
@@ -0,0 +1,150 @@
+"""
+Thread-safe plot rendering
+Avoids pyplot's global figure state: every thread keeps its own Figure/Axes
+template and a render only swaps the line data and title; surfaces get a
+second, 3D template that swaps its surface
+"""
+
+import io
+import threading
+
+import numpy as np
+
+from metrics import stage
+
+_local = threading.local()
+
+
+def _encode(figure, fmt):
+    buf = io.BytesIO()
+    if fmt == 'png':
+        # Draw and encode separately so the two show up as their own stages
+        with stage('render'):
+            figure.canvas.draw()
+        with stage('encode'):
+            from PIL import Image
+            canvas = figure.canvas
+            Image.frombuffer('RGBA', canvas.get_width_height(), canvas.buffer_rgba(),
+                             'raw', 'RGBA', 0, 1).save(buf, format='png')
+    else:
+        with stage('render'):
+            figure.savefig(buf, format=fmt)
+    return buf.getvalue()
+
+
+class PlotRenderer:
+    """Reusable figure for one thread"""
+
+    def __init__(self):
+        # Imported here so processes that never plot don't pay for matplotlib
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(10, 6), dpi=100)
+        FigureCanvasAgg(self.figure)
+        # Fixed margins instead of bbox_inches='tight', which draws the figure twice
+        self.figure.subplots_adjust(left=0.08, right=0.97, bottom=0.09, top=0.92)
+        self.axes = self.figure.add_subplot()
+        self.axes.grid(True, alpha=0.3)
+        self.axes.axhline(y=0, color='k', linewidth=0.5)
+        self.axes.axvline(x=0, color='k', linewidth=0.5)
+        self.axes.set_xlabel('x', fontsize=12)
+        self.axes.set_ylabel('f(x)', fontsize=12)
+        self.lines = self.axes.plot([], [], 'b-', linewidth=2)
+        self.title = self.axes.set_title('', fontsize=14, fontweight='bold')
+
+    def render(self, curves, title, fmt='png', limits=(None, None), labels=('x', 'f(x)'), names=None,
+               equal_aspect=False):
+        """Draw curves, a list of (x_vals, y_vals), and return the encoded image bytes"""
+        while len(self.lines) < len(curves):
+            self.lines += self.axes.plot([], [], f'C{len(self.lines)}-', linewidth=2)
+        for i, line in enumerate(self.lines):
+            line.set_data(*(curves[i] if i < len(curves) else ([], [])))
+            line.set_visible(i < len(curves))
+        legend = self.axes.get_legend()
+        if legend is not None:
+            legend.remove()
+        if names:
+            self.axes.legend(self.lines[:len(curves)], names, loc='upper right')
+        # Fixed limits can only keep an equal aspect by resizing the axes box
+        self.axes.set_aspect('equal' if equal_aspect else 'auto',
+                             adjustable='box' if limits[0] is not None else 'datalim')
+        self.axes.set_xlabel(labels[0], fontsize=12)
+        self.axes.set_ylabel(labels[1], fontsize=12)
+        self.axes.set_autoscale_on(True)
+        self.axes.relim(visible_only=True)
+        self.axes.autoscale_view()
+        if limits[0] is not None:
+            self.axes.set_xlim(*limits[0])
+        if limits[1] is not None:
+            self.axes.set_ylim(*limits[1])
+        self.title.set_text(title)
+        return _encode(self.figure, fmt)
+
+
+class SurfaceRenderer:
+    """Reusable 3D figure for one thread"""
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(10, 6), dpi=100)
+        FigureCanvasAgg(self.figure)
+        self.figure.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.92)
+        self.axes = self.figure.add_subplot(projection='3d')
+        self.axes.set_xlabel('x', fontsize=12)
+        self.axes.set_ylabel('y', fontsize=12)
+        self.axes.set_zlabel('z', fontsize=12)
+        self.surface = None
+        self.title = self.axes.set_title('', fontsize=14, fontweight='bold')
+
+    def render(self, x_vals, y_vals, z_vals, title, fmt='png'):
+        """Draw z_vals (one row per y) over the grid and return the encoded image bytes"""
+        if self.surface is not None:
+            self.surface.remove()
+        x_grid, y_grid = np.meshgrid(x_vals, y_vals)
+        self.surface = self.axes.plot_surface(x_grid, y_grid, z_vals, cmap='viridis', rstride=1, cstride=1,
+                                              linewidth=0, antialiased=False)
+        # plot_surface only ever widens the limits, so they are set outright
+        self.axes.set_xlim(x_vals[0], x_vals[-1])
+        self.axes.set_ylim(y_vals[0], y_vals[-1])
+        finite = z_vals[np.isfinite(z_vals)]
+        low, high = (finite.min(), finite.max()) if finite.size else (0.0, 0.0)
+        if low == high:
+            low, high = low - 1, high + 1
+        self.axes.set_zlim(low, high)
+        self.title.set_text(title)
+        return _encode(self.figure, fmt)
+
+
+def get_renderer(kind=PlotRenderer):
+    """The calling thread's renderer of class kind, created on first use"""
+    renderer = getattr(_local, kind.__name__, None)
+    if renderer is None:
+        renderer = kind()
+        setattr(_local, kind.__name__, renderer)
+    return renderer
+
+
+def render_curve(x_vals, y_vals, title, fmt='png', y_limits=None, labels=('x', 'f(x)')):
+    y_vals = np.broadcast_to(np.asarray(y_vals), np.shape(x_vals))
+    return get_renderer().render([(x_vals, y_vals)], title, fmt, (None, y_limits), labels)
+
+
+def render_curves(curves, title, fmt='png', limits=(None, None), labels=('x', 'f(x)'), names=None,
+                  equal_aspect=False):
+    return get_renderer().render(curves, title, fmt, limits, labels, names, equal_aspect)
+
+
+def render_surface(x_vals, y_vals, z_vals, title, fmt='png'):
+    return get_renderer(SurfaceRenderer).render(x_vals, y_vals, z_vals, title, fmt)
+
+
+def histogram_outline(edges, counts):
+    """The step outline of a histogram as one curve: up, across and down each bar"""
+    edges = np.asarray(edges, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    x_vals = np.repeat(edges, 2)
+    y_vals = np.concatenate([[0.0], np.repeat(counts, 2), [0.0]])
+    return x_vals, y_vals
@@ -0,0 +1,148 @@
+"""
+Polynomial fast path for solve, factor and expand
+Inputs that are polynomials (or ratios of polynomials) with rational
+coefficients skip the generic SymPy machinery and go straight to Poly, the
+sparse polynomial ring and roots(). Each function returns None when the input
+is not one it handles, so the caller can fall back to the generic route.
+"""
+
+import numpy as np
+import sympy as sp
+from sympy import default_sort_key
+from sympy.polys.domains import QQ, ZZ
+from sympy.polys.rings import ring
+
+import config
+
+POLYNOMIAL = 'polynomial'
+RATIONAL = 'rational'
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def classify(expr, symbols=None):
+    """'polynomial' or 'rational' when expr has rational coefficients in symbols, else None"""
+    if not isinstance(expr, sp.Expr):
+        return None
+    symbols = tuple(symbols or sorted(expr.free_symbols, key=default_sort_key))
+    if not symbols or not expr.free_symbols <= set(symbols):
+        return None
+    # Leaves must be symbols or rational numbers (no floats, pi, I, functions)
+    if not all(a.is_Symbol or a.is_Rational for a in expr.atoms()):
+        return None
+    if expr.is_polynomial(*symbols):
+        return POLYNOMIAL
+    if expr.is_rational_function(*symbols):
+        return RATIONAL
+    return None
+
+
+def _domain(expr):
+    return ZZ if all(n.is_Integer for n in expr.atoms(sp.Number)) else QQ
+
+
+def _to_ring(expr, R, gens):
+    """Build expr in the sparse ring R; arithmetic happens on dicts of monomials"""
+    if expr.is_Symbol:
+        return gens[expr]
+    if expr.is_Rational:
+        return R(R.domain.from_sympy(expr))
+    if expr.is_Add:
+        total = R.zero
+        for arg in expr.args:
+            total += _to_ring(arg, R, gens)
+        return total
+    if expr.is_Mul:
+        product = R.one
+        for arg in expr.args:
+            product *= _to_ring(arg, R, gens)
+        return product
+    if expr.is_Pow and expr.exp.is_Integer and expr.exp >= 0:
+        return _to_ring(expr.base, R, gens) ** int(expr.exp)
+    raise _Unsupported(expr)
+
+
+def _ring_for(expr, domain=None):
+    symbols = sorted(expr.free_symbols, key=default_sort_key)
+    R, *generators = ring(symbols, domain or _domain(expr))
+    return R, dict(zip(symbols, generators))
+
+
+def expand(expr):
+    """sp.expand for a polynomial, done with sparse ring arithmetic"""
+    if classify(expr) != POLYNOMIAL:
+        return None
+    try:
+        R, gens = _ring_for(expr)
+        return _to_ring(expr, R, gens).as_expr()
+    except _Unsupported:
+        return None
+
+
+def _factor_list(expr, R, gens):
+    coeff, factors = _to_ring(expr, R, gens).factor_list()
+    return R.domain.to_sympy(coeff), [(f.as_expr(), k) for f, k in factors]
+
+
+def factor(expr):
+    """sp.factor for a polynomial or rational function, via the ring's factor_list"""
+    kind = classify(expr)
+    if kind is None:
+        return None
+    try:
+        if kind == RATIONAL:
+            numer, denom = sp.together(expr).as_numer_denom()
+        else:
+            numer, denom = expr, sp.Integer(1)
+        R, gens = _ring_for(expr, _domain(numer) if _domain(denom) == ZZ else QQ)
+        coeff, factors = _factor_list(numer, R, gens)
+        denom_coeff, denom_factors = _factor_list(denom, R, gens)
+    except _Unsupported:
+        return None
+    factors += [(f, -k) for f, k in denom_factors]
+    return sp.Mul(coeff / denom_coeff, *[f ** k for f, k in factors])
+
+
+def to_number(value):
+    """A NumPy root as a SymPy number, rounded to 15 digits, with round-off parts dropped"""
+    scale = max(1.0, abs(value))
+    real = sp.Float(value.real, 15) if abs(value.real) > 1e-12 * scale else sp.Integer(0)
+    if abs(value.imag) > 1e-10 * scale:
+        return real + sp.Float(value.imag, 15) * sp.I
+    return real
+
+
+def numeric_roots(poly):
+    """Roots as eigenvalues of the companion matrix (numpy.roots), rounded to 15 digits"""
+    coeffs = np.array([float(c) for c in poly.all_coeffs()])
+    return [to_number(value) for value in sorted(np.roots(coeffs), key=lambda z: (z.real, z.imag))]
+
+
+def solve(equation, x):
+    """Roots of a polynomial or rational equation in x as (solutions, numeric), or None"""
+    if not isinstance(equation, sp.Eq):
+        return None
+    expr = equation.lhs - equation.rhs
+    kind = classify(expr, (x,))
+    if kind is None:
+        return None
+    if kind == RATIONAL:
+        # After cancel no root of the numerator can be a pole
+        numer, _ = sp.cancel(expr).as_numer_denom()
+    else:
+        numer = expr
+    poly = sp.Poly(numer, x)
+    degree = poly.degree()
+    if poly.domain not in (ZZ, QQ) or degree < 1:
+        return None
+
+    if degree <= config.POLY_EXACT_MAX_DEGREE:
+        found = sp.roots(poly)
+        if sum(found.values()) == degree:
+            return sorted(found, key=default_sort_key), False
+        if degree <= config.POLY_NUMERIC_DEGREE:
+            # Leave CRootOf answers for low degrees to sp.solve
+            return None
+    return numeric_roots(poly), True
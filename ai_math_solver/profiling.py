@@ -0,0 +1,185 @@
+"""
+Per-request profiling
+A profiled solve runs under cProfile and, at the same time, a sampling thread
+that records the solving thread's stack every PROFILE_INTERVAL seconds. Each
+sample is rooted at problem_type;stage, so the collapsed-stack output loads
+straight into flamegraph.pl or speedscope with time split by stage. Profiles
+are stored under PROFILE_DIR as .pstats (for pstats/snakeviz), .collapsed and
+.json (metadata and the top functions).
+
+Profiling is opt-in per request with the X-Profile-Token header, or applied
+to a random PROFILE_SAMPLE_RATE of ordinary cache misses.
+"""
+
+import cProfile
+import hmac
+import json
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import config
+import metrics
+
+EXTENSIONS = {'pstats': '.pstats', 'collapsed': '.collapsed', 'json': '.json'}
+TOP_FUNCTIONS = 15
+
+
+def authorized(token):
+    """Explicit profiling needs MATH_SOLVER_PROFILE_TOKEN set and matched"""
+    if not config.PROFILE_TOKEN or token is None:
+        return False
+    # compare_digest only takes ASCII str, and headers may carry any byte
+    return hmac.compare_digest(token.encode('utf-8', 'surrogateescape'),
+                               config.PROFILE_TOKEN.encode('utf-8', 'surrogateescape'))
+
+
+def requested(value):
+    """Whether a profile flag asks for profiling: true, 1 or yes, so ?profile=0 or false does not"""
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def sampled():
+    return config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE
+
+
+def _frame_name(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class _Sampler(threading.Thread):
+    """Counts the stacks of one thread below its entry frame"""
+
+    def __init__(self, thread_id, entry, root, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.entry = entry
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and frame.f_code is not self.entry:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if frame is None or not names:
+                # Not inside the profiled call (yet, or any more)
+                continue
+            stage = metrics.current_stage(self.thread_id) or 'other'
+            self.stacks[';'.join([self.root, stage] + names[::-1])] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _top(stats):
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [{'function': f'{name} ({os.path.basename(filename)}:{line})', 'calls': calls,
+             'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)}
+            for (filename, line, name), (_, calls, tottime, cumtime, _) in rows]
+
+
+def profiled(problem_type, func, *args):
+    """Run func(*args) under the profilers; returns (func's result, profile)"""
+    profiler = cProfile.Profile()
+    sampler = _Sampler(threading.get_ident(), profiled.__code__, problem_type, config.PROFILE_INTERVAL)
+    sampler.start()
+    started = time.perf_counter()
+    try:
+        profiler.enable()
+        try:
+            result = func(*args)
+        finally:
+            profiler.disable()
+    finally:
+        sampler.stop()
+    seconds = time.perf_counter() - started
+    stats = pstats.Stats(profiler)
+    profile = {
+        'seconds': round(seconds, 6),
+        'pstats': marshal.dumps(stats.stats),
+        'collapsed': ''.join(f'{stack} {count}\n' for stack, count in sampler.stacks.most_common()),
+        'samples': sum(sampler.stacks.values()),
+        'top': _top(stats),
+    }
+    return result, profile
+
+
+def store(profile, problem_type, expression, trigger, stages):
+    """Write a profile under PROFILE_DIR; returns its metadata (without the raw profiles)"""
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    profile_id = f'{time.strftime("%Y%m%dT%H%M%S")}-{problem_type}-{uuid.uuid4().hex[:8]}'
+    meta = {
+        'id': profile_id,
+        'problem_type': problem_type,
+        'expression': expression,
+        'trigger': trigger,
+        'seconds': profile['seconds'],
+        'stages': {name: round(seconds, 6) for name, seconds in stages.items()},
+        'samples': profile['samples'],
+        'interval': config.PROFILE_INTERVAL,
+        'top': profile['top'],
+    }
+    base = os.path.join(config.PROFILE_DIR, profile_id)
+    with open(base + EXTENSIONS['pstats'], 'wb') as f:
+        f.write(profile['pstats'])
+    with open(base + EXTENSIONS['collapsed'], 'w') as f:
+        f.write(profile['collapsed'])
+    with open(base + EXTENSIONS['json'], 'w') as f:
+        json.dump(meta, f)
+    metrics.PROFILES.inc(problem_type=problem_type, trigger=trigger)
+    _prune()
+    return meta
+
+
+def _prune():
+    """Keep the newest PROFILE_KEEP profiles"""
+    try:
+        names = [n for n in os.listdir(config.PROFILE_DIR) if n.endswith('.json')]
+    except OSError:
+        return
+    if len(names) <= config.PROFILE_KEEP:
+        return
+    for name in sorted(names)[:len(names) - config.PROFILE_KEEP]:
+        profile_id = name[:-len('.json')]
+        for extension in EXTENSIONS.values():
+            try:
+                os.unlink(os.path.join(config.PROFILE_DIR, profile_id + extension))
+            except OSError:
+                pass
+
+
+def path_for(profile_id, fmt):
+    """File holding a stored profile in fmt, or None if there is no such profile"""
+    extension = EXTENSIONS.get(fmt)
+    if extension is None or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(config.PROFILE_DIR, profile_id + extension)
+    return path if os.path.exists(path) else None
+
+
+def recent(limit=50):
+    """Metadata of the newest stored profiles"""
+    try:
+        names = sorted((n for n in os.listdir(config.PROFILE_DIR) if n.endswith('.json')), reverse=True)
+    except OSError:
+        return []
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(config.PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
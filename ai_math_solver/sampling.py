@@ -0,0 +1,189 @@
+"""
+Sampling for plotting
+f(x) starts from a coarse uniform grid and is refined, in vectorized batches,
+only in the intervals where the curve bends or jumps; poles and jumps are
+broken with NaN so no vertical line is drawn across them. Functions of x and y
+are evaluated on a grid one strip of rows at a time, so the temporaries NumPy
+makes stay at about chunk_size points whatever the resolution: implicit curves
+are traced strip by strip and surfaces are reduced to block means as they go.
+"""
+
+import numpy as np
+
+
+def evaluate(f, *arrays):
+    """Evaluate a lambdified function on broadcast arrays, turning complex and non-finite values into NaN"""
+    with np.errstate(all='ignore'):
+        y_vals = f(*arrays)
+    y_vals = np.broadcast_to(np.asarray(y_vals), np.broadcast_shapes(*(np.shape(a) for a in arrays)))
+    if np.iscomplexobj(y_vals):
+        real = np.abs(y_vals.imag) <= 1e-9 * np.maximum(1.0, np.abs(y_vals.real))
+        y_vals = np.where(real, y_vals.real, np.nan)
+    y_vals = np.array(y_vals, dtype=float)
+    y_vals[~np.isfinite(y_vals)] = np.nan
+    return y_vals
+
+
+def _interval_errors(x_vals, y_vals, scale):
+    """Per-interval refinement score: bend at either end point, relative to the y scale"""
+    x0, x1, x2 = x_vals[:-2], x_vals[1:-1], x_vals[2:]
+    y0, y1, y2 = y_vals[:-2], y_vals[1:-1], y_vals[2:]
+    with np.errstate(all='ignore'):
+        linear = y0 + (y2 - y0) * (x1 - x0) / (x2 - x0)
+        bend = np.abs(y1 - linear) / scale
+    # Finite next to NaN means a domain edge or pole worth locating
+    finite = np.isfinite(y_vals)
+    edge = finite[:-1] != finite[1:]
+    bend = np.where(np.isnan(bend), 0.0, bend)
+
+    errors = np.zeros(len(x_vals) - 1)
+    errors[:-1] = np.maximum(errors[:-1], bend)
+    errors[1:] = np.maximum(errors[1:], bend)
+    errors[edge] = np.inf
+    return errors
+
+
+def _break_discontinuities(x_vals, y_vals, low, high, scale):
+    """
+    Insert NaN inside intervals that jump across the whole visible range (poles)
+    or whose jump dwarfs both neighbouring intervals (steps)
+    """
+    jumps = np.abs(np.diff(y_vals))
+    jumps = np.where(np.isnan(jumps), 0.0, jumps)
+    neighbours = np.zeros_like(jumps)
+    neighbours[1:] = jumps[:-1]
+    neighbours[:-1] = np.maximum(neighbours[:-1], jumps[1:])
+    with np.errstate(invalid='ignore'):
+        lower = np.minimum(y_vals[:-1], y_vals[1:])
+        upper = np.maximum(y_vals[:-1], y_vals[1:])
+        across = (lower < low - scale) & (upper > high + scale)
+    breaks = np.flatnonzero(across | ((jumps > 0.02 * scale) & (jumps > 4 * neighbours)))
+    if breaks.size:
+        mids = (x_vals[breaks] + x_vals[breaks + 1]) / 2
+        x_vals = np.insert(x_vals, breaks + 1, mids)
+        y_vals = np.insert(y_vals, breaks + 1, np.nan)
+    return x_vals, y_vals
+
+
+def adaptive_sample(f, x_min, x_max, initial=129, max_evaluations=2000, max_depth=12, tolerance=0.002):
+    """
+    Sample f on [x_min, x_max]
+    Returns (x_vals, y_vals, y_limits, evaluations); y_limits is None unless
+    the curve has extreme values (e.g. near a pole) that should be clipped
+    """
+    x_vals = np.linspace(x_min, x_max, initial)
+    y_vals = evaluate(f, x_vals)
+    evaluations = initial
+
+    # Scale from the uniform grid, so points piled up near a pole don't skew it
+    finite = y_vals[np.isfinite(y_vals)]
+    if finite.size:
+        low, high = np.percentile(finite, [5, 95])
+        scale = max(high - low, 1e-12 * max(1.0, abs(high)), 1e-300)
+    else:
+        low = high = 0.0
+        scale = 1.0
+
+    min_width = (x_max - x_min) / (initial - 1) / 2 ** max_depth
+    for _ in range(max_depth):
+        budget = max_evaluations - evaluations
+        if budget <= 0:
+            break
+        errors = _interval_errors(x_vals, y_vals, scale)
+        errors[np.diff(x_vals) < 2 * min_width] = 0.0
+        rough = np.flatnonzero(errors > tolerance)
+        if not rough.size:
+            break
+        if rough.size > budget:
+            rough = np.sort(rough[np.argsort(errors[rough])[-budget:]])
+        mids = (x_vals[rough] + x_vals[rough + 1]) / 2
+        x_vals = np.insert(x_vals, rough + 1, mids)
+        y_vals = np.insert(y_vals, rough + 1, evaluate(f, mids))
+        evaluations += mids.size
+
+    x_vals, y_vals = _break_discontinuities(x_vals, y_vals, low, high, scale)
+
+    y_limits = None
+    if finite.size and np.nanmax(y_vals) - np.nanmin(y_vals) > 10 * scale:
+        y_limits = (low - 0.5 * scale, high + 0.5 * scale)
+    return x_vals, y_vals, y_limits, evaluations
+
+
+def downsample(x_vals, y_vals, max_points):
+    """Keep the min and max of each bucket (plus every NaN break) so peaks survive"""
+    if len(x_vals) <= max_points:
+        return x_vals, y_vals
+    keep = np.isnan(y_vals)
+    keep[0] = keep[-1] = True
+    for bucket in np.array_split(np.arange(len(x_vals)), max(1, max_points // 2)):
+        finite = bucket[~np.isnan(y_vals[bucket])]
+        if finite.size:
+            keep[finite[np.argmin(y_vals[finite])]] = True
+            keep[finite[np.argmax(y_vals[finite])]] = True
+    return x_vals[keep], y_vals[keep]
+
+
+def thin(x_vals, y_vals, max_points):
+    """Every k-th point of a curve, keeping its NaN breaks and the ends of every piece"""
+    if len(x_vals) <= max_points:
+        return x_vals, y_vals
+    gaps = np.isnan(x_vals) | np.isnan(y_vals)
+    keep = gaps.copy()
+    keep[::int(np.ceil(len(x_vals) / max_points))] = True
+    keep[[0, -1]] = True
+    keep[:-1] |= gaps[1:]
+    keep[1:] |= gaps[:-1]
+    return x_vals[keep], y_vals[keep]
+
+
+def sample_parametric(fx, fy, t_vals):
+    """(x(t), y(t)) at every t, a point where either is undefined becoming a NaN break"""
+    x_vals, y_vals = evaluate(fx, t_vals), evaluate(fy, t_vals)
+    gaps = np.isnan(x_vals) | np.isnan(y_vals)
+    x_vals[gaps] = y_vals[gaps] = np.nan
+    return x_vals, y_vals
+
+
+def zero_contour(f, x_vals, y_vals, chunk_size):
+    """
+    The curves where f(x, y) = 0 on the grid x_vals × y_vals as one polyline
+    broken with NaN; consecutive strips share a row so their pieces meet
+    """
+    import contourpy
+
+    rows = max(1, chunk_size // len(x_vals))
+    pieces = []
+    for start in range(0, len(y_vals) - 1, rows):
+        strip = y_vals[start:start + rows + 1]
+        z_vals = evaluate(f, x_vals[None, :], strip[:, None])
+        lines = contourpy.contour_generator(x_vals, strip, z_vals, line_type='ChunkCombinedNan').lines(0)[0][0]
+        if lines is not None:
+            pieces += [lines, [[np.nan, np.nan]]]
+    if not pieces:
+        return np.array([]), np.array([])
+    points = np.concatenate(pieces[:-1])
+    return points[:, 0], points[:, 1]
+
+
+def _block_starts(n, blocks):
+    return np.unique(np.linspace(0, n, min(blocks, n) + 1).astype(int))[:-1]
+
+
+def surface_grid(f, x_vals, y_vals, size):
+    """
+    f(x, y) on the grid x_vals × y_vals reduced to at most size × size block
+    means (NaN ignored), evaluated one block row at a time; returns the block
+    centres along x and y and the means, one row per y
+    """
+    columns, rows = _block_starts(len(x_vals), size), _block_starts(len(y_vals), size)
+    widths = np.diff(np.append(columns, len(x_vals)))
+    heights = np.diff(np.append(rows, len(y_vals)))
+    z_means = np.empty((len(rows), len(columns)))
+    for i, (start, height) in enumerate(zip(rows, heights)):
+        z_vals = evaluate(f, x_vals[None, :], y_vals[start:start + height, None])
+        finite = np.isfinite(z_vals)
+        sums = np.add.reduceat(np.where(finite, z_vals, 0.0).sum(axis=0), columns)
+        counts = np.add.reduceat(finite.sum(axis=0), columns)
+        with np.errstate(all='ignore'):
+            z_means[i] = sums / counts
+    return np.add.reduceat(x_vals, columns) / widths, np.add.reduceat(y_vals, rows) / heights, z_means
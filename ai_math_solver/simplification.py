@@ -0,0 +1,85 @@
+"""
+Tiered simplification
+Cheap targeted passes, picked by looking at the expression, run first; each is
+kept only if it lowers count_ops. Full sp.simplify, which tries every
+heuristic, runs only when the targeted passes got nowhere or left functions
+they cannot handle, and only while the time budget lasts.
+"""
+
+import sympy as sp
+from sympy.functions.elementary.hyperbolic import HyperbolicFunction
+from sympy.functions.elementary.trigonometric import TrigonometricFunction
+
+import config
+from budget import BudgetExceeded, Deadline, time_limit
+
+TRIG = (TrigonometricFunction, HyperbolicFunction)
+
+
+def _has_denominator(expr):
+    return any(p.exp.is_negative and p.base.free_symbols for p in expr.atoms(sp.Pow))
+
+
+def _has_radical(expr):
+    return any(p.exp.is_Rational and not p.exp.is_Integer for p in expr.atoms(sp.Pow))
+
+
+def _has_powers(expr):
+    return expr.has(sp.exp) or any(not p.exp.is_Number for p in expr.atoms(sp.Pow))
+
+
+# (name, applies to expr, pass) in the order they are tried
+PASSES = (
+    ('cancel', _has_denominator, sp.cancel),
+    ('together', _has_denominator, sp.together),
+    ('radsimp', _has_radical, sp.radsimp),
+    ('trigsimp', lambda e: e.has(*TRIG), sp.trigsimp),
+    ('powsimp', _has_powers, sp.powsimp),
+)
+
+
+def _needs_full(expr):
+    """Functions the targeted passes know nothing about (log identities, gamma, ...)"""
+    return any(not isinstance(f, TRIG + (sp.exp,)) for f in expr.atoms(sp.Function))
+
+
+def simplify(expr, budget=None, full=True):
+    """
+    Simplify expr; returns (result, stage, steps) where stage names the pass that produced it.
+    Every pass is cut off when the budget runs out; a cut-off sp.simplify leaves stage 'partial'.
+    full=False never escalates to sp.simplify.
+    """
+    deadline = Deadline(config.SIMPLIFY_BUDGET if budget is None else budget)
+    best, best_cost, best_stage = expr, sp.count_ops(expr), 'none'
+    steps = []
+    out_of_time = 'Time budget used up, keeping the best form so far'
+
+    improved = True
+    while improved and best_cost > 1:
+        improved = False
+        for name, applies, simplify_pass in PASSES:
+            # Passes are idempotent, so the one that produced best has nothing left to do
+            if name == best_stage or not applies(best):
+                continue
+            try:
+                with time_limit(deadline.remaining()):
+                    candidate = simplify_pass(best)
+            except BudgetExceeded:
+                return best, best_stage, steps + [out_of_time]
+            cost = sp.count_ops(candidate)
+            if cost < best_cost:
+                steps.append(f'{name}: {best_cost} → {cost} operations')
+                best, best_cost, best_stage = candidate, cost, name
+                improved = True
+
+    if full and (best_stage == 'none' or _needs_full(best)) and best_cost > 1 and not deadline.expired():
+        try:
+            with time_limit(deadline.remaining()):
+                candidate = sp.simplify(best)
+        except BudgetExceeded:
+            return best, 'partial', steps + [out_of_time]
+        cost = sp.count_ops(candidate)
+        if cost < best_cost or best_stage == 'none':
+            steps.append(f'simplify: {best_cost} → {cost} operations')
+            best, best_stage = candidate, 'simplify'
+    return best, best_stage, steps
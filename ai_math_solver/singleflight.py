@@ -0,0 +1,205 @@
+"""
+Coalescing of identical concurrent solves
+Within a process, the first request for a key computes and every concurrent
+request for the same key waits for that result. Across processes the leader
+holds an flock on a per-key lock file while it computes; other processes
+wait for the lock and then read the result from the shared L2 cache. An
+outcome that the cache does not keep (an error, a timeout, an unfinished
+result) is written next to the lock for a few seconds instead, so the waiters
+return it rather than each computing it again in turn.
+"""
+
+import os
+import pickle
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run compute() once per key among concurrent callers"""
+
+    def __init__(self, lock_dir=None, wait_timeout=60, outcome_ttl=5):
+        # Cross-process coalescing needs somewhere to lock and a shared store to read from
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self.outcome_ttl = outcome_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.counters = {'computed': 0, 'thread_waits': 0, 'process_waits': 0, 'lock_timeouts': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _add_waiting(self, n):
+        with self._lock:
+            self.waiting += n
+
+    def do(self, key, compute, lookup):
+        """
+        compute() for key, or the result of a concurrent call already running it.
+        lookup() reads the shared cache; compute() must have stored its result there.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.waiting += 1
+                self.counters['thread_waits'] += 1
+
+        if not leader:
+            try:
+                call.done.wait()
+            finally:
+                self._add_waiting(-1)
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._run(key, compute, lookup)
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _compute(self, compute):
+        self._count('computed')
+        return compute()
+
+    def _run(self, key, compute, lookup):
+        if self.lock_dir is None:
+            return self._compute(compute)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, f'{key}.lock')
+        with open(path, 'a') as f:
+            if not self._try_lock(f):
+                # Another process is solving this: wait for it, then read its result
+                self._add_waiting(1)
+                try:
+                    locked = self._wait_lock(f)
+                finally:
+                    self._add_waiting(-1)
+                if not locked:
+                    self._count('lock_timeouts')
+                    return self._compute(compute)
+            try:
+                # Also checked by a new leader: the last one may have finished since our cache miss
+                found, value = self._finished(key, lookup)
+                if found:
+                    self._count('process_waits')
+                    return value
+                try:
+                    value = self._compute(compute)
+                except Exception as e:
+                    self._publish(key, (False, e))
+                    raise
+                if lookup() is None:
+                    self._publish(key, (True, value))
+                return value
+            finally:
+                # Only now, with the outcome published, may a late arrival start a new lock file
+                self._unlock(f, path)
+
+    def _outcome_path(self, key):
+        return os.path.join(self.lock_dir, f'{key}.outcome')
+
+    def _finished(self, key, lookup):
+        """(True, value) for a result in the shared cache or a fresh published outcome, else (False, None)"""
+        value = lookup()
+        if value is not None:
+            return True, value
+        path = self._outcome_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.outcome_ttl:
+                return False, None
+            with open(path, 'rb') as f:
+                ok, value = pickle.load(f)
+        except Exception:
+            # Missing, half-written or unreadable: compute instead
+            return False, None
+        if not ok:
+            raise value
+        return True, value
+
+    def _publish(self, key, outcome):
+        """Leave outcome next to the lock for outcome_ttl seconds and sweep out expired ones"""
+        try:
+            data = pickle.dumps(outcome)
+        except Exception:
+            # Not portable (a local refusal, say): the waiters compute for themselves
+            return
+        path = self._outcome_path(key)
+        partial = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        try:
+            with open(partial, 'wb') as f:
+                f.write(data)
+            os.replace(partial, path)
+        except OSError:
+            return
+        now = time.time()
+        for name in os.listdir(self.lock_dir):
+            if name.endswith('.outcome'):
+                try:
+                    if now - os.path.getmtime(os.path.join(self.lock_dir, name)) > self.outcome_ttl:
+                        os.unlink(os.path.join(self.lock_dir, name))
+                except OSError:
+                    pass
+
+    def _try_lock(self, f):
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _wait_lock(self, f):
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.005
+        while not self._try_lock(f):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return True
+
+    def _unlock(self, f, path):
+        # Unlinking while still locked: a waiter holding the old file gets it next, a late
+        # arrival creates a new one, and both find the published outcome once they lock
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['waiting'] = self.waiting
+            stats['in_flight_keys'] = len(self._calls)
+        coalesced = stats['thread_waits'] + stats['process_waits']
+        total = coalesced + stats['computed']
+        stats['coalescing_rate'] = round(coalesced / total, 4) if total else 0.0
+        return stats
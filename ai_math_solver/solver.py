@@ -0,0 +1,378 @@
+"""
+Problem dispatch for the AI Math Solver
+Parsing and solving are separate steps so the parsed form can be used as a cache key
+"""
+
+import hashlib
+import json
+import logging
+from itertools import islice
+
+import sympy as sp
+
+import complexity
+import config
+import datasets
+import integration
+import matrices
+import output
+import plots
+import polynomial
+import steps
+import systems
+from graphs import PLOT_ERRORS, create_graph, create_histogram, graph_url, plot_points
+from metrics import collect_stages, stage
+from parsing import parse
+from simplification import simplify
+
+PROBLEM_TYPES = ('simplify', 'solve', 'derivative', 'integrate', 'factor', 'expand', 'limit', 'plot', 'statistics', 'system', 'matrix')
+
+log = logging.getLogger(__name__)
+
+# Request fields besides problem_type/expression that change the result
+OPTION_KEYS = ('format', 'bins', 'quantiles', 'plot', 'unknowns', 'operation', 'mode', 'formats', 'resolution')
+
+
+def parse_problem(problem_type, expression):
+    """Parse the raw input into the tuple of SymPy objects the solver works on"""
+    parsed = _parse_problem(problem_type, expression)
+    complexity.check(problem_type, parsed)
+    return parsed
+
+
+def _parse_problem(problem_type, expression):
+    if problem_type == 'solve':
+        # Handle equation
+        if '=' in expression:
+            lhs, rhs = expression.split('=')
+            lhs_expr = parse(lhs)
+            rhs_expr = parse(rhs)
+            return (sp.Eq(lhs_expr, rhs_expr),)
+        expr = parse(expression)
+        return (sp.Eq(expr, 0),)
+
+    if problem_type == 'limit':
+        parts = expression.split(',')
+        expr = parse(parts[0])
+        var = sp.Symbol(parts[1].strip())
+        point = parts[2].strip()
+        if point == 'oo':
+            point = sp.oo
+        else:
+            point = parse(point)
+        return (expr, var, point)
+
+    if problem_type == 'integrate':
+        # "f(x)" or "f(x), a, b" for a definite integral
+        parts = expression.split(',')
+        if len(parts) == 1:
+            return (parse(parts[0]),)
+        if len(parts) != 3:
+            raise ValueError('Use "f(x)" or "f(x), a, b" to integrate')
+        return tuple(parse(p) for p in parts)
+
+    if problem_type == 'system':
+        # One parsed expression (lhs - rhs) per equation
+        return systems.parse_equations(expression)
+
+    if problem_type == 'matrix':
+        # (operation written in the input or None, rows of entries)
+        return matrices.parse_matrix(expression)
+
+    if problem_type == 'statistics':
+        # Typed-in data as (names, rows); uploads go through /statistics instead
+        return datasets.parse_inline(expression)
+
+    if problem_type == 'plot':
+        # (kind, expressions, ranges), see plots.parse_plot
+        return plots.parse_plot(expression)
+
+    return (parse(expression),)
+
+
+def request_options(data):
+    """Pick the result-affecting options out of a request body"""
+    return {k: data[k] for k in OPTION_KEYS if data.get(k) is not None}
+
+
+# Part of every cache key: bump it whenever the shape of result_data changes, so results
+# stored in the L2 file by an older version are not served
+CACHE_VERSION = 1
+
+
+def cache_key(problem_type, parsed, options=None):
+    """Key identifying a problem by its canonical (srepr) form"""
+    canonical = '\n'.join([f'v{CACHE_VERSION}', problem_type, sp.srepr(parsed), json.dumps(options or {}, sort_keys=True)])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# Stages of results cut short by the time budget, which a later request may complete
+UNFINISHED_STAGES = ('budget_exhausted', 'partial')
+
+
+def cacheable(result_data):
+    """False for results whose graph failed or that ran out of time, so the next request tries again"""
+    return 'graph_error' not in result_data and result_data.get('stage') not in UNFINISHED_STAGES
+
+
+def solve_parsed(problem_type, parsed, expression, options=None):
+    """Run the requested operation on an already parsed problem"""
+    options = options or {}
+    formats = output.requested_formats(options)
+    x = sp.Symbol('x')
+    result_data = {
+        'original': expression,
+        'result': '',
+        'steps': [],
+        'graph': None
+    }
+
+    if problem_type == 'simplify':
+        expr, = parsed
+        downgraded = complexity.too_large(expr)
+        with stage('compute'):
+            if downgraded:
+                simplified, simplify_stage, passes = simplify(expr, config.DOWNGRADED_BUDGET, full=False)
+            else:
+                simplified, simplify_stage, passes = simplify(expr)
+        with stage('format'):
+            shown = output.render(simplified, result_data, formats)
+            result_data['result'] = shown
+            result_data['stage'] = simplify_stage
+            result_data['steps'] = [
+                f'Original expression: {expr}',
+                *(['Expression is too large for a full search, trying only quick rewrites'] if downgraded else []),
+                *(passes or ['Apply simplification rules']),
+                f'Simplified form: {shown}'
+            ]
+            if downgraded:
+                result_data['downgraded'] = True
+
+    elif problem_type == 'solve':
+        equation, = parsed
+        with stage('compute'):
+            fast = polynomial.solve(equation, x)
+            solutions, numeric = fast or (sp.solve(equation, x), False)
+        with stage('format'):
+            shown = output.render(solutions, result_data, formats)
+            result_data['result'] = f'x = {shown}'
+            result_data['steps'] = [
+                f'Equation: {equation}',
+                'Approximate the roots numerically (no closed form)' if numeric else f'Apply solving techniques',
+                f'Solutions: x = {shown}'
+            ]
+            if numeric:
+                result_data['numeric'] = True
+
+    elif problem_type == 'derivative':
+        expr, = parsed
+        with stage('compute'):
+            derivative = sp.diff(expr, x)
+        with stage('format'):
+            shown = output.render(derivative, result_data, formats)
+            result_data['result'] = shown
+            result_data['steps'] = [
+                f'Function: f(x) = {expr}',
+                f'Apply differentiation rules',
+                f"Derivative: f'(x) = {shown}"
+            ]
+
+    elif problem_type == 'integrate':
+        expr, *bounds = parsed
+        downgraded = complexity.too_large(expr)
+        budget = config.DOWNGRADED_BUDGET if downgraded else None
+        with stage('compute'):
+            if bounds:
+                value, method, error = integration.definite(expr, x, *bounds, budget=budget)
+            else:
+                integral, method = integration.antiderivative(expr, x, budget)
+        with stage('format'):
+            result_data['stage'] = method
+            if bounds:
+                a, b = bounds
+                shown = output.render(value, result_data, formats)
+                result_data['result'] = shown
+                result_data['steps'] = [
+                    f'Function: f(x) = {expr}',
+                    f'Integrate from {a} to {b}, method: {integration.DESCRIPTIONS[method]}',
+                    f'Integral: ∫f(x)dx over [{a}, {b}] = {shown}'
+                ]
+                if error is not None:
+                    result_data['numeric'] = True
+                    result_data['error_estimate'] = error
+            else:
+                shown = output.render(integral, result_data, formats)
+                result_data['result'] = shown + ' + C'
+                result_data['steps'] = [
+                    f'Function: f(x) = {expr}',
+                    f'Method: {integration.DESCRIPTIONS[method]}',
+                    f'Integral: ∫f(x)dx = {shown} + C'
+                ]
+            if downgraded:
+                result_data['downgraded'] = True
+
+    elif problem_type == 'factor':
+        expr, = parsed
+        with stage('compute'):
+            factored = polynomial.factor(expr)
+            if factored is None:
+                factored = sp.factor(expr)
+        with stage('format'):
+            shown = output.render(factored, result_data, formats)
+            result_data['result'] = shown
+            result_data['steps'] = [
+                f'Expression: {expr}',
+                f'Find common factors',
+                f'Factored form: {shown}'
+            ]
+
+    elif problem_type == 'expand':
+        expr, = parsed
+        with stage('compute'):
+            expanded = polynomial.expand(expr)
+            if expanded is None:
+                expanded = sp.expand(expr)
+        with stage('format'):
+            shown = output.render(expanded, result_data, formats)
+            result_data['result'] = shown
+            result_data['steps'] = [
+                f'Expression: {expr}',
+                f'Apply expansion rules',
+                f'Expanded form: {shown}'
+            ]
+
+    elif problem_type == 'limit':
+        expr, var, point = parsed
+        with stage('compute'):
+            limit_result = sp.limit(expr, var, point)
+        with stage('format'):
+            shown = output.render(limit_result, result_data, formats)
+            result_data['result'] = shown
+            result_data['steps'] = [
+                f'Function: {expr}',
+                f'Variable: {var} → {point}',
+                f'Limit: {shown}'
+            ]
+
+    elif problem_type == 'plot':
+        resolution = plots.resolution_for(parsed, options)
+        result_data['result'], result_data['steps'] = plots.describe(parsed)
+        result_data['graph_url'] = None
+        result_data['evaluations'] = 0
+        try:
+            if options.get('format') == 'points':
+                # Raw samples for client-side rendering, no rasterization
+                result_data['points'], result_data['evaluations'] = plot_points(parsed, resolution=resolution)
+            else:
+                digest, result_data['evaluations'] = create_graph(parsed, resolution=resolution)
+                result_data['graph_url'] = graph_url(digest)
+        except PLOT_ERRORS as e:
+            log.warning('Plot of %r failed: %s', expression, e)
+            result_data['graph_error'] = str(e)
+
+    elif problem_type == 'system':
+        unknowns = systems.unknowns_for(parsed, options.get('unknowns'))
+        with stage('compute'):
+            solutions, method = systems.solve(parsed, unknowns)
+        with stage('format'):
+            result_data['result'] = output.cap(systems.format_solutions(solutions, unknowns), 'result', result_data)
+            result_data['stage'] = method
+            result_data['solutions'] = None if solutions is None else [
+                {str(u): str(value) for u, value in s.items()} for s in solutions]
+            result_data['steps'] = [
+                *(f'Equation {i}: {eq} = 0' for i, eq in enumerate(parsed[:10], 1)),
+                *([f'... {len(parsed) - 10} more equations'] if len(parsed) > 10 else []),
+                f'Unknowns: {", ".join(map(str, unknowns))}',
+                systems.DESCRIPTIONS[method],
+                f'Solution: {result_data["result"]}'
+            ]
+            if method == 'groebner_numeric':
+                result_data['numeric'] = True
+
+    elif problem_type == 'matrix':
+        written, rows = parsed
+        operation = matrices.operation_for(written, rows, options.get('operation'))
+        backend = matrices.backend_for(operation, rows, options.get('mode'))
+        with stage('compute'):
+            value, method = matrices.solve(operation, rows, backend)
+        with stage('format'):
+            shown = matrices.format_matrix(rows) if len(rows) * len(rows[0]) <= 100 else 'too large to show'
+            result_data['result'] = output.cap(matrices.format_value(operation, value), 'result', result_data)
+            result_data['stage'] = method
+            if operation in ('inverse', 'rref') and value is not None:
+                result_data['matrix'] = [[str(v) for v in row] for row in value]
+            result_data['steps'] = [
+                f'Matrix ({len(rows)}×{len(rows[0])}): {shown}',
+                f'Operation: {operation}',
+                matrices.DESCRIPTIONS[operation, method],
+                f'Result: {result_data["result"]}'
+            ]
+            if method == 'numeric':
+                result_data['numeric'] = True
+
+    elif problem_type == 'statistics':
+        names, rows = parsed
+        bins, quantiles, plot = datasets.options(options)
+        with stage('compute'):
+            accumulator = datasets.Accumulator(names)
+            accumulator.add(rows)
+            summary = accumulator.summary(quantiles, bins)
+        with stage('format'):
+            result_data.update(statistics_result(summary, plot))
+
+    return result_data
+
+
+def statistics_result(summary, plot=False):
+    """Result fields for a statistics summary, with a histogram of the first column if asked"""
+    result, steps = datasets.describe(summary)
+    fields = {'result': result, 'steps': steps, 'statistics': summary}
+    if plot and summary['count']:
+        name, column = next(iter(summary['columns'].items()))
+        try:
+            digest = create_histogram(column['histogram']['edges'], column['histogram']['counts'],
+                                      f'Histogram of {name}')
+            fields['graph_url'] = graph_url(digest)
+        except PLOT_ERRORS as e:
+            log.warning('Histogram of %r failed: %s', name, e)
+            fields['graph_error'] = str(e)
+    return fields
+
+
+def statistics_file(path, columns, quantiles, bins, plot=False):
+    """statistics_result for a spooled CSV upload, read as a stream, plus the seconds per stage"""
+    with collect_stages() as stages:
+        with stage('compute'), open(path, 'rb') as f:
+            summary = datasets.read_csv(f, columns).summary(quantiles, bins)
+        with stage('format'):
+            result_data = statistics_result(summary, plot)
+    return result_data, stages
+
+
+def solve_with_stages(problem_type, parsed, expression, options=None):
+    """solve_parsed plus the seconds spent in each stage, for the metrics endpoint"""
+    with collect_stages() as stages:
+        result_data = solve_parsed(problem_type, parsed, expression, options)
+    return result_data, stages
+
+
+def stream_solution(problem_type, parsed, expression, options=None, solve=True):
+    """
+    ('step', text) for each step as soon as it is derived, for the problem types
+    with a step generator, then ('result', (result_data, stages)) unless solve
+    is false (the caller already has the result)
+    """
+    generator = steps.GENERATORS.get(problem_type)
+    if generator is not None:
+        derived = generator(*parsed)
+        for text in islice(derived, config.STEPS_MAX):
+            yield 'step', text
+        if next(derived, None) is not None:
+            yield 'step', f'... further steps omitted (at most {config.STEPS_MAX} are shown)'
+    if solve:
+        yield 'result', solve_with_stages(problem_type, parsed, expression, options)
+
+
+def solve_problem(problem_type, expression, options=None):
+    """Parse and solve in one call"""
+    return solve_parsed(problem_type, parse_problem(problem_type, expression), expression, options)
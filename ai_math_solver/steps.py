@@ -0,0 +1,188 @@
+"""
+Step-by-step derivations
+Steps come from lazy generators, so /solve/stream can send the first ones
+while the rest, and the result, are still being worked out. Derivatives walk
+the expression tree rule by rule; antiderivatives walk the rule tree that
+manualintegrate builds. Each step is yielded as soon as it is known: a rule
+is announced before its parts are differentiated or integrated.
+"""
+
+import dataclasses
+import re
+
+import sympy as sp
+from sympy.integrals.manualintegrate import (AddRule, AlternativeRule, ConstantTimesRule, CyclicPartsRule, PartsRule,
+                                             RewriteRule, Rule, URule, integral_steps)
+
+import config
+from budget import BudgetExceeded, time_limit
+from integration import reset_manual_rules
+
+_U = sp.Symbol('u')
+
+
+def _d(expr):
+    return f'd/dx[{expr}]'
+
+
+def _derivative(expr, x):
+    """Yields the steps for d/dx[expr] and returns the derivative (use with yield from)"""
+    if not expr.has(x):
+        yield f'Constant rule: {_d(expr)} = 0'
+        return sp.Integer(0)
+    if expr == x:
+        yield f'{_d(x)} = 1'
+        return sp.Integer(1)
+
+    if expr.is_Add:
+        yield f'Sum rule: differentiate the {len(expr.args)} terms of {expr} one by one'
+        parts = []
+        for term in expr.args:
+            parts.append((yield from _derivative(term, x)))
+        result = sp.Add(*parts)
+
+    elif expr.is_Mul:
+        coeff, rest = expr.as_independent(x, as_Add=False)
+        if coeff != 1:
+            yield f'Constant multiple rule: {_d(expr)} = {coeff}·{_d(rest)}'
+            result = coeff * (yield from _derivative(rest, x))
+        else:
+            factors = expr.args
+            yield f'Product rule: differentiate each factor of {expr} with the others held fixed'
+            terms = []
+            for i, factor in enumerate(factors):
+                inner = yield from _derivative(factor, x)
+                terms.append(inner * sp.Mul(*factors[:i], *factors[i + 1:]))
+            result = sp.Add(*terms)
+
+    elif expr.is_Pow:
+        base, exp = expr.args
+        if not exp.has(x):
+            if base == x:
+                yield f'Power rule: {_d(expr)} = {exp}·x^({exp - 1})'
+                inner = sp.Integer(1)
+            else:
+                yield f'Power rule with the chain rule: {_d(expr)} = {exp}·({base})^({exp - 1})·{_d(base)}'
+                inner = yield from _derivative(base, x)
+            result = exp * base**(exp - 1) * inner
+        elif not base.has(x):
+            yield f'Exponential rule: {_d(expr)} = {expr}·ln({base})·{_d(exp)}'
+            result = expr * sp.log(base) * (yield from _derivative(exp, x))
+        else:
+            yield f'Logarithmic differentiation: {_d(expr)} = {expr}·{_d(exp * sp.log(base))}'
+            result = expr * (yield from _derivative(exp * sp.log(base), x))
+
+    elif expr.is_Function and len(expr.args) == 1:
+        u, = expr.args
+        outer = expr.func(_U).diff(_U)
+        if u == x:
+            result = outer.subs(_U, x)
+            yield f'Derivative of {expr.func}: {_d(expr)} = {result}'
+            # The rule's line already gives the result
+            return result
+        else:
+            yield f'Chain rule: {_d(expr)} = {outer.subs(_U, u)}·{_d(u)}'
+            result = outer.subs(_U, u) * (yield from _derivative(u, x))
+
+    else:
+        result = sp.diff(expr, x)
+
+    yield f'{_d(expr)} = {result}'
+    return result
+
+
+def derivative(expr):
+    """Steps for f'(x)"""
+    x = sp.Symbol('x')
+    yield f'Function: f(x) = {expr}'
+    result = yield from _derivative(expr, x)
+    yield f"Derivative: f'(x) = {result}"
+
+
+def _rule_name(rule):
+    """PartsRule -> 'Parts rule'"""
+    words = re.findall(r'[A-Z][a-z0-9]*', type(rule).__name__)
+    return ' '.join([words[0]] + [w.lower() for w in words[1:]])
+
+
+def _children(rule):
+    for field in dataclasses.fields(rule):
+        value = getattr(rule, field.name)
+        if isinstance(value, Rule):
+            yield value
+        elif isinstance(value, list):
+            yield from (v for v in value if isinstance(v, Rule))
+
+
+def _integral(rule):
+    integrand = f'({rule.integrand})' if rule.integrand.is_Add else rule.integrand
+    return f'∫{integrand} d{rule.variable}'
+
+
+def _rule_steps(rule):
+    """Steps for one node of a manualintegrate rule tree, then its subrules, then its value"""
+    if isinstance(rule, AlternativeRule):
+        yield from _rule_steps(rule.alternatives[0])
+        return
+    children = list(_children(rule))
+    if isinstance(rule, URule):
+        yield f'Substitute {rule.u_var} = {rule.u_func} in {_integral(rule)}'
+    elif isinstance(rule, PartsRule):
+        # Inside CyclicPartsRule the parts carry no integrand or variable of their own
+        dv = f'{rule.dv} d{rule.variable}' if rule.variable is not None else rule.dv
+        yield f'Integrate by parts with u = {rule.u} and dv = {dv}'
+    elif isinstance(rule, CyclicPartsRule):
+        yield f'Integrate {_integral(rule)} by parts until it reappears, then solve for it'
+    elif isinstance(rule, RewriteRule):
+        yield f'Rewrite {rule.integrand} as {rule.rewritten}'
+    elif isinstance(rule, AddRule):
+        yield f'Integrate term by term: {_integral(rule)}'
+    elif isinstance(rule, ConstantTimesRule):
+        yield f'Constant multiple: {_integral(rule)} = {rule.constant}·∫{rule.other} d{rule.variable}'
+    elif rule.integrand is None:
+        yield _rule_name(rule)
+    elif rule.contains_dont_know() and not children:
+        yield f'No integration rule applies to {_integral(rule)}'
+        return
+    elif children:
+        yield f'{_rule_name(rule)}: {_integral(rule)}'
+    else:
+        # A table entry, settled in one step
+        yield f'{_rule_name(rule)}: {_integral(rule)} = {rule.eval()}'
+        return
+    for child in children:
+        yield from _rule_steps(child)
+    if rule.integrand is not None and not rule.contains_dont_know():
+        yield f'{_integral(rule)} = {rule.eval()}'
+
+
+def integral(expr, a=None, b=None):
+    """Steps for the antiderivative of f(x) from manualintegrate's rules, then the bounds if given"""
+    x = sp.Symbol('x')
+    yield f'Function: f(x) = {expr}'
+    try:
+        with time_limit(config.STEPS_BUDGET):
+            rule = integral_steps(expr, x)
+    except BudgetExceeded:
+        reset_manual_rules()
+        yield 'No step-by-step rules found within the time budget'
+        return
+    except Exception:
+        reset_manual_rules()
+        yield 'No step-by-step rules found for this integrand'
+        return
+    yield from _rule_steps(rule)
+    if rule.contains_dont_know():
+        return
+    antiderivative = rule.eval()
+    if a is None:
+        yield f'Integral: ∫f(x)dx = {antiderivative} + C'
+    else:
+        yield f'Evaluate F(x) = {antiderivative} from {a} to {b}: F({b}) - F({a})'
+
+
+# Problem types with a step generator, called with the parsed problem
+GENERATORS = {
+    'derivative': derivative,
+    'integrate': integral,
+}
@@ -0,0 +1,187 @@
+"""
+Systems of equations
+Linear systems are eliminated on a sparse DomainMatrix (rref of the
+augmented matrix over QQ, or a fraction field when there are parameters),
+which stays fast at hundreds of unknowns. Polynomial systems go through a lex
+Groebner basis, anything else through sp.solve, both under a time budget.
+"""
+
+import re
+
+import numpy as np
+import sympy as sp
+from sympy.polys.matrices import DomainMatrix
+
+import config
+from budget import BudgetExceeded, Deadline, time_limit
+from parsing import parse
+from polynomial import to_number
+
+DESCRIPTIONS = {
+    'linear': 'Gaussian elimination on the sparse augmented matrix',
+    'groebner': 'Check the system with a lex Groebner basis, then solve it exactly',
+    'groebner_numeric': 'Reduce to a triangular system with a lex Groebner basis, then back-substitute numerically (no closed form)',
+    'general': 'Solve the equations simultaneously',
+    'budget_exhausted': 'Time budget used up before the system was solved',
+}
+
+_SEPARATOR = re.compile(r'[;\n]')
+
+
+def parse_equations(text):
+    """Equations separated by ';' or new lines, each "lhs = rhs" or an expression equal to 0"""
+    equations = []
+    for part in _SEPARATOR.split(text):
+        if not part.strip():
+            continue
+        sides = part.split('=')
+        if len(sides) > 2:
+            raise ValueError(f'Too many "=" in {part.strip()!r}')
+        expr = parse(sides[0]) - parse(sides[1]) if len(sides) == 2 else parse(sides[0])
+        equations.append(expr)
+    if not equations:
+        raise ValueError('Enter at least one equation')
+    if len(equations) > config.SYSTEM_MAX_EQUATIONS:
+        raise ValueError(f'Systems are limited to {config.SYSTEM_MAX_EQUATIONS} equations')
+    return tuple(equations)
+
+
+def unknowns_for(equations, names=None):
+    """The requested unknowns (a list or comma-separated names), else every symbol in the equations"""
+    if names:
+        if isinstance(names, str):
+            names = names.split(',')
+        return [sp.Symbol(name.strip()) for name in names]
+    symbols = set().union(*(eq.free_symbols for eq in equations))
+    return sorted(symbols, key=sp.default_sort_key)
+
+
+def _linear_row(eq, index, n):
+    """{column: coefficient} of one equation, column n being the right-hand side; None if not linear"""
+    row = {}
+    for term in sp.Add.make_args(eq):
+        present = term.free_symbols & index.keys()
+        if not present:
+            row[n] = row.get(n, 0) - term
+            continue
+        if len(present) > 1:
+            return None
+        u, = present
+        coeff, part = term.as_independent(u, as_Add=False)
+        if part != u:
+            return None
+        row[index[u]] = row.get(index[u], 0) + coeff
+    return {j: c for j, c in row.items() if c != 0}
+
+
+def _linear_rows(equations, unknowns):
+    """Augmented matrix as {row: {column: coefficient}}, or None if an equation is not linear"""
+    index = {u: j for j, u in enumerate(unknowns)}
+    n = len(unknowns)
+    rows = {}
+    for i, eq in enumerate(equations):
+        row = _linear_row(eq, index, n)
+        if row is None:
+            # Expanding is the slow part, so only for terms like 2*(x + y) or nonlinear terms that cancel
+            row = _linear_row(sp.expand(eq), index, n)
+            if row is None:
+                return None
+        if row:
+            rows[i] = row
+    return rows
+
+
+def linear(equations, unknowns):
+    """Solutions of a linear system as a list of at most one {unknown: value}; None if not linear"""
+    rows = _linear_rows(equations, unknowns)
+    if rows is None:
+        return None
+    n = len(unknowns)
+    if not rows:
+        return [{}]
+    augmented = DomainMatrix.from_dict_sympy(len(equations), n + 1, rows).to_sparse().to_field()
+    reduced, pivots = augmented.rref()
+    if pivots and pivots[-1] == n:
+        return []
+    to_sympy = reduced.domain.to_sympy
+    solution = {}
+    for row in reduced.rep.values():
+        pivot = min(row)
+        value = to_sympy(row[n]) if n in row else sp.Integer(0)
+        # Unknowns without a pivot are free parameters
+        value -= sp.Add(*(to_sympy(c) * unknowns[j] for j, c in row.items() if j != pivot and j != n))
+        solution[unknowns[pivot]] = value
+    return [solution]
+
+
+def _back_substitute(basis, unknowns):
+    """Numeric roots of a zero-dimensional lex basis, one unknown at a time from the last"""
+    partial = [{}]
+    for u in reversed(unknowns):
+        extended = []
+        for known in partial:
+            polys = [sp.Poly(g.subs(known), u) for g in basis
+                     if g.has(u) and g.free_symbols <= known.keys() | {u}]
+            coeffs = [np.array([complex(c) for c in p.all_coeffs()]) for p in polys if p.degree() > 0]
+            if not coeffs:
+                continue
+            for root in np.roots(min(coeffs, key=len)):
+                # Every other basis element in these unknowns must vanish there too
+                if all(abs(np.polyval(c, root)) <= 1e-6 * np.abs(c).sum() * max(1.0, abs(root))**(len(c) - 1)
+                       for c in coeffs):
+                    extended.append({**known, u: root})
+        partial = extended
+    return [{u: to_number(complex(s[u])) for u in unknowns} for s in partial]
+
+
+def groebner(equations, unknowns, deadline):
+    """
+    (solutions, stage) of a polynomial system, solved from its lex Groebner
+    basis, which settles inconsistency and finiteness. Finitely many solutions
+    with no closed form, or not found within the budget, are approximated from
+    the basis; otherwise None if the budget ran out.
+    """
+    try:
+        with time_limit(deadline.remaining()):
+            basis = sp.groebner(equations, *unknowns, order='lex')
+    except BudgetExceeded:
+        return None, 'budget_exhausted'
+    if basis.exprs == [1]:
+        return [], 'groebner'
+    try:
+        with time_limit(deadline.remaining()):
+            solutions = sp.solve(basis.exprs, unknowns, dict=True)
+    except BudgetExceeded:
+        solutions = None
+    if not solutions and basis.is_zero_dimensional:
+        # Finitely many solutions, just none in closed form (or not in time)
+        return _back_substitute(basis.exprs, unknowns), 'groebner_numeric'
+    if not solutions:
+        # The basis is not [1], so there are solutions: "No solution" would be wrong
+        return None, 'budget_exhausted'
+    return solutions, 'groebner'
+
+
+def solve(equations, unknowns, budget=None):
+    """Returns (solutions, stage); solutions is a list of {unknown: value}, None if out of time"""
+    solutions = linear(equations, unknowns)
+    if solutions is not None:
+        return solutions, 'linear'
+    deadline = Deadline(config.SYSTEM_GROEBNER_BUDGET if budget is None else budget)
+    if all(eq.is_polynomial(*unknowns) for eq in equations):
+        return groebner(equations, unknowns, deadline)
+    try:
+        with time_limit(deadline.remaining()):
+            return sp.solve(equations, unknowns, dict=True), 'general'
+    except BudgetExceeded:
+        return None, 'budget_exhausted'
+
+
+def format_solutions(solutions, unknowns):
+    if solutions is None:
+        return 'No solution found within the time budget'
+    if not solutions:
+        return 'No solution'
+    parts = [', '.join(f'{u} = {s[u]}' for u in unknowns if u in s) or 'Every value is a solution'
+             for s in solutions]
+    return parts[0] if len(parts) == 1 else ' or '.join(f'({p})' for p in parts)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Solve on the test thread, with no warm-up and no shared cache file
+os.environ.setdefault('MATH_SOLVER_WORKERS', '0')
+os.environ.setdefault('MATH_SOLVER_WARMUP', '0')
+os.environ.setdefault('MATH_SOLVER_CACHE_L2_PATH', '')
@@ -0,0 +1,76 @@
+import time
+
+import sympy as sp
+
+import solver
+from cache import LRUCache, ResultCache, SQLiteCache
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache(2, 60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.evictions == 1
+
+
+def test_lru_entries_expire():
+    cache = LRUCache(4, 0.01)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.expirations == 1
+
+
+def test_zero_size_lru_stores_nothing():
+    cache = LRUCache(0, 60)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_sqlite_entries_expire(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'results.sqlite3'), 10, 0.01)
+    cache.set('a', {'result': 'x'})
+    assert cache.get('a') == {'result': 'x'}
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_sqlite_prunes_least_recently_used_rows(tmp_path):
+    pruned = []
+    cache = SQLiteCache(str(tmp_path / 'results.sqlite3'), 50, 60, on_prune=lambda: pruned.append(1))
+    for i in range(100):
+        cache.set(str(i), i)
+    assert len(cache) == 50
+    assert cache.get('0') is None and cache.get('99') == 99
+    assert cache.evictions == 50
+    assert pruned == [1]
+
+
+def test_l2_hit_keeps_its_remaining_ttl_in_l1(tmp_path):
+    path = str(tmp_path / 'results.sqlite3')
+    writer = ResultCache(8, 3600, path, 10, 0.05)
+    writer.set('k', {'result': 'x'})
+    time.sleep(0.03)
+    reader = ResultCache(8, 3600, path, 10, 0.05)
+    assert reader.get('k') == {'result': 'x'}
+    assert reader.stats()['l2_hits'] == 1
+    time.sleep(0.03)
+    # Expired in L2, so the L1 copy must have expired with it
+    assert reader.get('k') is None
+    assert reader.stats()['l1_expirations'] == 1
+
+
+def test_cache_key_carries_the_cache_version(monkeypatch):
+    x = sp.Symbol('x')
+    key = solver.cache_key('derivative', x**2)
+    assert key == solver.cache_key('derivative', x**2)
+    assert key != solver.cache_key('derivative', x**2, {'format': 'latex'})
+    monkeypatch.setattr(solver, 'CACHE_VERSION', solver.CACHE_VERSION + 1)
+    assert key != solver.cache_key('derivative', x**2)
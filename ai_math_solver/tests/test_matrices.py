@@ -0,0 +1,45 @@
+import random
+from fractions import Fraction
+
+import pytest
+import sympy as sp
+from sympy.polys.matrices import DomainMatrix
+
+import matrices
+
+
+def bareiss(rows):
+    return int(DomainMatrix([[sp.ZZ(v) for v in row] for row in rows], (len(rows), len(rows)), sp.ZZ)
+               .det())
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 20, 33])
+def test_det_modular_matches_bareiss(n):
+    rng = random.Random(n)
+    rows = [[rng.randint(-50, 50) for _ in range(n)] for _ in range(n)]
+    assert matrices.det_modular(rows) == bareiss(rows)
+
+
+def test_det_modular_handles_entries_beyond_int64():
+    rng = random.Random(1)
+    rows = [[rng.randint(-2**80, 2**80) for _ in range(6)] for _ in range(6)]
+    assert matrices.det_modular(rows) == bareiss(rows)
+
+
+def test_det_modular_of_singular_and_permuted_matrices():
+    rng = random.Random(2)
+    rows = [[rng.randint(-9, 9) for _ in range(8)] for _ in range(7)]
+    rows.append([a + b for a, b in zip(rows[0], rows[1])])
+    assert matrices.det_modular(rows) == 0
+    # Zeros on the diagonal force a row swap, which flips the sign
+    swap = [[0, 1, 0], [1, 0, 0], [0, 0, 1]]
+    assert matrices.det_modular(swap) == -1
+
+
+def test_modular_det_of_rational_matrices_matches_sympy():
+    rng = random.Random(3)
+    n = matrices.MODULAR_MIN_DIM + 2
+    rows = [[Fraction(rng.randint(-20, 20), rng.randint(1, 6)) for _ in range(n)] for _ in range(n)]
+    value, method = matrices.solve('det', rows, 'exact')
+    assert method == 'modular'
+    assert value == sp.Matrix(n, n, lambda i, j: sp.Rational(rows[i][j].numerator, rows[i][j].denominator)).det()
@@ -0,0 +1,150 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, fcntl
+
+cross_process = pytest.mark.skipif(fcntl is None, reason='needs flock')
+
+
+def test_concurrent_callers_share_one_computation():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('k', compute, lambda: None)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(flights.do('k', compute, lambda: None)))
+    follower.start()
+    while flights.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == [42, 42]
+    assert len(calls) == 1
+    assert flights.stats()['thread_waits'] == 1
+
+
+def test_thread_waiters_get_the_leaders_error():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(5)
+        raise ValueError('boom')
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('k', compute, lambda: None)
+        except ValueError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flights.stats()['waiting'] == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    follower.join()
+    assert errors == ['boom', 'boom']
+    assert flights.stats()['computed'] == 1
+
+
+def _hold_lock_while(first, key, compute, lookup=lambda: None):
+    """Run first.do(key, compute) on a thread and return once it holds the lock file"""
+    started = threading.Event()
+    outcome = []
+
+    def run():
+        def leading():
+            started.set()
+            return compute()
+        try:
+            outcome.append(first.do(key, leading, lookup))
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(5)
+    return thread, outcome
+
+
+@cross_process
+def test_process_waiters_get_a_failure_instead_of_recomputing(tmp_path):
+    # Two instances stand in for two processes: flocks on separate opens conflict
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError('timed out')
+
+    thread, outcome = _hold_lock_while(first, 'k', failing)
+    recomputed = []
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(ValueError, match='timed out'):
+        second.do('k', lambda: recomputed.append(1), lambda: None)
+    thread.join()
+    assert isinstance(outcome[0], ValueError)
+    assert recomputed == []
+    assert not (tmp_path / 'k.lock').exists()
+
+
+@cross_process
+def test_process_waiters_get_an_uncached_result(tmp_path):
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    release = threading.Event()
+
+    def unfinished():
+        release.wait(5)
+        return {'stage': 'partial'}
+
+    thread, _ = _hold_lock_while(first, 'k', unfinished)
+    threading.Timer(0.05, release.set).start()
+    assert second.do('k', lambda: {'stage': 'recomputed'}, lambda: None) == {'stage': 'partial'}
+    thread.join()
+    assert second.stats()['process_waits'] == 1
+
+
+@cross_process
+def test_process_waiters_read_a_cached_result(tmp_path):
+    first, second = SingleFlight(str(tmp_path)), SingleFlight(str(tmp_path))
+    release = threading.Event()
+    store = {}
+
+    def caching():
+        release.wait(5)
+        store['k'] = 'cached'
+        return 'cached'
+
+    thread, _ = _hold_lock_while(first, 'k', caching, lambda: store.get('k'))
+    threading.Timer(0.05, release.set).start()
+    assert second.do('k', lambda: 'recomputed', lambda: store.get('k')) == 'cached'
+    thread.join()
+    assert not (tmp_path / 'k.outcome').exists()
+
+
+@cross_process
+def test_expired_failures_are_computed_again(tmp_path):
+    flights = SingleFlight(str(tmp_path), outcome_ttl=0)
+    with pytest.raises(ValueError):
+        flights.do('k', lambda: (_ for _ in ()).throw(ValueError('boom')), lambda: None)
+    time.sleep(0.01)
+    assert flights.do('k', lambda: 'fresh', lambda: None) == 'fresh'
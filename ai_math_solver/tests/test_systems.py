@@ -0,0 +1,58 @@
+import sympy as sp
+
+import solver
+import systems
+
+x, y, z = sp.symbols('x y z')
+
+
+def solve(text, budget=None):
+    equations = systems.parse_equations(text)
+    return systems.solve(equations, systems.unknowns_for(equations), budget)
+
+
+def test_linear_system_has_one_solution():
+    solutions, stage = solve('x + y = 3; x - y = 1')
+    assert stage == 'linear'
+    assert solutions == [{x: 2, y: 1}]
+
+
+def test_inconsistent_linear_system_has_no_solution():
+    solutions, stage = solve('x + y = 1; x + y = 2')
+    assert stage == 'linear'
+    assert solutions == []
+    assert systems.format_solutions(solutions, [x, y]) == 'No solution'
+
+
+def test_underdetermined_linear_system_keeps_free_unknowns():
+    solutions, stage = solve('x + y + z = 1; x - y = 0')
+    assert stage == 'linear'
+    solution, = solutions
+    assert z not in solution
+    assert sp.simplify(solution[x] + solution[y] + z - 1) == 0
+    assert sp.simplify(solution[x] - solution[y]) == 0
+
+
+def test_inconsistent_polynomial_system_has_no_solution():
+    solutions, stage = solve('x**2 + y = 1; x**2 + y = 2')
+    assert (solutions, stage) == ([], 'groebner')
+
+
+def test_polynomial_system_solutions_satisfy_it():
+    equations = systems.parse_equations('x**2 + y**2 = 5; x*y = 2')
+    solutions, stage = systems.solve(equations, [x, y])
+    assert stage == 'groebner'
+    assert len(solutions) == 4
+    for solution in solutions:
+        assert all(sp.simplify(eq.subs(solution)) == 0 for eq in equations)
+
+
+def test_exhausted_budget_is_not_reported_as_no_solution():
+    solutions, stage = solve('x**2 + y**2 = 5; x*y = 2', budget=0)
+    assert (solutions, stage) == (None, 'budget_exhausted')
+    assert systems.format_solutions(solutions, [x, y]) == 'No solution found within the time budget'
+
+
+def test_unfinished_results_are_not_cached():
+    assert not solver.cacheable({'result': 'No solution found within the time budget', 'stage': 'budget_exhausted'})
+    assert solver.cacheable({'result': 'x = 1', 'stage': 'groebner'})
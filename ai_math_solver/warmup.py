@@ -0,0 +1,53 @@
+"""
+Warm-up corpus
+Run through every problem type before a process takes traffic, so SymPy's
+caches and lazily imported modules are loaded before the first real request
+"""
+
+import json
+import time
+
+import config
+
+# Mirrors the examples shown on the page
+DEFAULT_CORPUS = {
+    'simplify': ['(x**2 + 2*x + 1)/(x + 1)', 'sqrt(50) + sqrt(18)', 'sin(x)**2 + cos(x)**2'],
+    'solve': ['x**2 + 5*x + 6 = 0', '2*x + 3 = 7'],
+    'system': ['x + y = 3; x - y = 1', 'x**2 + y**2 = 25; x - y = 1'],
+    'matrix': ['[[1, 2], [3, 4]]', 'eigenvalues [[2, 1], [1, 2]]', 'inverse [[1.5, 2], [3, 4]]'],
+    'derivative': ['x**3 + 2*x**2 + x', 'sin(x)*cos(x)', 'exp(x**2)'],
+    'integrate': ['x**2', 'sin(x)', '1/(x**2 + 1)', 'exp(-x**2), -oo, oo'],
+    'factor': ['x**2 + 5*x + 6', 'x**3 - 8'],
+    'expand': ['(x + 2)**3', '(x + y)**2'],
+    'limit': ['sin(x)/x, x, 0', '1/x, x, oo'],
+    'plot': ['sin(x)'],
+    'statistics': ['2, 4, 4, 4, 5, 5, 7, 9', 'x,y\n1,2\n2,4\n3,7'],
+}
+
+
+def load_corpus():
+    """The corpus from MATH_SOLVER_WARMUP_FILE (JSON {problem_type: [expressions]}) or the default"""
+    if not config.WARMUP:
+        return {}
+    if config.WARMUP_FILE:
+        with open(config.WARMUP_FILE) as f:
+            return json.load(f)
+    return DEFAULT_CORPUS
+
+
+def run(corpus=None):
+    """Solve every corpus entry once, returning seconds spent per problem type"""
+    from solver import solve_problem
+
+    if corpus is None:
+        corpus = load_corpus()
+    timings = {}
+    for problem_type, expressions in corpus.items():
+        started = time.perf_counter()
+        for expression in expressions:
+            try:
+                solve_problem(problem_type, expression)
+            except Exception:
+                pass
+        timings[problem_type] = round(time.perf_counter() - started, 4)
+    return timings
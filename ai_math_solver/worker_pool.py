@@ -0,0 +1,344 @@
+"""
+Pool of pre-warmed worker processes for symbolic work
+Each task runs under a wall-clock timeout and an RSS cap; a worker that breaks
+either limit is killed and replaced so the request thread never hangs. Workers
+that served their quota of tasks or grew past a softer RSS threshold are
+retired between tasks, so recycling never loses work.
+"""
+
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import threading
+import time
+import types
+
+POLL_INTERVAL = 0.05
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+class WorkerError(Exception):
+    """Raised in the parent when a task could not produce a result"""
+
+    kind = 'error'
+
+    def payload(self):
+        return {'error': str(self), self.kind: True}
+
+
+class WorkerTimeout(WorkerError):
+    kind = 'timed_out'
+
+
+class WorkerMemoryExceeded(WorkerError):
+    kind = 'memory_exceeded'
+
+
+class WorkerCrashed(WorkerError):
+    kind = 'worker_crashed'
+
+
+class WorkerUnavailable(WorkerError):
+    kind = 'busy'
+
+
+class TaskError(Exception):
+    """An exception raised by the task that could not be carried back from the worker as itself"""
+
+
+def _portable(e):
+    """e if it survives pickling, so the parent can re-raise the same type, else a TaskError with its message"""
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        return TaskError(str(e))
+
+
+def process_rss(pid):
+    """Resident set size of a process in bytes, or None if it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def _worker_main(conn, initializer, maintenance):
+    # The first message is always the ready notice, sent once warm-up is done
+    started = time.perf_counter()
+    info = None
+    if initializer is not None:
+        try:
+            info = initializer()
+        except Exception as e:
+            info = {'error': str(e)}
+    conn.send(('ready', {'seconds': round(time.perf_counter() - started, 4), 'warmup': info}))
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            value = func(*args)
+            if isinstance(value, types.GeneratorType):
+                # Streamed tasks send each item as it is produced
+                for item in value:
+                    conn.send(('item', item))
+                value = None
+            reply = ('ok', value)
+        except Exception as e:
+            reply = ('error', _portable(e))
+        conn.send(reply)
+        # After replying, so housekeeping never delays the result
+        if maintenance is not None:
+            try:
+                maintenance()
+            except Exception:
+                pass
+
+
+class _Worker:
+
+    def __init__(self, ctx, initializer, maintenance, max_tasks):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, initializer, maintenance), daemon=True)
+        self.started = time.perf_counter()
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.max_tasks = max_tasks
+        self.ready = None
+        self.ready_rss = None
+
+    def wait_ready(self, timeout):
+        """Block until the worker finished warming up; returns its ready info"""
+        if self.ready is None:
+            if not self.conn.poll(timeout):
+                raise WorkerCrashed(f'Worker did not become ready within {timeout:g} seconds')
+            try:
+                status, info = self.conn.recv()
+            except EOFError:
+                raise WorkerCrashed('Worker process exited while starting')
+            info['startup_seconds'] = round(time.perf_counter() - self.started, 4)
+            # Baseline for tracking how much the worker grows while serving
+            info['rss'] = self.ready_rss = process_rss(self.pid)
+            self.ready = info
+        return self.ready
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Fixed number of worker processes handed out one task at a time"""
+
+    def __init__(self, size, start_method=None, preload=('solver',), initializer=None, ready_timeout=120,
+                 maintenance=None, max_tasks=0, max_tasks_jitter=0, recycle_rss=None, wait_timeout=None):
+        if not start_method:
+            methods = multiprocessing.get_all_start_methods()
+            start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+        self._ctx = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # Replacement workers fork from a server that already imported SymPy
+            self._ctx.set_forkserver_preload(list(preload))
+        self.size = size
+        self.initializer = initializer
+        self.ready_timeout = ready_timeout
+        self.maintenance = maintenance
+        self.max_tasks = max_tasks
+        self.max_tasks_jitter = max_tasks_jitter
+        self.recycle_rss = recycle_rss
+        self.wait_timeout = wait_timeout
+        self._idle = queue.Queue()
+        self._waiting = 0
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counters = {'tasks': 0, 'timeouts': 0, 'memory_kills': 0, 'crashes': 0, 'replaced': 0, 'recycled': 0}
+        # Workers warm up in parallel; the pool is returned once all are ready
+        started = time.perf_counter()
+        try:
+            workers = [self._spawn() for _ in range(size)]
+            self.startup = [worker.wait_ready(ready_timeout) for worker in workers]
+        except BaseException:
+            # No pool is returned to close them, so stop the workers already started
+            self._closed = True
+            with self._lock:
+                workers = list(self._workers)
+                self._workers.clear()
+            for worker in workers:
+                worker.stop(kill=True)
+            raise
+        self.startup_seconds = round(time.perf_counter() - started, 4)
+        for worker in workers:
+            self._idle.put(worker)
+
+    def _spawn(self):
+        max_tasks = self.max_tasks + random.randint(0, self.max_tasks_jitter) if self.max_tasks else 0
+        worker = _Worker(self._ctx, self.initializer, self.maintenance, max_tasks)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+            self.counters['replaced'] += 1
+        worker.stop(kill=True)
+        if not self._closed:
+            self._idle.put(self._spawn())
+
+    def _due_for_recycling(self, worker):
+        if worker.max_tasks and worker.tasks >= worker.max_tasks:
+            return True
+        if self.recycle_rss:
+            rss = process_rss(worker.pid)
+            return rss is not None and rss > self.recycle_rss
+        return False
+
+    def _recycle(self, worker):
+        """Retire an idle worker; its replacement joins the pool once warmed up"""
+        with self._lock:
+            self._workers.discard(worker)
+            self.counters['recycled'] += 1
+        threading.Thread(target=worker.stop, daemon=True).start()
+        if not self._closed:
+            threading.Thread(target=self._add_when_ready, args=(self._spawn(),), daemon=True).start()
+
+    def _add_when_ready(self, worker):
+        try:
+            worker.wait_ready(self.ready_timeout)
+        except WorkerError:
+            # run() will find it dead and replace it
+            pass
+        self._idle.put(worker)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _replies(self, func, args, timeout, rss_limit):
+        """
+        Send a task to a worker and yield its replies as (status, value), the
+        final one last. A worker left mid-task (a limit was broken, or the
+        consumer stopped early) is replaced.
+        """
+        with self._lock:
+            self._waiting += 1
+        try:
+            worker = self._idle.get(timeout=self.wait_timeout)
+        except queue.Empty:
+            raise WorkerUnavailable(f'No worker became free within {self.wait_timeout:g} seconds')
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        healthy = False
+        try:
+            # Replacements are handed out before they finish warming up
+            worker.wait_ready(self.ready_timeout)
+            worker.conn.send((func, args))
+            deadline = time.monotonic() + timeout
+            while True:
+                while not worker.conn.poll(POLL_INTERVAL):
+                    if not worker.process.is_alive():
+                        self._count('crashes')
+                        raise WorkerCrashed('Worker process exited while solving')
+                    if time.monotonic() > deadline:
+                        self._count('timeouts')
+                        raise WorkerTimeout(f'Timed out after {timeout:g} seconds')
+                    if rss_limit:
+                        rss = process_rss(worker.pid)
+                        if rss is not None and rss > rss_limit:
+                            self._count('memory_kills')
+                            raise WorkerMemoryExceeded(f'Exceeded memory limit of {rss_limit / 2**20:.0f} MB')
+                try:
+                    status, value = worker.conn.recv()
+                except EOFError:
+                    self._count('crashes')
+                    raise WorkerCrashed('Worker process exited while solving')
+                if status != 'item':
+                    break
+                yield status, value
+            healthy = True
+            worker.tasks += 1
+            self._count('tasks')
+        finally:
+            if not healthy:
+                self._replace(worker)
+            elif self._due_for_recycling(worker):
+                self._recycle(worker)
+            else:
+                self._idle.put(worker)
+        yield status, value
+
+    def run(self, func, args, timeout, rss_limit=None):
+        """Run func(*args) in a worker and return its result"""
+        for status, value in self._replies(func, args, timeout, rss_limit):
+            pass
+        if status == 'error':
+            raise value
+        return value
+
+    def stream(self, func, args, timeout, rss_limit=None):
+        """Run the generator function func(*args) in a worker, yielding its items as they arrive"""
+        for status, value in self._replies(func, args, timeout, rss_limit):
+            if status == 'error':
+                raise value
+            if status == 'item':
+                yield value
+
+    def waiting(self):
+        """Tasks waiting for an idle worker"""
+        return self._waiting
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            workers = list(self._workers)
+            stats['waiting'] = self._waiting
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['rss'] = {w.pid: process_rss(w.pid) for w in workers}
+        stats['rss_growth'] = {w.pid: stats['rss'][w.pid] - w.ready_rss
+                               for w in workers if stats['rss'][w.pid] is not None and w.ready_rss is not None}
+        stats['worker_tasks'] = {w.pid: w.tasks for w in workers}
+        return stats
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
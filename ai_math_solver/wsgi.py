@@ -0,0 +1,22 @@
+"""
+Production entry point
+    gunicorn -c gunicorn.conf.py          (preloads the app, forks, then warms workers)
+    waitress-serve --call wsgi:create_app (any server that calls a factory)
+"""
+
+import time
+
+
+def create_app(start_workers=True):
+    """
+    Import the app and, unless the server forks afterwards, start and warm the
+    solver workers before returning. With fork-after-preload the server must
+    call app.start_workers() in each forked process instead (see gunicorn.conf.py).
+    """
+    started = time.perf_counter()
+    import app as app_module
+
+    app_module.STARTUP['create_app_import_seconds'] = round(time.perf_counter() - started, 4)
+    if start_workers:
+        app_module.start_workers()
+    return app_module.app